@@ -45,8 +45,8 @@ node = flow.add_node(
 # 3. 建立连接
 source_node.connect(target_node, out_port=0, in_port=0)
 
-# 4. 导出 JSON
-json_output = flow.export_json()
+# 4. 返回画布（沙箱直接调用 generate_flow() 并取回 FlowBuilder，无需打印 JSON）
+return flow
 ```
 
 严格约束：
@@ -54,6 +54,7 @@ json_output = flow.export_json()
 2. ⚠️ 所有节点类型必须在允许列表中：{allowed_node_types}
 3. ⚠️ 代码必须可执行，导入语句完整
 4. ⚠️ 使用有意义的变量名
+5. ⚠️ 必须定义 generate_flow() 并返回 FlowBuilder，不要打印结果
 
 输出格式：
 ```python
@@ -72,12 +73,7 @@ def generate_flow():
     # 建立连接
     node1.connect(node2)
     
-    return flow.export_json()
-
-# 生成组态
-if __name__ == "__main__":
-    result = generate_flow()
-    print(result)
+    return flow
 ```
 
 请开始生成代码：
@@ -95,10 +91,10 @@ if __name__ == "__main__":
             Python 代码字符串
         """
         # TODO: 调用 LLM 生成代码
-        # allowed_types = list(NODE_TYPES.keys())
+        # allowed_types = get_registry().describe()  # 类型、中文名称与端口数
         # messages = self.coding_prompt.format_messages(
         #     execution_plan=str(plan),
-        #     allowed_node_types=str(allowed_types)
+        #     allowed_node_types=allowed_types
         # )
         # response = self.llm(messages)
         # code = self._extract_code_block(response.content)
@@ -111,51 +107,31 @@ def generate_flow():
     flow = FlowBuilder()
     
     # 步骤1：读取湿球温度
-    temp_sensor = flow.add_node(
-        "swInput", 
-        "湿球温度",
-        address="AI_WetBulb_Temp"
-    )
-    
-    # 步骤2：定义温度阈值
-    threshold_23 = flow.add_node("constant", "阈值_23C", value=23.0)
-    threshold_25 = flow.add_node("constant", "阈值_25C", value=25.0)
-    threshold_27 = flow.add_node("constant", "阈值_27C", value=27.0)
-    threshold_29 = flow.add_node("constant", "阈值_29C", value=29.0)
-    threshold_31 = flow.add_node("constant", "阈值_31C", value=31.0)
-    
-    # 步骤3：温度比较
-    compare_1 = flow.add_node("compare", "比较_23", operator=">")
-    compare_2 = flow.add_node("compare", "比较_25", operator=">")
-    compare_3 = flow.add_node("compare", "比较_27", operator=">")
-    compare_4 = flow.add_node("compare", "比较_29", operator=">")
-    compare_5 = flow.add_node("compare", "比较_31", operator=">")
-    
-    # 建立比较连接
-    temp_sensor.connect(compare_1, out_port=0, in_port=0)
-    threshold_23.connect(compare_1, out_port=0, in_port=1)
-    
-    temp_sensor.connect(compare_2, out_port=0, in_port=0)
-    threshold_25.connect(compare_2, out_port=0, in_port=1)
-    
-    # TODO: 完整连接其他比较节点
-    
-    # 步骤4：累加结果
-    accumulator = flow.add_node("accumulator", "开机台数")
-    compare_1.connect(accumulator)
-    compare_2.connect(accumulator)
-    # TODO: 连接其他比较结果
-    
-    # 步骤5：手自动切换
+    temp_sensor = flow.add_node("swInput", "湿球温度")
+    
+    # 步骤2：温度阈值与比较（湿球温度高于阈值时输出 1）
+    compares = []
+    for threshold in (23, 25, 27, 29, 31):
+        limit = flow.add_node("constInput", f"阈值_{threshold}C", fixedValue=threshold)
+        compare = flow.add_node("compare", f"比较_{threshold}", tripPoint=threshold)
+        temp_sensor.connect(compare, out_port=0, in_port=0)
+        limit.connect(compare, out_port=0, in_port=1)
+        compares.append(compare)
+    
+    # 步骤3：累加比较结果得到自动开机台数
+    total = flow.add_node("add", "开机台数")
+    for port, compare in enumerate(compares):
+        compare.connect(total, out_port=0, in_port=port)
+    
+    # 步骤4：手自动切换（0 号输入为选择信号，1 号为自动台数，2 号为手动台数）
+    mode = flow.add_node("swInput", "手自动模式")
+    manual = flow.add_node("swInput", "手动开机台数")
     switch = flow.add_node("switch", "手自动切换")
-    accumulator.connect(switch, out_port=0, in_port=0)
+    mode.connect(switch, out_port=0, in_port=0)
+    total.connect(switch, out_port=0, in_port=1)
+    manual.connect(switch, out_port=0, in_port=2)
     
-    return flow.export_json()
-
-if __name__ == "__main__":
-    import json
-    result = generate_flow()
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return flow
 '''
         return code
     
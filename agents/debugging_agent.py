@@ -90,10 +90,10 @@ class DebuggingAgent:
         fix = {
             "error_analysis": {
                 "type": "runtime",
-                "root_cause": "调用了不存在的节点类型 'constant'，应使用 'math' 节点",
+                "root_cause": "调用了组件库中不存在的节点类型 'constant' 与 'accumulator'",
                 "affected_lines": [15, 16, 17]
             },
-            "fix_strategy": "将 'constant' 节点替换为 'math' 节点，使用固定值模式",
+            "fix_strategy": "阈值改用 constInput 常量节点（fixedValue），比较结果用 add 节点累加，并补全全部连线",
             "revised_code": '''from kong_sdk import FlowBuilder
 
 def generate_flow():
@@ -101,52 +101,31 @@ def generate_flow():
     flow = FlowBuilder()
     
     # 步骤1：读取湿球温度
-    temp_sensor = flow.add_node(
-        "swInput", 
-        "湿球温度",
-        address="AI_WetBulb_Temp"
-    )
+    temp_sensor = flow.add_node("swInput", "湿球温度")
     
-    # 步骤2：定义温度阈值（修正：使用 math 节点）
-    threshold_23 = flow.add_node("math", "阈值_23C", operation="const", value=23.0)
-    threshold_25 = flow.add_node("math", "阈值_25C", operation="const", value=25.0)
-    threshold_27 = flow.add_node("math", "阈值_27C", operation="const", value=27.0)
-    threshold_29 = flow.add_node("math", "阈值_29C", operation="const", value=29.0)
-    threshold_31 = flow.add_node("math", "阈值_31C", operation="const", value=31.0)
+    # 步骤2：温度阈值与比较（修正：阈值使用 constInput 节点）
+    compares = []
+    for threshold in (23, 25, 27, 29, 31):
+        limit = flow.add_node("constInput", f"阈值_{threshold}C", fixedValue=threshold)
+        compare = flow.add_node("compare", f"比较_{threshold}", tripPoint=threshold)
+        temp_sensor.connect(compare, out_port=0, in_port=0)
+        limit.connect(compare, out_port=0, in_port=1)
+        compares.append(compare)
     
-    # 步骤3：温度比较
-    compare_1 = flow.add_node("compare", "比较_23", operator=">")
-    compare_2 = flow.add_node("compare", "比较_25", operator=">")
-    compare_3 = flow.add_node("compare", "比较_27", operator=">")
-    compare_4 = flow.add_node("compare", "比较_29", operator=">")
-    compare_5 = flow.add_node("compare", "比较_31", operator=">")
+    # 步骤3：累加比较结果（修正：使用 add 节点，每个比较结果接一个输入端口）
+    total = flow.add_node("add", "开机台数")
+    for port, compare in enumerate(compares):
+        compare.connect(total, out_port=0, in_port=port)
     
-    # 建立比较连接
-    temp_sensor.connect(compare_1, out_port=0, in_port=0)
-    threshold_23.connect(compare_1, out_port=0, in_port=1)
-    
-    temp_sensor.connect(compare_2, out_port=0, in_port=0)
-    threshold_25.connect(compare_2, out_port=0, in_port=1)
-    
-    temp_sensor.connect(compare_3, out_port=0, in_port=0)
-    threshold_27.connect(compare_3, out_port=0, in_port=1)
-    
-    # 步骤4：累加结果
-    accumulator = flow.add_node("accumulator", "开机台数")
-    compare_1.connect(accumulator)
-    compare_2.connect(accumulator)
-    compare_3.connect(accumulator)
-    
-    # 步骤5：手自动切换
+    # 步骤4：手自动切换（0 号输入为选择信号，1 号为自动台数，2 号为手动台数）
+    mode = flow.add_node("swInput", "手自动模式")
+    manual = flow.add_node("swInput", "手动开机台数")
     switch = flow.add_node("switch", "手自动切换")
-    accumulator.connect(switch, out_port=0, in_port=0)
+    mode.connect(switch, out_port=0, in_port=0)
+    total.connect(switch, out_port=0, in_port=1)
+    manual.connect(switch, out_port=0, in_port=2)
     
-    return flow.export_json()
-
-if __name__ == "__main__":
-    import json
-    result = generate_flow()
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return flow
 '''
         }
         
@@ -173,13 +152,18 @@ if __name__ == "__main__":
         # 执行调试
         fix = self.analyze_error(original_code, error_info, validation_result)
         
+        # 修复前的流程图，供下一轮比较差异（result 为 stdout 文本等非流程图时不记录）
+        flow_json = execution_result.get("result")
+        
         # 更新状态
         state["generated_code"] = fix["revised_code"]  # 替换为修正后的代码
+        state["candidate_codes"] = []  # 重试只执行修正后的代码，不再执行旧候选
         state["debug_history"] = state.get("debug_history", [])
         state["debug_history"].append({
             "iteration": len(state["debug_history"]) + 1,
             "error": error_info,
-            "fix_strategy": fix["fix_strategy"]
+            "fix_strategy": fix["fix_strategy"],
+            "flow_json": flow_json if isinstance(flow_json, (dict, list)) and flow_json else None
         })
         state["retry_count"] = state.get("retry_count", 0) + 1
         state["current_step"] = "debugging_completed"
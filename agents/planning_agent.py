@@ -97,7 +97,7 @@ steps:
                 {
                     "step": 2,
                     "description": "定义温度阈值（23°C, 25°C, 27°C, 29°C, 31°C）",
-                    "node_type": "constant",
+                    "node_type": "constInput",
                     "parameters": {
                         "values": [23, 25, 27, 29, 31]
                     },
@@ -2,91 +2,228 @@
 检索智能体 (Retrieval Agent)
 职责：基于用户需求，从向量数据库中提取相关的领域知识
 """
-from typing import Dict, List, Any
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
+import os
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Union
 import config
+from kong_sdk import FlowBuilder, get_registry
+from tools.knowledge_base import KnowledgeBaseBuilder, Manifest, open_store, embedder_name, MANIFEST_NAME
+from tools.vector_index import Hit, load_embedder
+from tools.text_index import TextIndex, rrf_fuse
+from tools.motif_index import MotifIndex, flow_features, plan_features, structure_digest
+from tools.retrieval_cache import RetrievalCache, cache_key, EMBEDDING, RESULT
+
+SIMILAR_CASES = 3  # 返回的相似工程数
+CANDIDATE_FACTOR = 4  # 融合前每路检索的候选数为返回数的倍数
+RETRIEVAL_CACHE_NAME = "retrieval_cache.sqlite3"
 
 
 class RetrievalAgent:
     """检索智能体"""
     
-    def __init__(self):
-        """初始化向量数据库和嵌入模型"""
-        # TODO: 实现向量数据库的初始化
-        # self.embeddings = OpenAIEmbeddings(
-        #     openai_api_key=config.OPENAI_API_KEY,
-        #     openai_api_base=config.OPENAI_BASE_URL
-        # )
-        # self.vector_store = Chroma(
-        #     persist_directory=config.CHROMA_PERSIST_DIR,
-        #     embedding_function=self.embeddings
-        # )
-        pass
-    
-    def retrieve(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+    def __init__(self, backend: str = config.VECTOR_BACKEND, persist_directory: Optional[str] = None,
+                 embedding_model: str = config.EMBEDDING_MODEL, cache: Union[RetrievalCache, bool] = True):
+        """
+        初始化向量数据库和嵌入模型（首次使用时创建，构建工作流时不连接外部服务）
+        
+        Args:
+            backend: 向量库类型，local（离线内存映射索引）或 chroma
+            persist_directory: 向量库目录，默认按类型取 config 中的目录
+            embedding_model: 向量化模型，见 tools.vector_index.load_embedder
+            cache: 查询向量与检索结果的两级缓存；True 表示在向量库目录下创建，False 表示不缓存
+        """
+        self.backend = backend
+        self.persist_directory = persist_directory or (
+            config.VECTOR_INDEX_DIR if backend == "local" else config.CHROMA_PERSIST_DIR)
+        self.embedding_model = embedding_model
+        self._embeddings = None
+        self._vector_store = None
+        self._text_index = None
+        self._motif_index = None
+        self._builder = None
+        self._cache = cache
+        self._manifest_state = None  # (清单修改时间, 知识库版本)
+    
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            self._embeddings = load_embedder(self.embedding_model)
+        return self._embeddings
+    
+    @property
+    def vector_store(self):
+        if self._vector_store is None:
+            self._vector_store = open_store(self.backend, self.persist_directory)
+        return self._vector_store
+    
+    @property
+    def cache(self) -> Optional[RetrievalCache]:
+        if self._cache is True:
+            self._cache = RetrievalCache(Path(self.persist_directory) / RETRIEVAL_CACHE_NAME,
+                                         ttl=config.RETRIEVAL_CACHE_TTL)
+        return self._cache or None
+    
+    @property
+    def kb_version(self) -> str:
+        """
+        知识库版本（清单中记录）：清单文件变化时重新读取，
+        其他进程重新构建知识库后丢弃已加载的向量库与索引
+        """
+        path = Path(self.persist_directory) / MANIFEST_NAME
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return ""
+        if self._manifest_state is None or self._manifest_state[0] != mtime:
+            version = Manifest(path).version
+            if self._manifest_state is not None and self._manifest_state[1] != version:
+                self._vector_store = self._text_index = self._motif_index = self._builder = None
+            self._manifest_state = (mtime, version)
+        return self._manifest_state[1]
+    
+    def embed_query(self, query: str):
+        """查询向量（经两级缓存，键为向量化模型标识与查询文本）"""
+        cache = self.cache
+        if cache is None:
+            return self.embeddings.embed_query(query)
+        key = cache_key(EMBEDDING, embedder_name(self.embeddings), query)
+        return cache.get_or_compute(EMBEDDING, key, lambda: self.embeddings.embed_query(query))
+    
+    @property
+    def text_index(self) -> Optional[TextIndex]:
+        """全文索引（随知识库构建生成；缺失时只做向量检索）"""
+        if self._text_index is None:
+            self._text_index = TextIndex.load(self.persist_directory)
+        return self._text_index
+    
+    @property
+    def motif_index(self) -> Optional[MotifIndex]:
+        """工程子图的结构索引（随知识库构建生成；缺失时相似工程只按文本检索）"""
+        if self._motif_index is None:
+            self._motif_index = MotifIndex.load(self.persist_directory)
+        return self._motif_index
+    
+    def search(self, query: str, top_k: int = 5, where: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """向量检索，where 为元数据等值过滤（如 {"kind": "component"}）"""
+        return self.vector_store.query(self.embed_query(query), top_k=top_k, where=where)
+    
+    def hybrid_search(self, query: str, top_k: int, kind: str) -> List[Hit]:
+        """
+        混合检索：向量检索与 BM25（中文二元 / 三元组）各取候选，按倒数排名融合
+        
+        向量检索擅长语义相近的描述，BM25 擅长组件名称、测点名称等字面匹配；
+        返回的 Hit 得分为融合得分。
+        """
+        candidates = max(top_k * CANDIDATE_FACTOR, 20)
+        vector_hits = self.search(query, candidates, where={"kind": kind})
+        index = self.text_index
+        if index is None:
+            return vector_hits[:top_k]
+        text_ranking = [doc_id for doc_id, _ in index.search(query, candidates, kind=kind)]
+        fused = rrf_fuse([[hit.id for hit in vector_hits], text_ranking], top_k)
+        
+        found = {hit.id: hit for hit in vector_hits}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in found]
+        found.update((hit.id, hit) for hit in self.vector_store.get(missing))
+        return [found[doc_id]._replace(score=score) for doc_id, score in fused if doc_id in found]
+    
+    def similar_cases(self, query: str, top_k: int = SIMILAR_CASES, plan: Optional[Dict[str, Any]] = None,
+                      flow: Optional[FlowBuilder] = None) -> List[Hit]:
+        """
+        相似工程：有草稿流程图或（部分）执行计划时，按 WL 子图哈希取结构最接近的工程，
+        与文本混合检索的结果按倒数排名融合；否则只做文本混合检索
+        """
+        text_hits = self.hybrid_search(query, max(top_k * CANDIDATE_FACTOR, 20), "project")
+        index = self.motif_index
+        if index is None or (plan is None and flow is None):
+            return text_hits[:top_k]
+        features = flow_features(flow) if flow is not None else plan_features(plan)
+        structure_ranking = [doc_id for doc_id, _ in index.search(features, max(top_k * CANDIDATE_FACTOR, 20))]
+        fused = rrf_fuse([structure_ranking, [hit.id for hit in text_hits]], top_k)
+        
+        found = {hit.id: hit for hit in text_hits}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in found]
+        found.update((hit.id, hit) for hit in self.vector_store.get(missing))
+        return [found[doc_id]._replace(score=score) for doc_id, score in fused if doc_id in found]
+    
+    @staticmethod
+    def _node_entry(hit: Hit) -> Dict[str, Any]:
+        """组件卡片 -> 提示词中的组件说明（参数以组件注册表为准）"""
+        node_type = hit.metadata.get("type")
+        spec = get_registry().get(node_type)
+        label = spec.label if spec else hit.metadata.get("label", node_type)
+        return {
+            "type": node_type,
+            "name": label,
+            "description": hit.text,
+            "parameters": list(spec.defaults) if spec else [],
+            "example": f"flow.add_node('{node_type}', '{label}')",
+            "score": round(hit.score, 4)
+        }
+    
+    def retrieve(self, query: str, top_k: int = 5, plan: Optional[Dict[str, Any]] = None,
+                 flow: Optional[FlowBuilder] = None) -> Dict[str, Any]:
         """
         检索相关知识
         
         Args:
             query: 用户查询/需求
             top_k: 返回的最相关文档数量
+            plan: 已有的（部分）执行计划，用于结构匹配相似工程
+            flow: 已有的草稿流程图，用于结构匹配相似工程（优先于 plan）
             
         Returns:
-            包含上下文信息的字典
+            包含上下文信息的字典（相同知识库版本下相同的查询直接取自缓存）
         """
-        # TODO: 实现向量检索
-        # docs = self.vector_store.similarity_search(query, k=top_k)
-        
-        # TODO: 从检索结果中提取：
-        # 1. 相关的节点类型定义（NODE_TYPES）
-        # 2. 类似的案例代码（Few-Shot Examples）
-        # 3. API 使用文档
+        cache = self.cache
+        if cache is None:
+            return self._retrieve(query, top_k, plan, flow)
+        structure = (structure_digest(flow_features(flow)) if flow is not None
+                     else structure_digest(plan_features(plan)) if plan is not None else None)
+        key = cache_key(RESULT, self.kb_version, self.backend, embedder_name(self.embeddings),
+                        query, top_k, structure)
+        return cache.get_or_compute(RESULT, key, lambda: self._retrieve(query, top_k, plan, flow))
+    
+    def _retrieve(self, query: str, top_k: int, plan: Optional[Dict[str, Any]],
+                  flow: Optional[FlowBuilder]) -> Dict[str, Any]:
+        node_hits = self.hybrid_search(query, top_k, "component")
+        case_hits = self.similar_cases(query, SIMILAR_CASES, plan=plan, flow=flow)
         
-        # 示例返回格式
         context = {
             "query": query,
-            "relevant_nodes": [
-                {
-                    "type": "swInput",
-                    "name": "模拟量输入",
-                    "description": "用于读取传感器数据",
-                    "parameters": ["address", "name"],
-                    "example": "flow.add_node('swInput', '湿球温度', address='AI_001')"
-                },
-                {
-                    "type": "compare",
-                    "name": "比较模块",
-                    "description": "用于数值比较",
-                    "parameters": ["operator", "threshold"],
-                    "example": "flow.add_node('compare', '温度比较', operator='>', threshold=25.0)"
-                }
-            ],
-            "similar_cases": [
-                # TODO: 从向量库检索到的相似案例
-                "# 案例：温度控制逻辑\nflow = FlowBuilder()\ntemp = flow.add_node('swInput', '温度')\n..."
-            ],
+            "relevant_nodes": [self._node_entry(hit) for hit in node_hits],
+            "similar_cases": [hit.text for hit in case_hits],
             "metadata": {
-                "retrieved_count": 5,
-                "confidence_score": 0.85
+                "retrieved_count": len(node_hits) + len(case_hits),
+                "fusion": "rrf" if self.text_index is not None else "vector",
+                "case_match": ("structure" if self.motif_index is not None and (plan or flow) is not None
+                               else "text")
             }
         }
         
         return context
     
-    def load_knowledge_base(self, json_files: List[str]):
+    def load_knowledge_base(self, json_files: List[str]) -> Dict[str, Any]:
         """
-        加载知识库
+        加载知识库（增量）：组件样本文件生成组件卡片，工程文件生成子图摘要，
+        按文件哈希清单只解析和向量化新增或变化的文件，并删除已移除文件的文档
         
         Args:
             json_files: JSON 组态文件路径列表
+            
+        Returns:
+            构建统计（变化文件数、向量化文档数、知识库版本等）
         """
-        # TODO: 实现知识库加载
-        # 1. 解析 JSON 文件
-        # 2. 提取节点定义和连接模式
-        # 3. 生成文本描述
-        # 4. 向量化并存储到 Chroma
-        pass
+        if self._builder is None:
+            self._builder = KnowledgeBaseBuilder(
+                self.vector_store, self.embeddings,
+                Path(self.persist_directory) / MANIFEST_NAME
+            )
+        stats = self._builder.ingest(json_files)
+        self._text_index = self._motif_index = None  # 全文索引与结构索引可能已重建
+        # 记录新版本，不把本进程的构建当作外部构建而丢弃已打开的向量库
+        self._manifest_state = (os.stat(self._builder.manifest.path).st_mtime_ns, stats["version"])
+        return stats
     
     def __call__(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -100,8 +237,10 @@ class RetrievalAgent:
         """
         user_query = state.get("user_query", "")
         
-        # 执行检索
-        context = self.retrieve(user_query)
+        # 执行检索（重新检索时用已有的计划或草稿流程图匹配结构相似的工程）
+        execution_result = state.get("execution_result") or {}
+        context = self.retrieve(user_query, plan=state.get("execution_plan") or None,
+                                flow=execution_result.get("flow"))
         
         # 更新状态
         state["retrieval_context"] = context
@@ -2,11 +2,19 @@
 验证智能体 (Validation Agent)
 职责：双重质检 - 形式化验证 + 语义验证
 """
-from typing import Dict, List, Any, Tuple
+import copy
+from collections import OrderedDict
+from typing import Dict, List, Any, Tuple, Optional
 from langchain.chat_models import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 import json
 import config
+from kong_sdk import FlowBuilder
+from tools.flow_diff import diff_flows
+from tools.flow_validator import FlowValidator, ValidationReport
+from tools.semantic_precheck import run_precheck, verdict_key
+
+VERDICT_CACHE_SIZE = 256  # 语义结论缓存条数
 
 
 class ValidationAgent:
@@ -23,6 +31,8 @@ class ValidationAgent:
         # )
         
         self.semantic_prompt = self._create_semantic_prompt()
+        self.validator = FlowValidator()  # 单遍形式化验证引擎
+        self._verdicts: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()  # (需求哈希, 流程图哈希) -> 语义结论
     
     def _create_semantic_prompt(self) -> ChatPromptTemplate:
         """创建语义验证提示词"""
@@ -66,64 +76,22 @@ class ValidationAgent:
             json_data: 生成的 JSON 组态
             
         Returns:
-            (是否通过, 错误列表)
+            (是否通过, 错误列表)；悬空节点等警告不影响是否通过，见 formal_report()
         """
-        errors = []
-        
-        # 1. 检查 JSON 结构完整性
-        if "nodes" not in json_data:
-            errors.append("缺少 'nodes' 字段")
-        if "wires" not in json_data:
-            errors.append("缺少 'wires' 字段")
-        
-        if errors:
-            return False, errors
-        
-        nodes = json_data.get("nodes", [])
-        wires = json_data.get("wires", [])
-        
-        # 2. 检查节点完整性
-        node_ids = set()
-        for node in nodes:
-            if "id" not in node:
-                errors.append(f"节点缺少 ID: {node}")
-            else:
-                node_ids.add(node["id"])
-            
-            if "type" not in node:
-                errors.append(f"节点 {node.get('id')} 缺少 type 字段")
-            
-            # TODO: 检查节点类型是否在允许列表中
-            # TODO: 检查必需参数是否存在
+        report = self.formal_report(json_data)
+        return report.passed, report.errors()
+    
+    def formal_report(self, json_data: Dict[str, Any]) -> ValidationReport:
+        """
+        形式化验证的完整诊断：组件类型与参数、连线端点与端口、循环依赖、悬空节点
         
-        # 3. 检查连线有效性
-        for wire in wires:
-            source_id = wire.get("source")
-            target_id = wire.get("target")
-            
-            if source_id not in node_ids:
-                errors.append(f"连线引用了不存在的源节点: {source_id}")
-            
-            if target_id not in node_ids:
-                errors.append(f"连线引用了不存在的目标节点: {target_id}")
+        Args:
+            json_data: 生成的 JSON 组态
             
-            # TODO: 检查端口索引是否有效
-        
-        # 4. 检查悬空节点（既无输入也无输出）
-        connected_nodes = set()
-        for wire in wires:
-            connected_nodes.add(wire.get("source"))
-            connected_nodes.add(wire.get("target"))
-        
-        dangling_nodes = node_ids - connected_nodes
-        if dangling_nodes and len(nodes) > 1:  # 单节点例外
-            # 警告而非错误
-            errors.append(f"发现悬空节点（可能合理）: {dangling_nodes}")
-        
-        # 5. 检查循环依赖
-        # TODO: 实现拓扑排序检测环路
-        
-        return len(errors) == 0, errors
+        Returns:
+            ValidationReport（诊断带错误码与严重级别）
+        """
+        return self.validator.validate(json_data)
     
     def semantic_validation(self, user_query: str, json_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -166,31 +134,74 @@ class ValidationAgent:
         
         return report
     
-    def validate(self, user_query: str, json_data: Dict[str, Any]) -> Dict[str, Any]:
+    def semantic_stage(self, user_query: str, json_data: Dict[str, Any],
+                       plan: Optional[Dict[str, Any]] = None,
+                       flow: Optional[FlowBuilder] = None) -> Dict[str, Any]:
+        """
+        语义验证阶段：先用仿真预检检验由需求与计划推导的性质，未通过时直接给出结论、
+        不调用 LLM；结论按 (需求哈希, 流程图内容哈希) 缓存，调试轮次中未变化的流程图不再重复检验
+        
+        Args:
+            user_query: 用户需求
+            json_data: 生成的 JSON
+            plan: 执行计划
+            flow: 沙箱返回的 FlowBuilder，缺省时由 json_data 重建
+            
+        Returns:
+            验证报告（附 "precheck" 预检结论）
+        """
+        if flow is None:
+            flow = FlowBuilder.load_json(json_data)
+        key = verdict_key(user_query, plan, flow)
+        cached = self._verdicts.get(key)
+        if cached is not None:
+            self._verdicts.move_to_end(key)
+            return copy.deepcopy(cached)
+        
+        precheck = run_precheck(user_query, plan, flow)
+        if not precheck.passed:
+            report = {"passed": False, "issues": precheck.issues(), "overall_score": 0}
+        else:
+            report = self.semantic_validation(user_query, json_data)
+        report["precheck"] = precheck.to_dict()
+        
+        self._verdicts[key] = copy.deepcopy(report)
+        if len(self._verdicts) > VERDICT_CACHE_SIZE:
+            self._verdicts.popitem(last=False)
+        return report
+    
+    def validate(self, user_query: str, json_data: Dict[str, Any],
+                 plan: Optional[Dict[str, Any]] = None,
+                 flow: Optional[FlowBuilder] = None) -> Dict[str, Any]:
         """
         完整验证流程
         
         Args:
             user_query: 用户需求
             json_data: 生成的 JSON
+            plan: 执行计划（用于推导语义预检的性质）
+            flow: 沙箱返回的 FlowBuilder（可选）
             
         Returns:
             综合验证结果
         """
         # 1. 形式化验证
-        formal_passed, formal_errors = self.formal_validation(json_data)
+        formal_report = self.formal_report(json_data)
+        formal_passed = formal_report.passed
         
         # 2. 语义验证（仅在形式化通过时执行）
         semantic_report = {}
         if formal_passed:
-            semantic_report = self.semantic_validation(user_query, json_data)
+            semantic_report = self.semantic_stage(user_query, json_data, plan, flow)
         
         # 综合结果
         result = {
             "passed": formal_passed and semantic_report.get("passed", False),
             "formal_validation": {
                 "passed": formal_passed,
-                "errors": formal_errors
+                "errors": formal_report.errors(),
+                "warnings": formal_report.warnings(),
+                "diagnostics": [d.to_dict() for d in formal_report.diagnostics]
             },
             "semantic_validation": semantic_report,
             "timestamp": "2024-01-01T00:00:00Z"  # TODO: 添加真实时间戳
@@ -215,7 +226,18 @@ class ValidationAgent:
         json_data = execution_result.get("result", {})
         
         # 执行验证
-        validation_result = self.validate(user_query, json_data)
+        validation_result = self.validate(user_query, json_data, state.get("execution_plan"),
+                                          execution_result.get("flow"))
+        
+        # 调试轮次：附上与修复前流程图的结构差异，便于评审只看变化部分
+        debug_history = state.get("debug_history", [])
+        previous_flow = debug_history[-1].get("flow_json") if debug_history else None
+        # 只比较导出的流程图（字典 / 原生元素列表）；result 也可能是 stdout 文本，diff_flows 会把字符串当作文件路径
+        if isinstance(previous_flow, (dict, list)) and isinstance(json_data, (dict, list)) and json_data:
+            try:
+                validation_result["flow_diff"] = diff_flows(previous_flow, json_data).describe(previous_flow)
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                validation_result["flow_diff"] = [f"无法比较流程图差异: {e}"]
         
         # 更新状态
         state["validation_result"] = validation_result
@@ -11,6 +11,10 @@ MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4")
 
 # 向量数据库配置
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "local")  # local（离线内存映射索引）/ chroma
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./vector_index")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "hashing")  # hashing / openai / sentence-transformers:<模型>
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "86400"))  # 检索缓存有效期（秒），0 表示不过期
 
 # 调试配置
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
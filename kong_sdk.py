@@ -2,29 +2,145 @@
 Kong CUBE SDK - 组态代码生成器
 用于将 Python 代码转换为 KONG CUBE JSON 组态文件
 """
+import os
+import sys
+import json
+import pickle
+import hashlib
 import uuid
-from typing import Dict, List, Any, Optional
+import time
+import random
+import itertools
+import textwrap
+from array import array
+from pathlib import Path
+from types import MappingProxyType
+from typing import (Dict, List, Any, Optional, Tuple, Iterator, Iterable, Mapping,
+                    TextIO, IO, Union, NamedTuple, FrozenSet)
+
+
+class CycleError(ValueError):
+    """连线会在流程图中形成循环依赖"""
+
+
+def _coordinate(value: float) -> Any:
+    """坐标以浮点数存储，整数值还原为 int 以保持导出格式"""
+    return int(value) if value.is_integer() else value
 
 
 class KongNode:
-    """代表一个功能块节点"""
+    """
+    代表一个功能块节点
+    
+    节点数据实际存放在所属 FlowBuilder 的列式存储中，
+    KongNode 只是 (画布, 编号) 的轻量视图，因此不占用 __dict__。
+    """
+    
+    __slots__ = ("_flow", "_index")
     
     def __init__(self, node_type: str, name: str, **params):
         """
-        初始化节点
+        初始化节点（独立节点会放入一个只包含自身的画布，与其他画布的节点连接
+        或经 FlowBuilder.add() 加入画布时并入对方画布）
         
         Args:
             node_type: 节点类型，如 'swInput', 'compare', 'switch' 等
             name: 节点名称
             **params: 节点参数
         """
-        self.id = str(uuid.uuid4())
-        self.type = node_type
-        self.name = name
-        self.params = params
-        self.wires: List[Dict] = []  # 连线数组
-        self.x = 0  # 坐标将由自动布局算法计算
-        self.y = 0
+        flow = FlowBuilder()
+        flow._standalone = True
+        self._flow = flow
+        self._index = flow._append_node(node_type, name, params)
+        flow.nodes.append(self)
+    
+    @classmethod
+    def _view(cls, flow: 'FlowBuilder', index: int) -> 'KongNode':
+        """创建指向画布中第 index 个节点的视图"""
+        node = cls.__new__(cls)
+        node._flow = flow
+        node._index = index
+        return node
+    
+    def __eq__(self, other: object) -> bool:
+        return (isinstance(other, KongNode)
+                and self._flow is other._flow and self._index == other._index)
+    
+    def __hash__(self) -> int:
+        return hash((id(self._flow), self._index))
+    
+    def __repr__(self) -> str:
+        return f"KongNode({self.type!r}, {self.name!r}, id={self.id!r})"
+    
+    @property
+    def id(self) -> str:
+        return self._flow._ids[self._index]
+    
+    @property
+    def type(self) -> str:
+        flow = self._flow
+        return flow._type_names[flow._types[self._index]]
+    
+    @type.setter
+    def type(self, value: str):
+        self._flow._types[self._index] = self._flow._intern_type(value)
+    
+    @property
+    def name(self) -> str:
+        return self._flow._names[self._index]
+    
+    @name.setter
+    def name(self, value: str):
+        self._flow._names[self._index] = sys.intern(value)
+    
+    @property
+    def params(self) -> Mapping[str, Any]:
+        """节点参数；紧凑模式下参数在节点间共享，返回只读映射"""
+        flow = self._flow
+        params = flow._params[self._index]
+        if flow.compact:
+            return MappingProxyType(params or {})
+        if params is None:
+            # 无参数节点不单独分配字典，首次访问时再创建
+            params = flow._params[self._index] = {}
+        return params
+    
+    def update_params(self, **params):
+        """更新节点参数（两种存储模式通用）"""
+        flow = self._flow
+        merged = dict(flow._params[self._index] or {})
+        merged.update(params)
+        flow._params[self._index] = flow._share_params(merged)
+    
+    @property
+    def container_id(self) -> Optional[str]:
+        """所属 tab / subflow 容器的 ID（原生格式的 z 字段），未指定时为 None"""
+        container = self._flow._z[self._index]
+        return None if container < 0 else self._flow._containers[container]["id"]
+    
+    @property
+    def x(self) -> float:
+        return _coordinate(self._flow._xs[self._index])
+    
+    @x.setter
+    def x(self, value: float):
+        self._flow._xs[self._index] = value
+    
+    @property
+    def y(self) -> float:
+        return _coordinate(self._flow._ys[self._index])
+    
+    @y.setter
+    def y(self, value: float):
+        self._flow._ys[self._index] = value
+    
+    @property
+    def wires(self) -> List[Dict[str, Any]]:
+        """从画布连线表生成的出线数组（按连接顺序）"""
+        flow = self._flow
+        wires = [flow._wire_dict(wire) for wire in flow._out_wires(self._index)]
+        wires.reverse()
+        return wires
     
     def connect(self, target_node: 'KongNode', out_port: int = 0, in_port: int = 0):
         """
@@ -34,20 +150,45 @@ class KongNode:
             target_node: 目标节点
             out_port: 输出端口索引
             in_port: 输入端口索引
+
+        Raises:
+            ValueError: 端口索引为负数或超出组件定义，两个节点分属不同画布且都不是独立节点，
+                或两个节点分属不同的 tab / subflow 容器（subflow 端口节点除外）
+            CycleError: 该连线会形成循环依赖
         """
-        # TODO: 添加端口有效性检查
-        # TODO: 检查是否存在循环依赖
+        if out_port < 0 or in_port < 0:
+            raise ValueError(f"端口索引不能为负数: out_port={out_port}, in_port={in_port}")
+        if self._flow is not target_node._flow:
+            # 兼容 KongNode(...).connect(KongNode(...))：独立节点并入对方画布及其所在容器
+            if target_node._is_standalone():
+                self._flow.add(target_node)
+                self._flow._z[target_node._index] = self._flow._z[self._index]
+            elif self._is_standalone():
+                target_node._flow.add(self)
+                self._flow._z[self._index] = self._flow._z[target_node._index]
+            else:
+                raise ValueError(f"节点 {self.name} 与 {target_node.name} 不在同一画布中")
         
-        wire = {
-            "source": self.id,
-            "sourcePort": out_port,
-            "target": target_node.id,
-            "targetPort": in_port
-        }
-        self.wires.append(wire)
+        flow = self._flow
+        if flow._z[self._index] != flow._z[target_node._index] \
+                and not (flow._is_port_node(self._index) or flow._is_port_node(target_node._index)):
+            raise ValueError(f"节点 {self.name} 与 {target_node.name} 不在同一 tab / subflow 中")
+        error = (flow._check_ports(self._index, out_port=out_port)
+                 or flow._check_ports(target_node._index, in_port=in_port))
+        if error:
+            raise ValueError(error)
+        
+        # 由画布维护邻接索引并检测环路
+        self._flow._add_wire(self._index, target_node._index, out_port, in_port)
+    
+    def _is_standalone(self) -> bool:
+        """是否为直接构造、尚未连线或并入其他画布的独立节点"""
+        flow = self._flow
+        return getattr(flow, "_standalone", False) and len(flow._ids) == 1 and not flow._wire_source
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
+        params = self._flow._params[self._index] or {}
         return {
             "id": self.id,
             "type": self.type,
@@ -55,15 +196,319 @@ class KongNode:
             "x": self.x,
             "y": self.y,
             "wires": self.wires,
-            **self.params
+            **params
         }
 
 
+class _LazyNodeList:
+    """紧凑模式下的节点序列：按需创建 KongNode 视图，不常驻内存"""
+    
+    __slots__ = ("_flow",)
+    
+    def __init__(self, flow: 'FlowBuilder'):
+        self._flow = flow
+    
+    def __len__(self) -> int:
+        return len(self._flow._ids)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [KongNode._view(self._flow, i) for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("节点编号越界")
+        return KongNode._view(self._flow, index)
+    
+    def __iter__(self) -> Iterator[KongNode]:
+        flow = self._flow
+        for index in range(len(flow._ids)):
+            yield KongNode._view(flow, index)
+    
+    def append(self, node: KongNode):
+        """视图按需生成，无需缓存"""
+
+
+class SubflowDefinition:
+    """
+    subflow 定义（所属画布中一个 subflow 容器的视图）
+    
+    定义内的节点只保存一份；每个实例只是画布上一个 subflow:<ID> 类型的节点，
+    通过自身连线绑定 in/out 端口。
+    """
+    
+    __slots__ = ("_flow", "_container")
+    
+    def __init__(self, flow: 'FlowBuilder', container: int):
+        self._flow = flow
+        self._container = container
+    
+    def __repr__(self) -> str:
+        return f"SubflowDefinition(id={self.id!r}, name={self.name!r})"
+    
+    @property
+    def id(self) -> str:
+        return self._flow._containers[self._container]["id"]
+    
+    @property
+    def name(self) -> str:
+        return self._flow._containers[self._container].get("name", "")
+    
+    @property
+    def instance_type(self) -> str:
+        """实例节点的类型，如 subflow:35d47c4"""
+        return SUBFLOW_INSTANCE_PREFIX + self.id
+    
+    def add_node(self, node_type: str, name: str, **params) -> KongNode:
+        """在 subflow 内部添加节点"""
+        flow = self._flow
+        node = KongNode._view(flow, flow._append_node(node_type, name, params, container=self._container))
+        flow.nodes.append(node)
+        return node
+    
+    def input(self, port: Union[int, str]) -> KongNode:
+        """输入端口节点（按序号或名称），用 connect() 连到内部节点"""
+        return self._port(SUBFLOW_IN, port)
+    
+    def output(self, port: Union[int, str]) -> KongNode:
+        """输出端口节点（按序号或名称），由内部节点 connect() 到它"""
+        return self._port(SUBFLOW_OUT, port)
+    
+    def _port(self, port_type: str, port: Union[int, str]) -> KongNode:
+        flow = self._flow
+        code = flow._type_codes.get(port_type)
+        for index in range(len(flow._ids)):
+            if flow._types[index] == code and flow._z[index] == self._container and (
+                    flow._params[index]["port"] == port or flow._names[index] == port):
+                return KongNode._view(flow, index)
+        raise KeyError(f"subflow {self.name} 没有端口: {port}")
+
+
+class HierarchicalLayout:
+    """
+    层次化（Sugiyama 风格）自动布局引擎
+
+    1. 拓扑排序 + 最长路径分层：每个节点位于其所有上游节点的右侧
+    2. 重心法交叉最小化：上下交替扫描，次数有上限
+    3. 坐标分配：层号决定 x，层内次序决定 y，各层垂直居中
+
+    整体复杂度为 O(V + E)（层内排序除外），可直接处理数万节点的画布。
+    """
+
+    def __init__(self, x_origin: int = 200, y_origin: int = 100,
+                 layer_spacing: int = 200, node_spacing: int = 80,
+                 max_sweeps: int = 4):
+        """
+        初始化布局参数
+
+        Args:
+            x_origin: 第一层的 x 坐标
+            y_origin: 最宽层第一个节点的 y 坐标
+            layer_spacing: 相邻层之间的水平间距
+            node_spacing: 同层相邻节点的垂直间距
+            max_sweeps: 重心法扫描次数上限
+        """
+        self.x_origin = x_origin
+        self.y_origin = y_origin
+        self.layer_spacing = layer_spacing
+        self.node_spacing = node_spacing
+        self.max_sweeps = max_sweeps
+
+    def compute(self, node_count: int, edges: List[Tuple[int, int]],
+                order: Optional[List[int]] = None) -> Tuple[List[int], List[int]]:
+        """
+        计算布局坐标
+
+        Args:
+            node_count: 节点数量，节点以 0..node_count-1 编号
+            edges: 连线列表 (源节点编号, 目标节点编号)
+            order: 已知的拓扑序（如 FlowBuilder 增量维护的顺序），为空时重新排序
+
+        Returns:
+            (x 坐标列表, y 坐标列表)，按节点编号排列
+        """
+        succ: List[List[int]] = [[] for _ in range(node_count)]
+        pred: List[List[int]] = [[] for _ in range(node_count)]
+        for source, target in edges:
+            if source != target:
+                succ[source].append(target)
+                pred[target].append(source)
+
+        if order is None:
+            order = self._topological_order(node_count, succ, pred)
+        layers = self._assign_layers(node_count, order, pred)
+        buckets = self._minimize_crossings(order, layers, succ, pred)
+        return self._assign_coordinates(node_count, buckets)
+
+    @staticmethod
+    def _topological_order(node_count: int, succ: List[List[int]],
+                           pred: List[List[int]]) -> List[int]:
+        """Kahn 拓扑排序；环路中的节点按编号顺序追加在末尾"""
+        indegree = [len(p) for p in pred]
+        order = [v for v in range(node_count) if indegree[v] == 0]
+        head = 0
+        while head < len(order):
+            v = order[head]
+            head += 1
+            for w in succ[v]:
+                indegree[w] -= 1
+                if indegree[w] == 0:
+                    order.append(w)
+
+        if len(order) < node_count:
+            # 存在环路：剩余节点保持原始顺序，布局仍然可用
+            order.extend(v for v in range(node_count) if indegree[v] > 0)
+        return order
+
+    @staticmethod
+    def _assign_layers(node_count: int, order: List[int],
+                       pred: List[List[int]]) -> List[int]:
+        """最长路径分层：层号 = 所有已分层上游节点的最大层号 + 1"""
+        layers = [-1] * node_count
+        for v in order:
+            layer = 0
+            for u in pred[v]:
+                if layers[u] >= layer:
+                    layer = layers[u] + 1
+            layers[v] = layer
+        return layers
+
+    def _minimize_crossings(self, order: List[int], layers: List[int],
+                            succ: List[List[int]], pred: List[List[int]]) -> List[List[int]]:
+        """重心法交叉最小化，返回每层按次序排列的节点列表"""
+        buckets: List[List[int]] = [[] for _ in range(max(layers, default=-1) + 1)]
+        for v in order:
+            buckets[layers[v]].append(v)
+
+        # 层内居中后的相对位置，使不同宽度的层之间的重心可比
+        pos = [0.0] * len(layers)
+        for bucket in buckets:
+            self._update_positions(bucket, pos)
+
+        for sweep in range(self.max_sweeps):
+            downward = sweep % 2 == 0
+            neighbours = pred if downward else succ
+            sequence = buckets if downward else reversed(buckets)
+            changed = False
+            for bucket in sequence:
+                if len(bucket) < 2:
+                    continue
+                keys = {}
+                for v in bucket:
+                    adjacent = neighbours[v]
+                    if adjacent:
+                        keys[v] = sum(pos[u] for u in adjacent) / len(adjacent)
+                    else:
+                        keys[v] = pos[v]
+                reordered = sorted(bucket, key=keys.__getitem__)
+                if reordered != bucket:
+                    bucket[:] = reordered
+                    self._update_positions(bucket, pos)
+                    changed = True
+            if not changed and sweep > 0:
+                break
+
+        return buckets
+
+    @staticmethod
+    def _update_positions(bucket: List[int], pos: List[float]):
+        """按层内次序刷新居中位置"""
+        center = (len(bucket) - 1) / 2
+        for rank, v in enumerate(bucket):
+            pos[v] = rank - center
+
+    def _assign_coordinates(self, node_count: int,
+                            buckets: List[List[int]]) -> Tuple[List[int], List[int]]:
+        """层号映射为 x，层内次序映射为 y，较窄的层垂直居中"""
+        xs = [0] * node_count
+        ys = [0] * node_count
+        widest = max((len(bucket) for bucket in buckets), default=0)
+        for layer, bucket in enumerate(buckets):
+            x = self.x_origin + layer * self.layer_spacing
+            top = self.y_origin + (widest - len(bucket)) * self.node_spacing // 2
+            for rank, v in enumerate(bucket):
+                xs[v] = x
+                ys[v] = top + rank * self.node_spacing
+        return xs, ys
+
+
 class FlowBuilder:
-    """画布管理器"""
+    """
+    画布管理器
+    
+    节点与连线采用列式存储（类型/名称驻留、坐标与连线为定长整数数组），
+    十万级节点的整栋楼组态也能控制在较低内存占用。
+    """
     
-    def __init__(self):
-        self.nodes: List[KongNode] = []
+    # 未显式指定时是否使用确定性 ID（执行沙箱可在运行生成代码前统一打开）
+    default_deterministic_ids = False
+    
+    def __init__(self, compact: bool = False, deterministic_ids: Optional[bool] = None):
+        """
+        初始化画布
+        
+        Args:
+            compact: 紧凑模式。开启后不缓存 KongNode 视图对象、
+                     ID 索引按需构建、相同参数的节点共享同一参数字典，
+                     适合一次性生成超大规模组态
+            deterministic_ids: 确定性 ID 模式。节点 ID 由类型、名称、参数和创建路径的
+                               哈希生成（7 位十六进制，与样本文件风格一致），
+                               相同代码多次运行得到完全相同的组态
+        """
+        self.compact = compact
+        self.deterministic_ids = (self.default_deterministic_ids
+                                  if deterministic_ids is None else deterministic_ids)
+        self._id_occurrences: Dict[str, int] = {}  # 确定性 ID：相同内容键已出现的次数
+        self._standalone = False  # 由 KongNode(...) 为独立节点创建的画布
+        self.nodes = _LazyNodeList(self) if compact else []
+        
+        # 节点列
+        self._ids: List[str] = []
+        self._types = array('H')  # 类型编码，对应 _type_names
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        self._names: List[str] = []  # 驻留字符串，同名节点共享同一对象
+        self._params: List[Optional[Dict[str, Any]]] = []  # 无参数节点为 None
+        self._shared_params: Dict[tuple, Dict[str, Any]] = {}  # 紧凑模式的参数驻留表
+        self._xs = array('d')  # 原生组态中的坐标可能是小数
+        self._ys = array('d')
+        self._index_by_id: Optional[Dict[str, int]] = None if compact else {}
+        self._z = array('i')  # 所属容器编号，-1 表示未指定（导出时归入默认 tab）
+        
+        # 容器（tab / subflow）原始字段，节点通过 _z 引用
+        self._containers: List[Dict[str, Any]] = []
+        self._container_index: Dict[str, int] = {}
+        self._port_counts: Dict[int, List[int]] = {}  # subflow 容器编号 -> [输入端口数, 输出端口数]
+        
+        # 连线表（按连线编号存储）
+        self._wire_source = array('i')
+        self._wire_source_port = array('H')
+        self._wire_target = array('i')
+        self._wire_target_port = array('H')
+        
+        # 正向 / 反向邻接索引（链式前向星：每个节点记录第一条连线，每条连线记录下一条）
+        self._out_head = array('i')
+        self._out_next = array('i')
+        self._in_head = array('i')
+        self._in_next = array('i')
+        
+        # 增量拓扑序（Pearce-Kelly）：_order[i] 为节点 i 在拓扑序中的位置
+        self._order = array('i')
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        """序列化时只保留列式数据，节点视图与 ID 索引在反序列化时重建"""
+        state = self.__dict__.copy()
+        state["nodes"] = None
+        state["_index_by_id"] = None
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        if self.compact:
+            self.nodes = _LazyNodeList(self)
+        else:
+            self._index_by_id = {node_id: i for i, node_id in enumerate(self._ids)}
+            self.nodes = [KongNode._view(self, i) for i in range(len(self._ids))]
     
     def add_node(self, node_type: str, name: str, **params) -> KongNode:
         """
@@ -77,23 +522,383 @@ class FlowBuilder:
         Returns:
             创建的节点对象
         """
-        node = KongNode(node_type, name, **params)
+        node = KongNode._view(self, self._append_node(node_type, name, params))
+        self.nodes.append(node)
+        return node
+    
+    def add(self, node: KongNode) -> KongNode:
+        """
+        把直接构造的独立节点（KongNode(...)）并入画布，保留其 ID（与已有 ID 冲突时重新生成）
+
+        Raises:
+            ValueError: 节点已属于其他画布且不是独立节点
+        """
+        if node._flow is self:
+            return node
+        if not node._is_standalone():
+            raise ValueError(f"节点 {node.name} 已属于其他画布")
+        source, old = node._flow, node._index
+        if self._index_by_id is None:
+            self._index_by_id = {node_id: i for i, node_id in enumerate(self._ids)}
+        node_id = source._ids[old] if source._ids[old] not in self._index_by_id else None
+        index = self._append_node(source._type_names[source._types[old]], source._names[old],
+                                  dict(source._params[old] or {}), node_id=node_id)
+        self._xs[index] = source._xs[old]
+        self._ys[index] = source._ys[old]
+        node._flow, node._index = self, index
         self.nodes.append(node)
         return node
     
+    def _append_node(self, node_type: str, name: str, params: Dict[str, Any],
+                     node_id: Optional[str] = None, container: int = -1) -> int:
+        """在列式存储中追加一个节点，返回节点编号"""
+        index = len(self._ids)
+        if node_id is None:
+            if self.deterministic_ids:
+                node_id = self._content_id(node_type, name, params, container)
+            else:
+                node_id = str(uuid.uuid4())
+        self._ids.append(node_id)
+        self._types.append(self._intern_type(node_type))
+        self._names.append(sys.intern(name))
+        self._params.append(self._share_params(params))
+        self._xs.append(0)  # 坐标将由自动布局算法计算
+        self._ys.append(0)
+        self._z.append(container)
+        if self._index_by_id is not None:
+            self._index_by_id[node_id] = index
+        self._out_head.append(-1)
+        self._in_head.append(-1)
+        self._order.append(index)  # 新节点没有连线，排在拓扑序末尾即可
+        return index
+    
+    def _content_id(self, node_type: str, name: str, params: Dict[str, Any], container: int) -> str:
+        """
+        生成确定性的 7 位十六进制 ID
+        
+        内容键 = 所属容器 + 类型 + 名称 + 规范化参数；创建路径体现为同一内容键
+        第几次出现，因此相同代码总是生成相同 ID。截断后与已有 ID 冲突时，
+        追加序号重新哈希，直到得到未使用的 ID（结果同样确定）。
+        """
+        container_id = self._containers[container]["id"] if container >= 0 else ""
+        key = json.dumps([container_id, node_type, name, params],
+                         sort_keys=True, ensure_ascii=False, default=str)
+        occurrence = self._id_occurrences.get(key, 0)
+        self._id_occurrences[key] = occurrence + 1
+        
+        if self._index_by_id is None:
+            self._index_by_id = {node_id: i for i, node_id in enumerate(self._ids)}
+        salt = 0
+        while True:
+            digest = hashlib.sha1(f"{key}#{occurrence}#{salt}".encode("utf-8")).hexdigest()
+            node_id = digest[:7]
+            if node_id not in self._index_by_id:
+                return node_id
+            salt += 1
+    
+    def content_hash(self) -> str:
+        """
+        流程图内容哈希（节点 ID、类型、名称、容器、参数与全部连线，不含坐标）
+        
+        在确定性 ID 模式下，相同的流程图得到相同的哈希，可作为导出 / 验证结果的缓存键。
+        """
+        h = hashlib.sha1()
+        for index in range(len(self._ids)):
+            h.update(json.dumps(
+                [self._ids[index], self._type_names[self._types[index]], self._names[index],
+                 self._z[index], self._params[index]],
+                sort_keys=True, ensure_ascii=False, default=str
+            ).encode("utf-8"))
+        for column in (self._wire_source, self._wire_source_port,
+                       self._wire_target, self._wire_target_port):
+            h.update(column.tobytes())
+        for container in self._containers:
+            h.update(json.dumps(container, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        return h.hexdigest()
+    
+    def _add_container(self, entry: Dict[str, Any]) -> int:
+        """登记一个 tab / subflow 容器，返回容器编号"""
+        index = len(self._containers)
+        self._containers.append(entry)
+        self._container_index[entry["id"]] = index
+        return index
+    
+    def _intern_type(self, node_type: str) -> int:
+        """返回节点类型的编码，新类型追加到类型表"""
+        code = self._type_codes.get(node_type)
+        if code is None:
+            code = self._type_codes[node_type] = len(self._type_names)
+            self._type_names.append(sys.intern(node_type))
+        return code
+    
+    def _share_params(self, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """空参数存为 None；紧凑模式下相同（可哈希）参数复用同一字典"""
+        if not params:
+            return None
+        if not self.compact:
+            return params
+        try:
+            key = tuple(params.items())
+            return self._shared_params.setdefault(key, params)
+        except TypeError:
+            return params  # 参数值不可哈希（如列表），单独保存
+    
+    def define_subflow(self, name: str, inputs: Iterable[str] = (), outputs: Iterable[str] = (),
+                       info: str = "") -> SubflowDefinition:
+        """
+        定义一个 subflow（可复用的子流程）
+        
+        定义只在画布中保存一份，内部节点通过返回对象的 add_node() 添加，
+        导出原生格式时输出为一个 subflow 元素及其内部节点。
+        
+        Args:
+            name: subflow 名称
+            inputs: 输入端口名称列表
+            outputs: 输出端口名称列表
+            info: 说明
+            
+        Returns:
+            SubflowDefinition
+        """
+        if self.deterministic_ids:
+            salt = 0
+            while True:
+                subflow_id = hashlib.sha1(f"subflow#{name}#{salt}".encode("utf-8")).hexdigest()[:7]
+                if subflow_id not in self._container_index:
+                    break
+                salt += 1
+        else:
+            subflow_id = uuid.uuid4().hex[:7]
+        container = self._add_container({"id": subflow_id, "type": "subflow", "name": name, "info": info})
+        for port, port_name in enumerate(inputs):
+            self.nodes.append(KongNode._view(self, self._append_port_node(
+                SUBFLOW_IN, {"name": port_name}, port, container)))
+        for port, port_name in enumerate(outputs):
+            self.nodes.append(KongNode._view(self, self._append_port_node(
+                SUBFLOW_OUT, {"name": port_name}, port, container)))
+        return SubflowDefinition(self, container)
+    
+    def add_subflow_instance(self, definition: Union[SubflowDefinition, str], name: str,
+                             **params) -> KongNode:
+        """
+        添加 subflow 实例
+        
+        实例是一个 subflow:<ID> 类型的节点，不复制定义内的节点，
+        其输入端口 i / 输出端口 j 对应定义的第 i 个 in / 第 j 个 out 端口。
+        
+        Args:
+            definition: define_subflow() 的返回值，或已加载的 subflow ID
+            name: 实例名称
+            **params: 实例参数
+            
+        Returns:
+            实例节点
+        """
+        subflow_id = definition.id if isinstance(definition, SubflowDefinition) else definition
+        container = self._container_index.get(subflow_id)
+        if container is None or self._containers[container].get("type") != "subflow":
+            raise ValueError(f"subflow 不存在: {subflow_id}")
+        return self.add_node(SUBFLOW_INSTANCE_PREFIX + subflow_id, name, **params)
+    
+    def subflows(self) -> List[SubflowDefinition]:
+        """画布中的全部 subflow 定义"""
+        return [SubflowDefinition(self, number) for number, container in enumerate(self._containers)
+                if container.get("type") == "subflow"]
+    
+    def _subflow_port_counts(self, container: int) -> Tuple[int, int]:
+        """subflow 定义的 (输入端口数, 输出端口数)"""
+        counts = self._port_counts.get(container)
+        return (counts[0], counts[1]) if counts else (0, 0)
+    
+    def _is_port_node(self, index: int) -> bool:
+        """是否为 subflow 的输入 / 输出端口节点"""
+        node_type = self._type_names[self._types[index]]
+        return node_type == SUBFLOW_IN or node_type == SUBFLOW_OUT
+    
+    def _check_ports(self, index: int, out_port: Optional[int] = None,
+                     in_port: Optional[int] = None) -> Optional[str]:
+        """检查端口索引：subflow 端口 / 实例按定义检查，其余按组件注册表检查"""
+        node_type = self._type_names[self._types[index]]
+        if node_type == SUBFLOW_IN or node_type == SUBFLOW_OUT:
+            if (in_port or 0) > 0 or (out_port or 0) > 0:
+                return f"subflow 端口 {self._names[index]} 只有一个连接点"
+            if node_type == SUBFLOW_IN and in_port is not None:
+                return f"subflow 输入端口 {self._names[index]} 不能作为连线目标"
+            if node_type == SUBFLOW_OUT and out_port is not None:
+                return f"subflow 输出端口 {self._names[index]} 不能作为连线起点"
+            return None
+        if node_type.startswith(SUBFLOW_INSTANCE_PREFIX):
+            container = self._container_index.get(node_type[len(SUBFLOW_INSTANCE_PREFIX):])
+            if container is None:
+                return None
+            inputs, outputs = self._subflow_port_counts(container)
+            if out_port is not None and out_port >= outputs:
+                return f"{node_type} 只有 {outputs} 个输出端口，out_port={out_port} 越界"
+            if in_port is not None and in_port >= inputs:
+                return f"{node_type} 只有 {inputs} 个输入端口，in_port={in_port} 越界"
+            return None
+        return get_registry().check_ports(node_type, out_port=out_port, in_port=in_port)
+    
+    def get_node(self, node_id: str) -> Optional[KongNode]:
+        """按 ID 查找节点，不存在时返回 None"""
+        if self._index_by_id is None:
+            self._index_by_id = {node_id: i for i, node_id in enumerate(self._ids)}
+        index = self._index_by_id.get(node_id)
+        return None if index is None else KongNode._view(self, index)
+    
+    def _add_wire(self, u: int, v: int, out_port: int, in_port: int):
+        """登记一条连线 u -> v：先维护拓扑序（有环则拒绝），再写入邻接索引"""
+        if u == v:
+            raise CycleError(f"节点 {self._names[u]} 不能连接到自身")
+        self._reorder(u, v)
+        self._append_wire(u, v, out_port, in_port)
+    
+    def _append_wire(self, u: int, v: int, out_port: int, in_port: int):
+        """写入连线表与邻接索引（调用方保证拓扑序已满足 u 在 v 之前）"""
+        wire = len(self._wire_source)
+        self._wire_source.append(u)
+        self._wire_source_port.append(out_port)
+        self._wire_target.append(v)
+        self._wire_target_port.append(in_port)
+        self._out_next.append(self._out_head[u])
+        self._out_head[u] = wire
+        self._in_next.append(self._in_head[v])
+        self._in_head[v] = wire
+    
+    def _out_wires(self, index: int) -> Iterator[int]:
+        """遍历节点的出线编号（后连接的在前）"""
+        wire = self._out_head[index]
+        while wire != -1:
+            yield wire
+            wire = self._out_next[wire]
+    
+    def _in_wires(self, index: int) -> Iterator[int]:
+        """遍历节点的入线编号（后连接的在前）"""
+        wire = self._in_head[index]
+        while wire != -1:
+            yield wire
+            wire = self._in_next[wire]
+    
+    def _wire_dict(self, wire: int) -> Dict[str, Any]:
+        """将连线表中的一条连线转换为字典"""
+        return {
+            "source": self._ids[self._wire_source[wire]],
+            "sourcePort": self._wire_source_port[wire],
+            "target": self._ids[self._wire_target[wire]],
+            "targetPort": self._wire_target_port[wire]
+        }
+    
+    def _reorder(self, u: int, v: int):
+        """
+        Pearce-Kelly 增量拓扑排序：插入 u -> v 前调整拓扑序
+        
+        只在 order[v] < order[u] 时才需要调整，且只访问两者之间受影响的区域，
+        按生成顺序连线的常见场景下为 O(1)。
+        
+        Raises:
+            CycleError: 从 v 出发能够到达 u
+        """
+        order = self._order
+        lower, upper = order[v], order[u]
+        if lower > upper:
+            return
+        
+        # 正向搜索：从 v 出发、拓扑位置不超过 upper 的节点
+        forward = [v]
+        seen = {v}
+        stack = [v]
+        while stack:
+            w = stack.pop()
+            wire = self._out_head[w]
+            while wire != -1:
+                x = self._wire_target[wire]
+                if x == u:
+                    raise CycleError(
+                        f"连线 {self._names[u]} -> {self._names[v]} 会形成循环依赖"
+                    )
+                if x not in seen and order[x] < upper:
+                    seen.add(x)
+                    forward.append(x)
+                    stack.append(x)
+                wire = self._out_next[wire]
+        
+        # 反向搜索：能到达 u、拓扑位置大于 lower 的节点
+        backward = [u]
+        seen = {u}
+        stack = [u]
+        while stack:
+            w = stack.pop()
+            wire = self._in_head[w]
+            while wire != -1:
+                x = self._wire_source[wire]
+                if x not in seen and order[x] > lower:
+                    seen.add(x)
+                    backward.append(x)
+                    stack.append(x)
+                wire = self._in_next[wire]
+        
+        # 复用两组节点原有的位置：反向组整体排到正向组之前
+        backward.sort(key=order.__getitem__)
+        forward.sort(key=order.__getitem__)
+        slots = sorted(order[w] for w in backward + forward)
+        for slot, w in zip(slots, backward + forward):
+            order[w] = slot
+    
+    def successors(self, node: KongNode) -> Iterator[KongNode]:
+        """遍历节点的下游节点（每条连线产出一次）"""
+        for wire in self._out_wires(node._index):
+            yield KongNode._view(self, self._wire_target[wire])
+    
+    def predecessors(self, node: KongNode) -> Iterator[KongNode]:
+        """遍历节点的上游节点（每条连线产出一次）"""
+        for wire in self._in_wires(node._index):
+            yield KongNode._view(self, self._wire_source[wire])
+    
+    def topological_order(self) -> List[int]:
+        """按拓扑序返回节点编号（直接读取增量维护的顺序，O(V)）"""
+        result = [0] * len(self._ids)
+        for index, position in enumerate(self._order):
+            result[position] = index
+        return result
+    
+    def iter_wires(self) -> Iterator[Dict[str, Any]]:
+        """按连线表遍历所有连线"""
+        for wire in range(len(self._wire_source)):
+            yield self._wire_dict(wire)
+    
     def auto_layout(self):
         """
-        自动布局算法
-        TODO: 实现层次化布局算法
-        - 拓扑排序确定层级
-        - 每层节点均匀分布
-        - 避免连线交叉
+        自动布局算法（层次化布局）
+
+        按连线方向从左到右分层：拓扑排序确定层级，
+        重心法减少连线交叉，再为每层节点分配坐标。
+        各 tab / subflow 是独立画布，分别布局。
         """
-        # 简单实现：垂直排列
-        y_offset = 100
-        for i, node in enumerate(self.nodes):
-            node.x = 200
-            node.y = y_offset + i * 150
+        edges = list(zip(self._wire_source, self._wire_target))
+        order = self.topological_order()
+        if len(set(self._z)) <= 1:
+            xs, ys = HierarchicalLayout().compute(len(self._ids), edges, order=order)
+            self._xs = array('d', xs)
+            self._ys = array('d', ys)
+            return
+        
+        # 按容器拆分后各自布局；跨容器的连线（subflow 端口）不参与任何一个容器的分层
+        local = [0] * len(self._ids)
+        groups: Dict[int, List[int]] = {}
+        for index in order:
+            members = groups.setdefault(self._z[index], [])
+            local[index] = len(members)
+            members.append(index)
+        group_edges: Dict[int, List[Tuple[int, int]]] = {z: [] for z in groups}
+        for u, v in edges:
+            if self._z[u] == self._z[v]:
+                group_edges[self._z[u]].append((local[u], local[v]))
+        for z, members in groups.items():
+            xs, ys = HierarchicalLayout().compute(len(members), group_edges[z],
+                                                  order=list(range(len(members))))
+            for index, x, y in zip(members, xs, ys):
+                self._xs[index] = x
+                self._ys[index] = y
     
     def validate(self) -> tuple[bool, List[str]]:
         """
@@ -104,9 +909,23 @@ class FlowBuilder:
         """
         errors = []
         
-        # TODO: 检查悬空节点（无输入也无输出）
+        # 1. 检查悬空节点（无输入也无输出），单节点画布例外
+        if len(self._ids) > 1:
+            for index in range(len(self._ids)):
+                if self._out_head[index] == -1 and self._in_head[index] == -1:
+                    errors.append(
+                        f"悬空节点（无输入也无输出）: {self._names[index]} ({self._ids[index]})"
+                    )
+        
+        # 2. 循环依赖已在 connect() 时拒绝，这里确认拓扑序与连线一致
+        order = self._order
+        for source, target in zip(self._wire_source, self._wire_target):
+            if order[source] >= order[target]:
+                errors.append(
+                    f"拓扑序与连线不一致: {self._names[source]} -> {self._names[target]}"
+                )
+        
         # TODO: 检查端口类型是否匹配
-        # TODO: 检查是否存在循环依赖
         
         return len(errors) == 0, errors
     
@@ -119,25 +938,650 @@ class FlowBuilder:
         """
         self.auto_layout()
         
-        # 收集所有连线
-        all_wires = []
-        for node in self.nodes:
-            all_wires.extend(node.wires)
-        
         return {
             "version": "1.0",
             "nodes": [node.to_dict() for node in self.nodes],
-            "wires": all_wires
+            "wires": list(self.iter_wires())
+        }
+    
+    def export_kongcube(self, fp: TextIO, tab_label: str = "流程 1",
+                        indent: Optional[int] = None, layout: bool = True) -> int:
+        """
+        以 KONG CUBE 原生格式流式导出（控制器可直接导入）
+        
+        原生格式为扁平列表：先是 tab / subflow 容器，随后每个节点带 z（所属容器）、
+        inputs/outputs 端口数、组件默认字段，以及按输入端口排列的 wires
+        （每个输入端口列出其上游 {"id", "port"}）。节点逐个序列化并写入 fp，
+        不会在内存中构建完整文档。
+        
+        Args:
+            fp: 可写的文本流，如 open(path, "w", encoding="utf-8")，
+                或 socket.makefile("w", encoding="utf-8")
+            tab_label: 未指定容器的节点所归入的默认 tab 名称
+            indent: 缩进空格数；为空时每个元素占一行
+            layout: 导出前是否执行自动布局（导入的组态已有坐标，可传 False）
+            
+        Returns:
+            写入的元素数量（含容器）
+        """
+        if layout:
+            self.auto_layout()
+        
+        container_ids = [container["id"] for container in self._containers]
+        heads: List[Dict[str, Any]] = []
+        if not self._containers or -1 in self._z:
+            if self.deterministic_ids:
+                default_id = hashlib.sha1(f"tab#{tab_label}".encode("utf-8")).hexdigest()[:7]
+            else:
+                default_id = uuid.uuid4().hex[:7]
+            heads.append({"id": default_id, "type": "tab", "label": tab_label,
+                          "disabled": False, "info": ""})
+            container_ids.append(default_id)  # 编号 -1 指向默认 tab
+        heads.extend(self._kongcube_containers())
+        
+        port_codes = {self._type_codes.get(SUBFLOW_IN), self._type_codes.get(SUBFLOW_OUT)}
+        entries = itertools.chain(heads, (
+            self._kongcube_entry(index, container_ids[self._z[index]])
+            for index in range(len(self._ids))
+            if self._types[index] not in port_codes
+        ))
+        
+        count = 0
+        fp.write("[")
+        for entry in entries:
+            text = json.dumps(entry, ensure_ascii=False, indent=indent)
+            if indent is not None:
+                text = textwrap.indent(text, " " * indent)
+            fp.write(("," if count else "") + "\n" + text)
+            count += 1
+        fp.write("\n]\n")
+        return count
+    
+    def _kongcube_containers(self) -> List[Dict[str, Any]]:
+        """生成容器元素；subflow 的 in/out 端口由端口节点还原"""
+        ports: Dict[int, Tuple[List[int], List[int]]] = {}
+        in_code = self._type_codes.get(SUBFLOW_IN)
+        out_code = self._type_codes.get(SUBFLOW_OUT)
+        for index, code in enumerate(self._types):
+            if code == in_code or code == out_code:
+                ports.setdefault(self._z[index], ([], []))[code == out_code].append(index)
+        
+        entries = []
+        for number, container in enumerate(self._containers):
+            entry = dict(container)
+            if entry.get("type") == "subflow":
+                in_nodes, out_nodes = ports.get(number, ([], []))
+                in_nodes.sort(key=lambda i: self._params[i]["port"])
+                out_nodes.sort(key=lambda i: self._params[i]["port"])
+                entry["in"] = [self._subflow_port_entry(i, self._out_wires(i), False) for i in in_nodes]
+                entry["out"] = [self._subflow_port_entry(i, self._in_wires(i), True) for i in out_nodes]
+                entry["inputs"] = len(in_nodes)
+                entry["outputs"] = len(out_nodes)
+            entries.append(entry)
+        return entries
+    
+    def _subflow_port_entry(self, index: int, wires: Iterator[int], upstream: bool) -> Dict[str, Any]:
+        """subflow 端口元素：输入端口列出下游 {id, 输入端口}，输出端口列出上游 {id, 输出端口}"""
+        refs = []
+        for wire in wires:
+            if upstream:
+                refs.append({"id": self._ids[self._wire_source[wire]], "port": self._wire_source_port[wire]})
+            else:
+                refs.append({"id": self._ids[self._wire_target[wire]], "port": self._wire_target_port[wire]})
+        refs.reverse()
+        return {"x": _coordinate(self._xs[index]), "y": _coordinate(self._ys[index]),
+                "name": self._names[index], "wires": refs}
+    
+    def _kongcube_entry(self, index: int, container_id: str) -> Dict[str, Any]:
+        """生成单个节点的原生格式元素：组件默认字段 + 节点参数 + 按输入端口排列的连线"""
+        node_type = self._type_names[self._types[index]]
+        spec = get_registry().get(node_type)
+        params = self._params[index] or {}
+        
+        # 端口数取组件默认值与实际使用的最大端口号中的较大者（如 6 输入的加法块）
+        in_wires = list(self._in_wires(index))
+        in_wires.reverse()
+        used_inputs = max((self._wire_target_port[w] + 1 for w in in_wires), default=0)
+        used_outputs = max((self._wire_source_port[w] + 1 for w in self._out_wires(index)), default=0)
+        if spec is None and node_type.startswith(SUBFLOW_INSTANCE_PREFIX) \
+                and node_type[len(SUBFLOW_INSTANCE_PREFIX):] in self._container_index:
+            # subflow 实例的端口数由定义决定
+            spec_inputs, spec_outputs = self._subflow_port_counts(
+                self._container_index[node_type[len(SUBFLOW_INSTANCE_PREFIX):]])
+        else:
+            spec_inputs, spec_outputs = (spec.min_inputs, spec.outputs) if spec else (0, 1)
+        inputs = params.get("inputs", max(spec_inputs, used_inputs))
+        outputs = params.get("outputs", max(spec_outputs, used_outputs))
+        
+        in_code = self._type_codes.get(SUBFLOW_IN)
+        wires: List[List[Dict[str, Any]]] = [[] for _ in range(max(inputs, used_inputs))]
+        for wire in in_wires:
+            source = self._wire_source[wire]
+            if self._types[source] == in_code:
+                # 来自 subflow 输入端口：引用 subflow 自身的 ID 与端口号
+                ref = {"id": self._containers[self._z[source]]["id"],
+                       "port": self._params[source]["port"]}
+            else:
+                ref = {"id": self._ids[source], "port": self._wire_source_port[wire]}
+            wires[self._wire_target_port[wire]].append(ref)
+        
+        entry = {
+            "id": self._ids[index],
+            "type": node_type,
+            "z": container_id,
+            "inputs": inputs,
+            "outputs": outputs,
+            "name": self._names[index],
         }
+        if spec is not None:
+            entry.update(spec.defaults)
+        entry.update(params)
+        entry["x"] = _coordinate(self._xs[index])
+        entry["y"] = _coordinate(self._ys[index])
+        entry["wires"] = wires
+        return entry
+    
+    @classmethod
+    def load_kongcube(cls, source: Union[str, Path, IO, List[Dict[str, Any]]],
+                      compact: bool = False) -> 'FlowBuilder':
+        """
+        从 KONG CUBE 原生格式加载组态，便于编辑后重新导出
+        
+        一次遍历创建全部节点并建立 ID 索引，连线先缓存，
+        随后用 Kahn 拓扑排序一次性确定拓扑序并写入连线表，整体 O(V + E)。
+        subflow 的 in/out 端口转换为 subflowIn / subflowOut 端口节点，
+        保留原有 ID、坐标、z 归属和全部字段。安装了 orjson 时自动用其解析。
+        
+        Args:
+            source: 文件路径、二进制/文本文件对象，或已解析的元素列表
+            compact: 是否以紧凑模式构建画布
+            
+        Returns:
+            加载完成的 FlowBuilder
+            
+        Raises:
+            ValueError: 连线引用了不存在的节点或端口，或 z 不是任何 tab / subflow
+            CycleError: 组态中存在循环依赖
+        """
+        items = source if isinstance(source, list) else _load_json(source)
+        flow = cls(compact=compact)
+        index_by_id: Dict[str, int] = {}
+        subflow_ports: Dict[str, List[int]] = {}
+        pending: List[Tuple[int, int, str, int]] = []  # (目标, 输入端口, 源 ID, 源输出端口)
+        parents: List[Tuple[int, str]] = []  # (节点, z)：原生格式不保证容器排在节点之前，遍历结束后再解析
+        
+        for item in items:
+            item_type = item.get("type")
+            if item_type in ("tab", "subflow"):
+                container = flow._add_container(
+                    {k: v for k, v in item.items() if k not in _CONTAINER_SKIP_FIELDS}
+                )
+                if item_type == "subflow":
+                    in_ports = []
+                    for port, spec in enumerate(item.get("in", [])):
+                        in_ports.append(flow._append_port_node(SUBFLOW_IN, spec, port, container))
+                    for port, spec in enumerate(item.get("out", [])):
+                        out_node = flow._append_port_node(SUBFLOW_OUT, spec, port, container)
+                        for ref in spec.get("wires", []):
+                            pending.append((out_node, 0, ref["id"], ref.get("port", 0)))
+                    subflow_ports[item["id"]] = in_ports
+                continue
+            
+            params = {k: v for k, v in item.items() if k not in _NODE_SKIP_FIELDS}
+            index = flow._append_node(item_type, item.get("name", ""), params, node_id=item["id"])
+            if item.get("z"):
+                parents.append((index, item["z"]))
+            flow._xs[index] = item.get("x", 0)
+            flow._ys[index] = item.get("y", 0)
+            index_by_id[item["id"]] = index
+            for in_port, refs in enumerate(item.get("wires", [])):
+                for ref in refs:
+                    pending.append((index, in_port, ref["id"], ref.get("port", 0)))
+        
+        for index, z in parents:
+            container = flow._container_index.get(z)
+            if container is None:
+                raise ValueError(f"节点 {flow._ids[index]} 的 z 不是任何 tab / subflow: {z}")
+            flow._z[index] = container
+        
+        # 解析连线：引用 subflow ID 的连线来自对应的输入端口节点；重复连线按出现顺序去重
+        unique: Dict[Tuple[int, int, int, int], None] = {}
+        for target, in_port, source_id, source_port in pending:
+            if source_id in subflow_ports:
+                ports = subflow_ports[source_id]
+                if not 0 <= source_port < len(ports):
+                    raise ValueError(f"连线引用了不存在的 subflow 输入端口: {source_id}[{source_port}]")
+                unique[(ports[source_port], 0, target, in_port)] = None
+            elif source_id in index_by_id:
+                unique[(index_by_id[source_id], source_port, target, in_port)] = None
+            else:
+                raise ValueError(f"连线引用了不存在的节点: {source_id}")
+        edges = list(unique)
+        
+        flow._set_topological_order([(u, v) for u, _, v, _ in edges])
+        for u, out_port, v, in_port in edges:
+            flow._append_wire(u, v, out_port, in_port)
+        if not compact:
+            flow.nodes = [KongNode._view(flow, i) for i in range(len(flow._ids))]
+        return flow
+    
+    @classmethod
+    def load_json(cls, data: Dict[str, Any], compact: bool = False) -> 'FlowBuilder':
+        """
+        从 export_json() 导出的 SDK 格式重建画布（保留节点 ID、坐标与参数）
+        
+        Args:
+            data: {"nodes": [...], "wires": [...]}；缺少顶层 wires 时使用节点自带的 wires
+            compact: 是否以紧凑模式构建画布
+            
+        Returns:
+            FlowBuilder
+            
+        Raises:
+            ValueError: 连线引用了不存在的节点
+            CycleError: 流程图中存在循环依赖
+        """
+        flow = cls(compact=compact)
+        index_by_id: Dict[str, int] = {}
+        for node in data.get("nodes", []):
+            params = {k: v for k, v in node.items() if k not in _NODE_SKIP_FIELDS}
+            index = flow._append_node(node["type"], node.get("name", ""), params, node_id=node["id"])
+            flow._xs[index] = node.get("x", 0)
+            flow._ys[index] = node.get("y", 0)
+            index_by_id[node["id"]] = index
+        
+        wires = data.get("wires")
+        if wires is None:
+            wires = [wire for node in data.get("nodes", []) for wire in node.get("wires", [])]
+        edges = []
+        for wire in wires:
+            source, target = index_by_id.get(wire.get("source")), index_by_id.get(wire.get("target"))
+            if source is None or target is None:
+                raise ValueError(f"连线引用了不存在的节点: {wire.get('source')} -> {wire.get('target')}")
+            edges.append((source, wire.get("sourcePort", 0), target, wire.get("targetPort", 0)))
+        
+        flow._set_topological_order([(u, v) for u, _, v, _ in edges])
+        for u, out_port, v, in_port in edges:
+            flow._append_wire(u, v, out_port, in_port)
+        if not compact:
+            flow.nodes = [KongNode._view(flow, i) for i in range(len(flow._ids))]
+        return flow
+    
+    def _append_port_node(self, port_type: str, spec: Dict[str, Any], port: int, container: int) -> int:
+        """将 subflow 的一个 in/out 端口登记为端口节点"""
+        index = self._append_node(port_type, spec.get("name", ""), {"port": port},
+                                  node_id=f"{self._containers[container]['id']}:{port_type}:{port}",
+                                  container=container)
+        self._xs[index] = spec.get("x", 0)
+        self._ys[index] = spec.get("y", 0)
+        self._port_counts.setdefault(container, [0, 0])[port_type == SUBFLOW_OUT] += 1
+        return index
+    
+    def _set_topological_order(self, edges: List[Tuple[int, int]]):
+        """用 Kahn 算法为批量导入的节点一次性确定拓扑序"""
+        node_count = len(self._ids)
+        succ: List[List[int]] = [[] for _ in range(node_count)]
+        indegree = [0] * node_count
+        for u, v in edges:
+            succ[u].append(v)
+            indegree[v] += 1
+        queue = [v for v in range(node_count) if indegree[v] == 0]
+        for v in queue:
+            for w in succ[v]:
+                indegree[w] -= 1
+                if indegree[w] == 0:
+                    queue.append(w)
+        if len(queue) < node_count:
+            cyclic = [self._names[v] for v in range(node_count) if indegree[v] > 0][:5]
+            raise CycleError(f"组态中存在循环依赖，涉及节点: {cyclic}")
+        for position, v in enumerate(queue):
+            self._order[v] = position
+
+
+# 组件样本文件所在目录（json/*组件.json）
+COMPONENT_DIR = Path(__file__).resolve().parent / "json"
+
+# subflow 输入 / 输出端口在 SDK 中表示为端口节点，导出时还原为 subflow 的 in/out 数组
+SUBFLOW_IN = "subflowIn"
+SUBFLOW_OUT = "subflowOut"
+SUBFLOW_INSTANCE_PREFIX = "subflow:"  # subflow 实例节点的类型前缀（subflow:<subflow ID>）
+
+
+def is_subflow_type(node_type: str) -> bool:
+    """是否为 subflow 端口或实例类型（不在组件库中，由画布内的定义描述）"""
+    return node_type in (SUBFLOW_IN, SUBFLOW_OUT) or node_type.startswith(SUBFLOW_INSTANCE_PREFIX)
+
+# 导入时由列式存储单独保存、不放入节点参数的字段
+_NODE_SKIP_FIELDS = frozenset({"id", "type", "z", "name", "x", "y", "wires"})
+_CONTAINER_SKIP_FIELDS = frozenset({"in", "out", "inputs", "outputs"})
+
+try:
+    import orjson as _fast_json  # 可选依赖：解析大型组态文件快数倍
+except ImportError:
+    _fast_json = None
+
+
+def _load_json(source: Union[str, Path, IO]) -> Any:
+    """读取 JSON 文件或文件对象，安装了 orjson 时优先使用"""
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    if _fast_json is not None:
+        return _fast_json.loads(data)
+    return json.loads(data)
+
+
+# 组件样本中由导出逻辑单独生成、不作为默认值复制的字段
+_TEMPLATE_SKIP_FIELDS = frozenset({"id", "type", "z", "name", "inputs", "outputs", "x", "y", "wires"})
+
+# 输入端口数可按需扩展的组件（如样本工程中 6 输入的加法块）
+VARIADIC_INPUT_TYPES = frozenset({"add", "multiply", "logic", "statistics"})
+
+# 可选字段前缀：旧版本导出的组态可能不包含这些字段
+_OPTIONAL_FIELD_PREFIXES = ("bacnet", "modbus", "bacInput")
+
+# 组件注册表缓存文件；组件样本变化后自动重建
+REGISTRY_CACHE_PATH = Path(__file__).resolve().parent / ".cache" / "component_registry.pkl"
+_REGISTRY_FORMAT = 5
+_REGISTRY_CHECK_INTERVAL = 5.0  # 同一进程内检查组件文件是否变化的最小间隔（秒）
+
+
+def _is_optional_field(key: str) -> bool:
+    """BACnet/Modbus 对外暴露字段、编辑器记录字段（xxxOld、debugView）不是组件运行所必需的"""
+    return key.startswith(_OPTIONAL_FIELD_PREFIXES) or key.endswith("Old") or key == "debugView"
+
+
+def value_kinds(value: Any) -> FrozenSet[str]:
+    """
+    参数值的类别：数值与布尔同为 "number"（原生格式中开关常以 0/1 存储），
+    数值字符串（如 "1"）同时属于 "number" 与 "str"，其余按类型名
+    """
+    if isinstance(value, (bool, int, float)):
+        return frozenset({"number"})
+    if isinstance(value, str):
+        try:
+            float(value)
+        except ValueError:
+            return frozenset({"str"})
+        return frozenset({"number", "str"})
+    return frozenset({type(value).__name__})
+
+
+class ComponentSpec(NamedTuple):
+    """单个组件类型的端口与参数定义"""
+    type: str
+    label: str  # 中文名称，如 "比较判断"
+    category: str  # 所在组件文件，如 "逻辑组件"
+    min_inputs: int
+    max_inputs: Optional[int]  # None 表示输入端口数可扩展
+    outputs: int
+    defaults: Dict[str, Any]  # 原生格式的默认字段（取第一个样本）
+    required: FrozenSet[str]  # 所有样本都具备的字段
+    param_kinds: Dict[str, FrozenSet[str]]  # 各参数在全部样本中出现过的值类别（见 value_kinds）
+
+
+class ComponentRegistry:
+    """
+    组件注册表：由 json/*组件.json 编译而来，按类型 O(1) 查询端口范围与必需字段
+    
+    编译结果以 pickle 缓存，进程启动时只需比对组件文件的大小与修改时间，
+    文件未变化时不再解析 JSON。
+    """
+    
+    def __init__(self, specs: Dict[str, ComponentSpec], fingerprint: tuple = (), version: str = ""):
+        self.specs = specs
+        self.fingerprint = fingerprint
+        self.version = version  # 组件文件内容的哈希，与文件修改时间无关，可用作持久化缓存的键
+    
+    def __contains__(self, node_type: str) -> bool:
+        return node_type in self.specs
+    
+    def __len__(self) -> int:
+        return len(self.specs)
+    
+    def get(self, node_type: str) -> Optional[ComponentSpec]:
+        """查询组件定义，未知类型返回 None"""
+        return self.specs.get(node_type)
+    
+    def check_ports(self, node_type: str, out_port: Optional[int] = None,
+                    in_port: Optional[int] = None) -> Optional[str]:
+        """
+        检查端口索引是否在组件定义范围内
+        
+        Returns:
+            错误信息；端口合法或类型未知时返回 None
+        """
+        spec = self.specs.get(node_type)
+        if spec is None:
+            return None
+        if out_port is not None and out_port >= spec.outputs:
+            return f"{node_type} 只有 {spec.outputs} 个输出端口，out_port={out_port} 越界"
+        if in_port is not None and spec.max_inputs is not None and in_port >= spec.max_inputs:
+            return f"{node_type} 只有 {spec.max_inputs} 个输入端口，in_port={in_port} 越界"
+        return None
+    
+    def missing_fields(self, node_type: str, fields: Iterable[str]) -> List[str]:
+        """返回原生格式元素缺少的必需字段"""
+        spec = self.specs.get(node_type)
+        if spec is None:
+            return []
+        return sorted(spec.required.difference(fields))
+    
+    def labels(self) -> Dict[str, str]:
+        """{类型: 中文名称}"""
+        return {node_type: spec.label for node_type, spec in self.specs.items()}
+    
+    def describe(self) -> str:
+        """生成供编码提示词使用的组件清单（类型、名称、端口数）"""
+        lines = []
+        for spec in self.specs.values():
+            inputs = (f"{spec.min_inputs}+" if spec.max_inputs is None
+                      else str(spec.min_inputs) if spec.min_inputs == spec.max_inputs
+                      else f"{spec.min_inputs}-{spec.max_inputs}")
+            lines.append(f"- {spec.type}（{spec.label}）: 输入 {inputs}，输出 {spec.outputs}")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def fingerprint_of(directory: Path) -> tuple:
+        """组件文件的 (文件名, 大小, 修改时间) 指纹"""
+        entries = []
+        for path in sorted(directory.glob("*组件.json")):
+            stat = path.stat()
+            entries.append((path.name, stat.st_size, stat.st_mtime_ns))
+        return (_REGISTRY_FORMAT, tuple(entries))
+    
+    @classmethod
+    def compile(cls, directory: Path = COMPONENT_DIR) -> 'ComponentRegistry':
+        """解析组件文件，编译为注册表"""
+        fingerprint = cls.fingerprint_of(directory)
+        samples: Dict[str, List[Dict[str, Any]]] = {}
+        categories: Dict[str, str] = {}
+        digest = hashlib.sha256()
+        for path in sorted(directory.glob("*组件.json")):
+            content = path.read_bytes()
+            digest.update(path.name.encode("utf-8"))
+            digest.update(content)
+            for item in json.loads(content.decode("utf-8")):
+                node_type = item.get("type")
+                if node_type in ("tab", "subflow"):
+                    continue
+                samples.setdefault(node_type, []).append(item)
+                categories.setdefault(node_type, path.stem)
+        
+        specs = {}
+        for node_type, items in samples.items():
+            first = items[0]
+            input_counts = [item.get("inputs", 0) for item in items]
+            required = frozenset(
+                key for key in frozenset.intersection(*(frozenset(item) for item in items))
+                if not _is_optional_field(key)
+            )
+            # inputAuxEnable / xxxFromInput 开关打开时，对应参数改由一个额外输入端口提供
+            optional_inputs = sum(1 for key in first if key == "inputAuxEnable" or key.endswith("FromInput"))
+            param_kinds: Dict[str, FrozenSet[str]] = {}
+            for item in items:
+                for key, value in item.items():
+                    if key not in _TEMPLATE_SKIP_FIELDS:
+                        param_kinds[key] = param_kinds.get(key, frozenset()) | value_kinds(value)
+            specs[node_type] = ComponentSpec(
+                type=node_type,
+                label=first.get("name", node_type),
+                category=categories[node_type],
+                min_inputs=min(input_counts),
+                max_inputs=(None if node_type in VARIADIC_INPUT_TYPES
+                            else max(input_counts) + optional_inputs),
+                outputs=max(item.get("outputs", 0) for item in items),
+                defaults={k: v for k, v in first.items() if k not in _TEMPLATE_SKIP_FIELDS},
+                required=required - {"id", "z", "x", "y"},
+                param_kinds=param_kinds
+            )
+        return cls(specs, fingerprint, digest.hexdigest()[:16])
+    
+    @classmethod
+    def load(cls, directory: Path = COMPONENT_DIR,
+             cache_path: Path = REGISTRY_CACHE_PATH) -> 'ComponentRegistry':
+        """读取缓存；缓存缺失或组件文件已变化时重新编译并写回缓存"""
+        fingerprint = cls.fingerprint_of(directory)
+        try:
+            with open(cache_path, "rb") as f:
+                registry = pickle.load(f)
+            if registry.fingerprint == fingerprint:
+                return registry
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError):
+            pass  # 缓存缺失、损坏，或由旧版本的 ComponentSpec 结构写入
+        
+        registry = cls.compile(directory)
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(registry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # 缓存目录不可写时仅使用内存中的注册表
+        return registry
+
+
+_registry: Optional[ComponentRegistry] = None
+_registry_checked_at = 0.0
+
+
+def get_registry() -> ComponentRegistry:
+    """
+    获取进程内共享的组件注册表
+    
+    每隔 _REGISTRY_CHECK_INTERVAL 秒比对一次组件文件指纹，
+    文件变化时自动重新编译，其余调用只是一次全局变量读取。
+    """
+    global _registry, _registry_checked_at
+    now = time.monotonic()
+    if _registry is None or now - _registry_checked_at > _REGISTRY_CHECK_INTERVAL:
+        _registry_checked_at = now
+        if _registry is None or _registry.fingerprint != ComponentRegistry.fingerprint_of(COMPONENT_DIR):
+            _registry = ComponentRegistry.load()
+    return _registry
+
+
+# 允许使用的节点类型（用于代码生成时的提示），由组件注册表生成
+NODE_TYPES = get_registry().labels()
+
+
+def _benchmark_edges(node_count: int, seed: int = 0) -> List[Tuple[int, int, int]]:
+    """随机分层流程图的连线 (源, 目标, 输入端口)：每个节点有 1~2 个上游"""
+    rng = random.Random(seed)
+    edges = []
+    for i in range(1, node_count):
+        window = max(0, i - 50)
+        for in_port in range(rng.randint(1, 2)):
+            edges.append((rng.randint(window, i - 1), i, in_port))
+    return edges
+
+
+def _build_benchmark_flow(node_count: int, seed: int = 0, compact: bool = False) -> FlowBuilder:
+    """构造随机分层的大规模流程图"""
+    flow = FlowBuilder(compact=compact)
+    for i in range(node_count):
+        flow.add_node("add", f"节点_{i}")
+    nodes = flow.nodes
+    for source, target, in_port in _benchmark_edges(node_count, seed):
+        nodes[source].connect(nodes[target], in_port=in_port)
+    return flow
+
+
+def benchmark_auto_layout(sizes: Tuple[int, ...] = (1000, 10000, 50000)):
+    """自动布局性能基准：1k / 10k / 50k 节点"""
+    for size in sizes:
+        flow = _build_benchmark_flow(size)
+        start = time.perf_counter()
+        flow.auto_layout()
+        elapsed = time.perf_counter() - start
+        width = int(max(flow._ys))
+        depth = int(max(flow._xs))
+        print(f"{size:>6} 节点: {elapsed * 1000:8.1f} ms  (画布 {depth} x {width})")
+
+
+class _LegacyKongNode:
+    """列式存储之前的节点结构（__dict__ + uuid 字符串 + 参数字典 + 连线字典列表），仅用于内存对比"""
+    
+    def __init__(self, node_type: str, name: str, **params):
+        self.id = str(uuid.uuid4())
+        self.type = node_type
+        self.name = name
+        self.params = params
+        self.wires: List[Dict] = []
+        self.x = 0
+        self.y = 0
+    
+    def connect(self, target_node: '_LegacyKongNode', out_port: int = 0, in_port: int = 0):
+        self.wires.append({
+            "source": self.id,
+            "sourcePort": out_port,
+            "target": target_node.id,
+            "targetPort": in_port
+        })
+
+
+def benchmark_memory(node_count: int = 100000):
+    """用 tracemalloc 对比每个节点占用的字节数：原节点类 vs 列式存储（普通 / 紧凑模式）"""
+    import tracemalloc
+    
+    # 真实组态中名称大量重复（如 "比较判断"、"引用"），这里按 200 种名称循环
+    names = [f"比较判断_{i}" for i in range(200)]
+    edges = _benchmark_edges(node_count)
+    
+    def build_legacy():
+        nodes = [_LegacyKongNode("compare", names[i % 200], tripPoint=0) for i in range(node_count)]
+        for source, target, in_port in edges:
+            nodes[source].connect(nodes[target], in_port=in_port)
+        return nodes
+    
+    def build_columnar(compact: bool):
+        flow = FlowBuilder(compact=compact)
+        for i in range(node_count):
+            flow.add_node("compare", names[i % 200], tripPoint=0)
+        nodes = flow.nodes
+        for source, target, in_port in edges:
+            nodes[source].connect(nodes[target], in_port=in_port)
+        return flow
+    
+    builders = [
+        ("原 KongNode 类", build_legacy),
+        ("列式存储", lambda: build_columnar(False)),
+        ("列式存储（紧凑模式）", lambda: build_columnar(True)),
+    ]
+    for label, build in builders:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:<12} {(current - baseline) / node_count:8.1f} 字节/节点"
+              f"  (峰值 {(peak - baseline) / 2**20:.1f} MiB)")
+        del result
 
 
-# 预定义的常用节点类型（用于代码生成时的提示）
-NODE_TYPES = {
-    "swInput": "模拟量输入",
-    "compare": "比较模块",
-    "switch": "切换模块",
-    "math": "数学运算",
-    "logic": "逻辑运算",
-    "timer": "定时器",
-    "accumulator": "累计器"
-}
+if __name__ == "__main__":
+    benchmark_auto_layout()
+    benchmark_memory()
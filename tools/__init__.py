@@ -2,5 +2,17 @@
 tools 包初始化文件
 """
 from .execution_tool import ExecutionTool
+from .result_cache import ResultCache
+from .flow_simulator import FlowEvaluator, FlowSimulator, compile_flow
+from .flow_diff import FlowPatch, diff_flows
+from .flow_validator import FlowValidator, ValidationReport, validate_flow
+from .stream_validator import StreamingValidator, validate_kongcube_stream
+from .partition_validator import ParallelValidator, validate_kongcube_parallel
+from .semantic_precheck import PrecheckResult, run_precheck
+from .vector_index import LocalVectorStore, load_embedder
+from .retrieval_cache import RetrievalCache
 
-__all__ = ['ExecutionTool']
+__all__ = ['ExecutionTool', 'ResultCache', 'FlowEvaluator', 'FlowSimulator', 'compile_flow', 'FlowPatch', 'diff_flows',
+           'FlowValidator', 'ValidationReport', 'validate_flow',
+           'StreamingValidator', 'validate_kongcube_stream', 'ParallelValidator', 'validate_kongcube_parallel',
+           'PrecheckResult', 'run_precheck', 'LocalVectorStore', 'load_embedder', 'RetrievalCache']
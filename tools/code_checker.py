@@ -0,0 +1,271 @@
+"""
+静态检查工具 (Code Checker)
+职责：执行前对生成的代码做一次 AST 分析（危险导入 / 调用、组件类型、连线端口），
+      并按源码哈希缓存检查结果与编译后的代码对象
+"""
+import ast
+import hashlib
+import marshal
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, NamedTuple
+
+from kong_sdk import FlowBuilder, KongNode, SubflowDefinition, get_registry, is_subflow_type
+
+
+# 危险模块黑名单（按顶层包名匹配）
+BANNED_MODULES = frozenset({
+    "os", "sys", "subprocess", "socket", "shutil", "ctypes", "signal", "resource",
+    "multiprocessing", "threading", "importlib", "builtins", "pickle", "marshal",
+    "requests", "urllib", "http", "ftplib", "pathlib", "tempfile", "glob", "io",
+})
+
+# 禁止调用的内置函数
+BANNED_CALLS = frozenset({
+    "eval", "exec", "compile", "__import__", "open", "input", "breakpoint",
+    "globals", "locals", "vars", "getattr", "setattr", "delattr",
+})
+
+# 允许访问的双下划线属性（其余如 __class__ / __globals__ 常用于逃逸沙箱）
+_ALLOWED_DUNDER_ATTRIBUTES = frozenset({"__name__", "__doc__", "__init__"})
+
+# SDK 对象的公开方法 / 属性，用于发现拼写错误
+_SDK_MEMBERS = {
+    "FlowBuilder": frozenset(name for name in dir(FlowBuilder) if not name.startswith("_"))
+    | {"nodes", "compact", "deterministic_ids"},
+    "KongNode": frozenset(name for name in dir(KongNode) if not name.startswith("_")),
+    "SubflowDefinition": frozenset(name for name in dir(SubflowDefinition) if not name.startswith("_")),
+}
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class CheckResult(NamedTuple):
+    """静态检查结果"""
+    ok: bool
+    errors: List[str]
+    compiled: Optional[bytes]  # marshal 序列化的代码对象，检查未通过时为 None
+    digest: str  # 源码哈希
+    syntax_error: bool = False
+    entry_point: bool = False  # 是否在模块顶层定义了 generate_flow()
+
+
+class _SdkVisitor(ast.NodeVisitor):
+    """
+    遍历生成代码，收集违规项
+
+    变量类型只按字面赋值推断（flow = FlowBuilder()、x = flow.add_node("compare", ...)），
+    无法推断的表达式不做检查，避免误报。
+    """
+
+    def __init__(self):
+        self.errors: List[str] = []
+        self.kinds: Dict[str, str] = {}  # 变量名 -> FlowBuilder / KongNode / SubflowDefinition
+        self.node_types: Dict[str, str] = {}  # 节点变量名 -> 组件类型
+        self.registry = get_registry()
+
+    def error(self, node: ast.AST, message: str):
+        self.errors.append(f"第 {getattr(node, 'lineno', '?')} 行: {message}")
+
+    # ---------- 导入与危险调用 ----------
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.name.split(".")[0] in BANNED_MODULES:
+                self.error(node, f"检测到危险模块导入: {alias.name}")
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level == 0 and node.module and node.module.split(".")[0] in BANNED_MODULES:
+            self.error(node, f"检测到危险模块导入: {node.module}")
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if node.attr.startswith("__") and node.attr not in _ALLOWED_DUNDER_ATTRIBUTES:
+            self.error(node, f"禁止访问双下划线属性: {node.attr}")
+        if isinstance(node.value, ast.Name):
+            kind = self.kinds.get(node.value.id)
+            if kind is not None and node.attr not in _SDK_MEMBERS[kind]:
+                self.error(node, f"{kind} 没有属性或方法: {node.attr}")
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id == "__builtins__":
+            self.error(node, "禁止访问 __builtins__")
+
+    # ---------- SDK 调用 ----------
+
+    def visit_Assign(self, node: ast.Assign):
+        self.generic_visit(node)
+        kind, node_type = self._infer(node.value)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self.kinds.pop(target.id, None)
+                self.node_types.pop(target.id, None)
+                if kind is not None:
+                    self.kinds[target.id] = kind
+                if node_type is not None:
+                    self.node_types[target.id] = node_type
+
+    def _infer(self, value: ast.AST):
+        """推断赋值右侧的 SDK 对象种类与组件类型"""
+        if not isinstance(value, ast.Call):
+            return None, None
+        func = value.func
+        if isinstance(func, ast.Name) and func.id in ("FlowBuilder", "KongNode"):
+            return func.id, _literal_type(value) if func.id == "KongNode" else None
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            owner = self.kinds.get(func.value.id)
+            if owner in ("FlowBuilder", "SubflowDefinition") and func.attr == "add_node":
+                return "KongNode", _literal_type(value)
+            if owner == "FlowBuilder" and func.attr == "add_subflow_instance":
+                return "KongNode", None
+            if owner == "FlowBuilder" and func.attr == "define_subflow":
+                return "SubflowDefinition", None
+            if owner == "SubflowDefinition" and func.attr in ("input", "output"):
+                return "KongNode", None
+        return None, None
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in BANNED_CALLS:
+            self.error(node, f"禁止调用: {func.id}()")
+
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            owner = self.kinds.get(func.value.id)
+            if func.attr == "add_node" and owner in ("FlowBuilder", "SubflowDefinition"):
+                node_type = _literal_type(node)
+                if node_type is not None and node_type not in self.registry and not is_subflow_type(node_type):
+                    self.error(node, f"组件类型不在组件库中: {node_type}")
+            elif func.attr == "connect" and owner == "KongNode":
+                self._check_connect(node, func.value.id)
+        self.generic_visit(node)
+
+    def _check_connect(self, node: ast.Call, source: str):
+        """检查 connect() 的端口字面量是否在组件定义范围内"""
+        target = node.args[0].id if node.args and isinstance(node.args[0], ast.Name) else None
+        ports = {"out_port": 0, "in_port": 0}
+        for name, arg in zip(("out_port", "in_port"), node.args[1:]):
+            ports[name] = arg
+        for keyword in node.keywords:
+            if keyword.arg in ports:
+                ports[keyword.arg] = keyword.value
+        values = {}
+        for name, value in ports.items():
+            if isinstance(value, ast.AST):
+                value = _int_literal(value)
+                if value is None:
+                    continue  # 非字面量端口（如循环变量）在运行时检查
+            if value < 0:
+                self.error(node, f"端口索引不能为负数: {name}={value}")
+            values[name] = value
+
+        message = None
+        if "out_port" in values and source in self.node_types:
+            message = self.registry.check_ports(self.node_types[source], out_port=values["out_port"])
+        if message is None and "in_port" in values and target in self.node_types:
+            message = self.registry.check_ports(self.node_types[target], in_port=values["in_port"])
+        if message:
+            self.error(node, message)
+
+
+def _int_literal(node: ast.AST) -> Optional[int]:
+    """整数字面量的值；-1 解析为 UnaryOp(USub, Constant(1))，一并折叠"""
+    sign = 1
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        node = node.operand
+    if isinstance(node, ast.Constant) and isinstance(node.value, int) and not isinstance(node.value, bool):
+        return sign * node.value
+    return None
+
+
+def _literal_type(call: ast.Call) -> Optional[str]:
+    """add_node / KongNode 调用中的组件类型字面量"""
+    value = call.args[0] if call.args else next(
+        (k.value for k in call.keywords if k.arg == "node_type"), None)
+    if isinstance(value, ast.Constant) and isinstance(value.value, str):
+        return value.value
+    return None
+
+
+class CodeChecker:
+    """带缓存的静态检查器：相同源码（在同一组件库版本下）只解析、检查和编译一次"""
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, CheckResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, code: str) -> CheckResult:
+        """
+        检查代码，通过时附带编译后的代码对象
+
+        Args:
+            code: Python 代码字符串
+
+        Returns:
+            CheckResult
+        """
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        key = (digest, get_registry().fingerprint)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        result = self._check(code, digest)
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _check(code: str, digest: str) -> CheckResult:
+        try:
+            tree = ast.parse(code, filename="<generated>")
+        except SyntaxError as e:
+            return CheckResult(False, [f"第 {e.lineno} 行: 语法错误: {e.msg}"], None, digest, True)
+
+        visitor = _SdkVisitor()
+        visitor.visit(tree)
+        if visitor.errors:
+            return CheckResult(False, visitor.errors, None, digest)
+        compiled = marshal.dumps(compile(tree, "<generated>", "exec"))
+        entry_point = any(isinstance(node, ast.FunctionDef) and node.name == "generate_flow"
+                          for node in tree.body)
+        return CheckResult(True, [], compiled, digest, entry_point=entry_point)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+def test_code_checker():
+    """测试静态检查：组件类型与连线端口字面量"""
+    checker = CodeChecker()
+    cases = {
+        "正常": 'flow = FlowBuilder()\na = flow.add_node("swInput", "温度")\n'
+                'b = flow.add_node("compare", "比较")\na.connect(b)',
+        "未知组件": 'flow = FlowBuilder()\na = flow.add_node("constant", "常量")',
+        "负数端口": 'flow = FlowBuilder()\na = flow.add_node("swInput", "温度")\n'
+                  'b = flow.add_node("compare", "比较")\na.connect(b, out_port=-1)',
+        "端口越界": 'flow = FlowBuilder()\na = flow.add_node("swInput", "温度")\n'
+                  'b = flow.add_node("compare", "比较")\na.connect(b, 0, 5)',
+        "危险导入": 'import os\nos.system("ls")',
+    }
+    for title, code in cases.items():
+        result = checker.check(code)
+        print(f"{title}: 通过={result.ok} {result.errors}")
+    checker.check(cases["正常"])
+    print(f"统计: {checker.stats()}")
+
+
+if __name__ == "__main__":
+    test_code_checker()
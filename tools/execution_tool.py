@@ -2,23 +2,47 @@
 执行工具节点 (Execution Tool)
 职责：代码沙箱，执行生成的 Python 代码并捕获输出
 """
-import sys
-import io
-import traceback
-from typing import Dict, Any
-import json
+from typing import Dict, Any, Optional, List, Iterator, Tuple, Union
+
+from .sandbox import SandboxPool
+from .code_checker import CodeChecker
+from .result_cache import ResultCache
+from .flow_validator import validate_flow
+from .partition_validator import validate_kongcube_parallel
 
 
 class ExecutionTool:
     """代码执行沙箱（非 AI 节点）"""
     
-    def __init__(self):
-        """初始化执行环境"""
+    def __init__(self, workers: Optional[int] = None, cache: Union[ResultCache, bool] = True):
+        """
+        初始化执行环境
+        
+        Args:
+            workers: 沙箱工作进程数，默认为 CPU 核数
+            cache: 执行结果缓存；True 使用默认的磁盘缓存，False 不缓存
+        """
         self.timeout = 10  # 执行超时时间（秒）
+        self.workers = workers
+        self._pool: Optional[SandboxPool] = None  # 首次执行时启动
+        self.checker = CodeChecker()  # 静态检查与编译结果按源码哈希缓存
+        # 执行结果按 (代码, SDK 版本, 组件库版本) 持久化缓存，相同代码不再进入沙箱
+        self.cache: Optional[ResultCache] = ResultCache() if cache is True else (cache or None)
+    
+    @property
+    def pool(self) -> SandboxPool:
+        """预启动的沙箱进程池（首次访问时创建）"""
+        if self._pool is None:
+            self._pool = SandboxPool(workers=self.workers, timeout=self.timeout)
+        return self._pool
     
     def execute_code(self, code: str) -> Dict[str, Any]:
         """
-        在隔离环境中执行 Python 代码
+        在隔离的沙箱进程中执行 Python 代码
+        
+        执行前先做静态检查（危险导入 / 调用、组件类型、连线端口），未通过时不进入沙箱；
+        通过的代码先查结果缓存，未命中时以编译好的代码对象发送给沙箱。超时、CPU 时间、
+        内存和输出大小均由沙箱进程池限制，生成代码中的死循环不会阻塞当前进程。
         
         Args:
             code: Python 代码字符串
@@ -26,71 +50,146 @@ class ExecutionTool:
         Returns:
             执行结果字典
         """
-        result = {
+        check = self.checker.check(code)
+        if not check.ok:
+            return self._check_failure(check)
+        key = self.cache.key(code) if self.cache is not None else None
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        # 定义了 generate_flow() 的代码由沙箱直接调用，流程图经二进制通道返回，不解析 stdout
+        result = self.pool.run(check.compiled, timeout=self.timeout, entry=check.entry_point)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+    
+    def _cached(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """查询结果缓存；命中时耗时记为 0"""
+        if key is None:
+            return None
+        result = self.cache.get(key)
+        if result is not None:
+            result["elapsed"] = 0.0
+        return result
+    
+    @staticmethod
+    def _check_failure(check) -> Dict[str, Any]:
+        """静态检查未通过时的执行结果"""
+        return {
             "success": False,
             "result": None,
             "stdout": "",
             "stderr": "",
-            "error": None
+            "error": {
+                "type": "SyntaxError" if check.syntax_error else "StaticCheckError",
+                "message": "\n".join(check.errors),
+                "traceback": ""
+            }
         }
+    
+    def iter_many(self, codes: List[str]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        在多个沙箱进程中并行执行候选代码，按完成顺序逐个产出结果
         
-        # 重定向标准输出和标准错误
-        old_stdout = sys.stdout
-        old_stderr = sys.stderr
-        sys.stdout = io.StringIO()
-        sys.stderr = io.StringIO()
+        未通过静态检查或命中结果缓存的候选不进入沙箱、最先产出；
+        提前关闭生成器会取消仍在执行的候选。
         
-        try:
-            # 准备执行环境
-            global_namespace = {
-                "__name__": "__main__",
-                "__builtins__": __builtins__
-            }
-            
-            # TODO: 添加安全检查
-            # - 禁止导入危险模块（os, subprocess 等）
-            # - 限制内存使用
-            # - 限制文件 I/O
-            
-            # 执行代码
-            exec(code, global_namespace)
-            
-            # 捕获输出
-            result["stdout"] = sys.stdout.getvalue()
-            result["stderr"] = sys.stderr.getvalue()
-            
-            # 尝试解析 JSON 输出（如果有）
-            stdout_text = result["stdout"].strip()
-            if stdout_text:
-                try:
-                    # 假设输出的是 JSON
-                    result["result"] = json.loads(stdout_text)
-                except json.JSONDecodeError:
-                    # 如果不是 JSON，保存原始文本
-                    result["result"] = stdout_text
-            
-            result["success"] = True
+        Args:
+            codes: 候选代码列表
             
-        except Exception as e:
-            # 捕获异常
-            result["success"] = False
-            result["error"] = {
-                "type": type(e).__name__,
-                "message": str(e),
-                "traceback": traceback.format_exc()
-            }
-            result["stderr"] = sys.stderr.getvalue()
+        Yields:
+            (候选在 codes 中的序号, 执行结果字典)
+        """
+        checks = [self.checker.check(code) for code in codes]
+        keys = [self.cache.key(code) if self.cache is not None else None for code in codes]
+        runnable = []
+        for index, check in enumerate(checks):
+            if not check.ok:
+                yield index, self._check_failure(check)
+                continue
+            cached = self._cached(keys[index])
+            if cached is not None:
+                yield index, cached
+            else:
+                runnable.append(index)
+        if not runnable:
+            return
         
+        results = self.pool.run_many([checks[i].compiled for i in runnable], timeout=self.timeout,
+                                     entry=[checks[i].entry_point for i in runnable])
+        try:
+            for position, result in results:
+                index = runnable[position]
+                if keys[index] is not None:
+                    self.cache.put(keys[index], result)
+                yield index, result
         finally:
-            # 恢复标准输出
-            sys.stdout = old_stdout
-            sys.stderr = old_stderr
+            results.close()
+    
+    def execute_many(self, codes: List[str],
+                     mode: str = "first_success") -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        并行执行多个候选代码
         
-        return result
+        Args:
+            codes: 候选代码列表
+            mode: "first_success" 返回第一个生成有效流程图的结果并取消其余候选；
+                  "all" 等待全部候选完成
+            
+        Returns:
+            first_success: 执行结果字典，"index" 为候选序号；全部失败时返回序号最小的候选的失败结果
+            all: 与 codes 顺序一致的执行结果列表
+        """
+        if mode not in ("first_success", "all"):
+            raise ValueError(f"未知的执行模式: {mode}")
+        if not codes:
+            raise ValueError("候选代码列表为空")
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(codes)
+        stream = self.iter_many(codes)
+        try:
+            for index, result in stream:
+                result["index"] = index
+                results[index] = result
+                if mode == "first_success" and self._produced_flow(result):
+                    return result
+        finally:
+            stream.close()
+        if mode == "all":
+            return results
+        return results[0]
+    
+    @staticmethod
+    def _produced_flow(result: Dict[str, Any]) -> bool:
+        """执行成功且得到了通过形式化验证的流程图（SDK 格式 JSON 或原生格式元素列表）"""
+        if not result["success"]:
+            return False
+        output = result.get("result")  # 返回 FlowBuilder 时为其导出的 SDK 格式 JSON
+        try:
+            if isinstance(output, dict) and "nodes" in output:
+                return validate_flow(output).passed
+            if isinstance(output, list):
+                return validate_kongcube_parallel(output).passed
+        except (TypeError, ValueError, KeyError, AttributeError):
+            return False  # 结构畸形、无法验证的输出
+        return False
+    
+    def close(self):
+        """停止沙箱进程池"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """静态检查缓存与执行结果缓存的命中统计"""
+        return {
+            "checker": self.checker.stats(),
+            "results": self.cache.stats() if self.cache is not None else None,
+        }
     
     def validate_imports(self, code: str) -> tuple[bool, list[str]]:
         """
-        检查代码中的导入语句
+        静态检查代码：危险导入与调用、组件类型、连线端口
         
         Args:
             code: Python 代码
@@ -98,20 +197,7 @@ class ExecutionTool:
         Returns:
             (是否安全, 警告列表)
         """
-        warnings = []
-        
-        # TODO: 实现导入安全检查
-        # 危险模块黑名单
-        # dangerous_modules = ['os', 'subprocess', 'sys', 'socket', 'requests']
-        
-        # 使用 ast 模块解析代码，提取 import 语句
-        # import ast
-        # tree = ast.parse(code)
-        # for node in ast.walk(tree):
-        #     if isinstance(node, ast.Import):
-        #         for alias in node.names:
-        #             if alias.name in dangerous_modules:
-        #                 warnings.append(f"检测到危险模块导入: {alias.name}")
+        warnings = self.checker.check(code).errors
         
         return len(warnings) == 0, warnings
     
@@ -126,9 +212,15 @@ class ExecutionTool:
             更新后的状态
         """
         code = state.get("generated_code", "")
+        candidates = state.get("candidate_codes") or []
         
-        # 执行代码
-        execution_result = self.execute_code(code)
+        # 执行代码；有多个候选时并行执行，采用第一个生成有效流程图的候选
+        if len(candidates) > 1:
+            execution_result = self.execute_many(candidates, mode="first_success")
+            state["generated_code"] = candidates[execution_result["index"]]
+            state["candidate_codes"] = []  # 已选定；调试后的重试执行修正后的 generated_code
+        else:
+            execution_result = self.execute_code(code)
         
         # 更新状态
         state["execution_result"] = execution_result
@@ -173,6 +265,47 @@ x = 1 / 0  # 会抛出 ZeroDivisionError
     print(f"错误: {result2['error']['type']}")
     print(f"消息: {result2['error']['message']}")
     print()
+    
+    # 测试用例3：死循环在超时后被终止
+    test_code_3 = '''
+while True:
+    pass
+'''
+    
+    print("测试用例3：超时终止")
+    tool.timeout = 2
+    result3 = tool.execute_code(test_code_3)
+    print(f"成功: {result3['success']}")
+    print(f"错误: {result3['error']['type']}，耗时 {result3['elapsed']:.2f} 秒")
+    print()
+    
+    # 重复执行相同代码时直接读取结果缓存（超时结果不缓存）
+    print("重复执行测试用例1")
+    result1 = tool.execute_code(test_code_1)
+    print(f"命中缓存: {result1.get('cached', False)}，统计: {tool.stats()['results']}")
+    print()
+    
+    # 测试用例4：多个候选并行执行，第一个成功后取消其余候选
+    flow_code = '''
+from kong_sdk import FlowBuilder
+
+def generate_flow():
+    flow = FlowBuilder()
+    temp = flow.add_node("swInput", "温度")
+    alarm = flow.add_node("compare", "高温报警", tripPoint=30)
+    temp.connect(alarm)
+    return flow
+'''
+    candidates = [test_code_3, test_code_2, flow_code]
+    
+    print("测试用例4：多候选并行执行")
+    best = tool.execute_many(candidates, mode="first_success")
+    print(f"采用候选: {best['index']}，成功: {best['success']}，耗时 {best['elapsed']:.2f} 秒")
+    for index, result in enumerate(tool.execute_many(candidates, mode="all")):
+        error = result["error"]["type"] if result["error"] else None
+        print(f"  候选 {index}: 成功={result['success']} 错误={error}")
+    print()
+    tool.close()
 
 
 if __name__ == "__main__":
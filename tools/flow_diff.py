@@ -0,0 +1,421 @@
+"""
+组态差异工具 (Flow Diff)
+职责：比较两个流程图的结构差异，生成可应用的增量补丁
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Union, Set
+
+from kong_sdk import FlowBuilder, KongNode, SUBFLOW_IN, SUBFLOW_OUT
+
+
+FlowSource = Union[FlowBuilder, Dict[str, Any], List[Dict[str, Any]], str, Path]
+
+# SDK 导出格式（export_json）中不属于节点参数的字段
+_SDK_NODE_FIELDS = frozenset({"id", "type", "name", "x", "y", "wires"})
+
+# 按邻域细化签名的最大轮数（每轮都会利用上一轮新匹配的节点作为锚点）
+_REFINE_ROUNDS = 4
+
+
+class _Snapshot:
+    """流程图的规范化快照：节点按编号存放，连线为 (源, 输出端口, 目标, 输入端口) 四元组"""
+
+    __slots__ = ("ids", "types", "names", "params", "z", "xs", "ys", "wires", "containers", "index")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.types: List[str] = []
+        self.names: List[str] = []
+        self.params: List[Dict[str, Any]] = []
+        self.z: List[Optional[str]] = []  # 所属容器 ID，未指定为 None
+        self.xs: List[float] = []
+        self.ys: List[float] = []
+        self.wires: List[Tuple[int, int, int, int]] = []
+        self.containers: List[Dict[str, Any]] = []
+        self.index: Dict[str, int] = {}
+
+    def add(self, node_id: str, node_type: str, name: str, params: Dict[str, Any],
+            z: Optional[str] = None, x: float = 0, y: float = 0) -> int:
+        index = len(self.ids)
+        self.ids.append(node_id)
+        self.types.append(node_type)
+        self.names.append(name)
+        self.params.append(params)
+        self.z.append(z)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.index[node_id] = index
+        return index
+
+    @classmethod
+    def of(cls, source: FlowSource) -> '_Snapshot':
+        """从 FlowBuilder、SDK 导出的 JSON 字典，或原生格式的文件路径 / 元素列表构建快照"""
+        if isinstance(source, dict):
+            return cls._from_sdk_json(source)
+        flow = source if isinstance(source, FlowBuilder) else FlowBuilder.load_kongcube(source)
+        snapshot = cls()
+        snapshot.containers = [dict(container) for container in flow._containers]
+        container_ids = [container["id"] for container in flow._containers]
+        for index in range(len(flow._ids)):
+            container = flow._z[index]
+            snapshot.add(flow._ids[index], flow._type_names[flow._types[index]], flow._names[index],
+                         dict(flow._params[index] or {}),
+                         container_ids[container] if container >= 0 else None,
+                         flow._xs[index], flow._ys[index])
+        snapshot.wires = list(zip(flow._wire_source, flow._wire_source_port,
+                                  flow._wire_target, flow._wire_target_port))
+        return snapshot
+
+    @classmethod
+    def _from_sdk_json(cls, data: Dict[str, Any]) -> '_Snapshot':
+        snapshot = cls()
+        for node in data.get("nodes", []):
+            snapshot.add(node["id"], node.get("type", ""), node.get("name", ""),
+                         {k: v for k, v in node.items() if k not in _SDK_NODE_FIELDS},
+                         None, node.get("x", 0), node.get("y", 0))
+        for wire in data.get("wires", []):
+            source, target = snapshot.index.get(wire.get("source")), snapshot.index.get(wire.get("target"))
+            if source is None or target is None:
+                raise ValueError(f"连线引用了不存在的节点: {wire}")
+            snapshot.wires.append((source, wire.get("sourcePort", 0), target, wire.get("targetPort", 0)))
+        return snapshot
+
+
+def _match_nodes(old: _Snapshot, new: _Snapshot) -> Dict[int, int]:
+    """
+    匹配两个快照中的节点，返回 {新节点编号: 旧节点编号}
+
+    1. ID 相同且类型相同的节点直接匹配；
+    2. 其余节点按 (类型, 名称) 分组，用邻域签名逐轮细化（已匹配的邻居作为锚点），
+       签名在两侧都唯一时匹配；
+    3. 仍未区分的同组节点优先配对参数相同者，再按出现顺序配对。
+    """
+    matched: Dict[int, int] = {}
+    for j, node_id in enumerate(new.ids):
+        i = old.index.get(node_id)
+        if i is not None and old.types[i] == new.types[j]:
+            matched[j] = i
+    used = set(matched.values())
+
+    def neighbors(snapshot: _Snapshot) -> Tuple[List[List[tuple]], List[List[tuple]]]:
+        incoming: List[List[tuple]] = [[] for _ in snapshot.ids]
+        outgoing: List[List[tuple]] = [[] for _ in snapshot.ids]
+        for source, source_port, target, target_port in snapshot.wires:
+            incoming[target].append((target_port, source, source_port))
+            outgoing[source].append((source_port, target, target_port))
+        return incoming, outgoing
+
+    old_in, old_out = neighbors(old)
+    new_in, new_out = neighbors(new)
+
+    for _ in range(_REFINE_ROUNDS):
+        reverse = {i: j for j, i in matched.items()}
+
+        def signature(snapshot, incoming, outgoing, index, anchor):
+            def key(neighbor):
+                anchored = anchor(neighbor)
+                return ("m", anchored) if anchored is not None else \
+                    (snapshot.types[neighbor], snapshot.names[neighbor])
+            return (snapshot.types[index], snapshot.names[index],
+                    tuple(sorted((p, key(n), q) for p, n, q in incoming[index])),
+                    tuple(sorted((p, key(n), q) for p, n, q in outgoing[index])))
+
+        old_groups: Dict[tuple, List[int]] = {}
+        for i in range(len(old.ids)):
+            if i not in used:
+                sig = signature(old, old_in, old_out, i, lambda n: n if n in reverse else None)
+                old_groups.setdefault(sig, []).append(i)
+        new_groups: Dict[tuple, List[int]] = {}
+        for j in range(len(new.ids)):
+            if j not in matched:
+                sig = signature(new, new_in, new_out, j, matched.get)
+                new_groups.setdefault(sig, []).append(j)
+
+        progress = False
+        for sig, js in new_groups.items():
+            candidates = old_groups.get(sig)
+            if candidates and len(candidates) == 1 and len(js) == 1:
+                matched[js[0]] = candidates[0]
+                used.add(candidates[0])
+                progress = True
+        if not progress:
+            break
+
+    # 同 (类型, 名称) 的剩余节点：参数完全相同者优先，其余按出现顺序配对
+    leftovers: Dict[Tuple[str, str], List[int]] = {}
+    for i in range(len(old.ids)):
+        if i not in used:
+            leftovers.setdefault((old.types[i], old.names[i]), []).append(i)
+    pending = [j for j in range(len(new.ids)) if j not in matched]
+    for exact in (True, False):
+        for j in pending:
+            if j in matched:
+                continue
+            candidates = leftovers.get((new.types[j], new.names[j]), [])
+            for position, i in enumerate(candidates):
+                if not exact or old.params[i] == new.params[j]:
+                    matched[j] = i
+                    del candidates[position]
+                    break
+    return matched
+
+
+class FlowPatch:
+    """
+    流程图增量补丁（以旧图为基准）
+
+    已匹配节点用旧 ID 引用，新增节点用新 ID；坐标不参与比较（由布局重新计算）。
+    """
+
+    def __init__(self):
+        self.added_nodes: List[Dict[str, Any]] = []  # {id, type, name, params, z}
+        self.removed_nodes: List[str] = []
+        self.modified_nodes: List[Dict[str, Any]] = []  # {id, name?, z?, set, unset}
+        self.added_wires: List[Tuple[str, int, str, int]] = []
+        self.removed_wires: List[Tuple[str, int, str, int]] = []
+        self.added_containers: List[Dict[str, Any]] = []
+        self.removed_containers: List[str] = []
+        self.renamed_ids: Dict[str, str] = {}  # 新图节点 ID -> 旧图节点 ID（仅 ID 不同的匹配节点）
+
+    def __len__(self) -> int:
+        """补丁包含的操作数（不含 ID 对应关系）"""
+        return (len(self.added_nodes) + len(self.removed_nodes) + len(self.modified_nodes)
+                + len(self.added_wires) + len(self.removed_wires)
+                + len(self.added_containers) + len(self.removed_containers))
+
+    def is_empty(self) -> bool:
+        """两图结构是否相同"""
+        return len(self) == 0
+
+    def touched(self) -> Set[str]:
+        """受影响的节点 ID（旧图 ID 空间）：增删改的节点及增删连线的两端"""
+        nodes = {node["id"] for node in self.added_nodes}
+        nodes.update(self.removed_nodes)
+        nodes.update(node["id"] for node in self.modified_nodes)
+        for source, _, target, _ in self.added_wires + self.removed_wires:
+            nodes.add(source)
+            nodes.add(target)
+        return nodes
+
+    def to_dict(self) -> Dict[str, Any]:
+        """紧凑的 JSON 表示，省略空的部分"""
+        data = {
+            "nodes": {"add": self.added_nodes, "remove": self.removed_nodes, "modify": self.modified_nodes},
+            "wires": {"add": [list(w) for w in self.added_wires],
+                      "remove": [list(w) for w in self.removed_wires]},
+            "containers": {"add": self.added_containers, "remove": self.removed_containers},
+        }
+        data = {section: {k: v for k, v in ops.items() if v} for section, ops in data.items()}
+        data = {section: ops for section, ops in data.items() if ops}
+        if self.renamed_ids:
+            data["ids"] = self.renamed_ids
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'FlowPatch':
+        patch = cls()
+        nodes, wires, containers = (data.get(section, {}) for section in ("nodes", "wires", "containers"))
+        patch.added_nodes = list(nodes.get("add", []))
+        patch.removed_nodes = list(nodes.get("remove", []))
+        patch.modified_nodes = list(nodes.get("modify", []))
+        patch.added_wires = [tuple(w) for w in wires.get("add", [])]
+        patch.removed_wires = [tuple(w) for w in wires.get("remove", [])]
+        patch.added_containers = list(containers.get("add", []))
+        patch.removed_containers = list(containers.get("remove", []))
+        patch.renamed_ids = dict(data.get("ids", {}))
+        return patch
+
+    def describe(self, base: Optional[FlowSource] = None) -> List[str]:
+        """
+        人类可读的差异列表，供评审与调试记录使用
+
+        Args:
+            base: 旧图（可选），提供时连线和删除的节点显示为节点名称
+        """
+        names: Dict[str, str] = {}
+        if base is not None:
+            snapshot = _Snapshot.of(base)
+            names = dict(zip(snapshot.ids, snapshot.names))
+        names.update((node["id"], node["name"]) for node in self.added_nodes)
+        label = lambda node_id: names.get(node_id, node_id)
+
+        lines = [f"+ 节点 {node['name']} ({node['type']})" for node in self.added_nodes]
+        lines += [f"- 节点 {label(node_id)}" for node_id in self.removed_nodes]
+        for node in self.modified_nodes:
+            changes = [f"{k}={json.dumps(v, ensure_ascii=False)}" for k, v in node.get("set", {}).items()]
+            changes += [f"删除 {k}" for k in node.get("unset", [])]
+            if "name" in node:
+                changes.insert(0, f"名称→{node['name']}")
+            if "z" in node:
+                changes.append(f"容器→{node['z']}")
+            lines.append(f"~ 节点 {label(node['id'])}: " + ", ".join(changes))
+        lines += [f"+ 连线 {label(s)}[{sp}] -> {label(t)}[{tp}]" for s, sp, t, tp in self.added_wires]
+        lines += [f"- 连线 {label(s)}[{sp}] -> {label(t)}[{tp}]" for s, sp, t, tp in self.removed_wires]
+        lines += [f"+ 容器 {c.get('label') or c.get('name', '')} ({c['type']})" for c in self.added_containers]
+        lines += [f"- 容器 {container_id}" for container_id in self.removed_containers]
+        return lines
+
+    def apply(self, base: FlowSource, compact: bool = False) -> FlowBuilder:
+        """
+        将补丁应用到旧图，得到与新图结构相同的 FlowBuilder
+
+        保留的节点沿用旧 ID 与坐标，可直接交给增量布局 / 验证处理 touched() 区域。
+
+        Raises:
+            ValueError: 补丁引用了基准图中不存在的节点或连线
+            CycleError: 应用后出现循环依赖
+        """
+        snapshot = _Snapshot.of(base)
+        removed = set(self.removed_nodes)
+        for node_id in removed | {node["id"] for node in self.modified_nodes}:
+            if node_id not in snapshot.index:
+                raise ValueError(f"补丁与基准流程图不匹配: 节点 {node_id} 不存在")
+
+        flow = FlowBuilder(compact=compact)
+        removed_containers = set(self.removed_containers)
+        for container in snapshot.containers + self.added_containers:
+            if container["id"] not in removed_containers:
+                flow._add_container(dict(container))
+
+        modifications = {node["id"]: node for node in self.modified_nodes}
+        index_by_id: Dict[str, int] = {}
+
+        def append(node_id, node_type, name, params, z, x=0, y=0):
+            container = flow._container_index.get(z, -1) if z is not None else -1
+            index = flow._append_node(node_type, name, params, node_id=node_id, container=container)
+            flow._xs[index] = x
+            flow._ys[index] = y
+            if node_type in (SUBFLOW_IN, SUBFLOW_OUT) and container >= 0:
+                flow._port_counts.setdefault(container, [0, 0])[node_type == SUBFLOW_OUT] += 1
+            index_by_id[node_id] = index
+
+        for i, node_id in enumerate(snapshot.ids):
+            if node_id in removed:
+                continue
+            name, params, z = snapshot.names[i], snapshot.params[i], snapshot.z[i]
+            change = modifications.get(node_id)
+            if change is not None:
+                name = change.get("name", name)
+                z = change.get("z", z)
+                params = {k: v for k, v in params.items() if k not in set(change.get("unset", []))}
+                params.update(change.get("set", {}))
+            append(node_id, snapshot.types[i], name, params, z, snapshot.xs[i], snapshot.ys[i])
+        for node in self.added_nodes:
+            append(node["id"], node["type"], node["name"], dict(node.get("params", {})), node.get("z"))
+
+        wires = {(snapshot.ids[s], sp, snapshot.ids[t], tp): None for s, sp, t, tp in snapshot.wires}
+        for wire in self.removed_wires:
+            if tuple(wire) not in wires:
+                raise ValueError(f"补丁与基准流程图不匹配: 连线 {wire} 不存在")
+            del wires[tuple(wire)]
+        # 只丢弃基准图中连到已删除节点的连线；同一 ID 删除后重新添加（如类型变化）的节点的新连线保留
+        wires = {wire: None for wire in wires if wire[0] not in removed and wire[2] not in removed}
+        for wire in self.added_wires:
+            wires[tuple(wire)] = None
+
+        edges = []
+        for source, source_port, target, target_port in wires:
+            if source not in index_by_id or target not in index_by_id:
+                raise ValueError(f"补丁与基准流程图不匹配: 连线 {source} -> {target} 的端点不存在")
+            edges.append((index_by_id[source], source_port, index_by_id[target], target_port))
+        flow._set_topological_order([(u, v) for u, _, v, _ in edges])
+        for u, out_port, v, in_port in edges:
+            flow._append_wire(u, v, out_port, in_port)
+        if not compact:
+            flow.nodes = [KongNode._view(flow, i) for i in range(len(flow._ids))]
+        return flow
+
+
+def diff_flows(old: FlowSource, new: FlowSource) -> FlowPatch:
+    """
+    比较两个流程图，生成把旧图变为新图的补丁
+
+    Args:
+        old: 旧图（FlowBuilder、SDK 导出的 JSON 字典，或原生格式的文件路径 / 元素列表）
+        new: 新图，格式同上
+
+    Returns:
+        FlowPatch
+    """
+    before, after = _Snapshot.of(old), _Snapshot.of(new)
+    matched = _match_nodes(before, after)
+    patch = FlowPatch()
+
+    # 新图节点在补丁中的 ID：已匹配的沿用旧 ID
+    ids = [before.ids[matched[j]] if j in matched else after.ids[j] for j in range(len(after.ids))]
+    kept = set(matched.values())
+
+    patch.removed_nodes = [before.ids[i] for i in range(len(before.ids)) if i not in kept]
+    for j in range(len(after.ids)):
+        if j not in matched:
+            patch.added_nodes.append({"id": ids[j], "type": after.types[j], "name": after.names[j],
+                                      "params": after.params[j], "z": after.z[j]})
+            continue
+        i = matched[j]
+        if after.ids[j] != before.ids[i]:
+            patch.renamed_ids[after.ids[j]] = before.ids[i]
+        change: Dict[str, Any] = {}
+        if after.names[j] != before.names[i]:
+            change["name"] = after.names[j]
+        if after.z[j] != before.z[i]:
+            change["z"] = after.z[j]
+        old_params, new_params = before.params[i], after.params[j]
+        updated = {k: v for k, v in new_params.items() if k not in old_params or old_params[k] != v}
+        if updated:
+            change["set"] = updated
+        unset = [k for k in old_params if k not in new_params]
+        if unset:
+            change["unset"] = unset
+        if change:
+            patch.modified_nodes.append({"id": before.ids[i], **change})
+
+    # 连到已删除节点的旧连线随节点一起删除，不单独记录；同一 ID 重新添加的节点的连线全部记为新增
+    removed = set(patch.removed_nodes)
+    old_wires = {(before.ids[s], sp, before.ids[t], tp): None for s, sp, t, tp in before.wires
+                 if before.ids[s] not in removed and before.ids[t] not in removed}
+    new_wires = {(ids[s], sp, ids[t], tp): None for s, sp, t, tp in after.wires}
+    patch.removed_wires = [w for w in old_wires if w not in new_wires]
+    patch.added_wires = [w for w in new_wires if w not in old_wires]
+
+    old_containers = {c["id"]: c for c in before.containers}
+    new_containers = {c["id"]: c for c in after.containers}
+    patch.removed_containers = [c for c in old_containers if c not in new_containers]
+    patch.added_containers = [c for cid, c in new_containers.items() if cid not in old_containers]
+    return patch
+
+
+# 独立测试函数
+def test_flow_diff():
+    """测试差异工具：修改样例模块中的一个阈值并新增一个节点"""
+    sample = Path(__file__).resolve().parent.parent / "json" / \
+        "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    old = FlowBuilder.load_kongcube(sample)
+
+    items = json.loads(sample.read_text(encoding="utf-8"))
+    compare = next(item for item in items if item.get("type") == "compare")
+    compare["as"] = "g"
+    items.append({"id": "a1b2c3d", "type": "comment", "z": compare["z"], "name": "说明",
+                  "x": 0, "y": 0, "wires": []})
+    new = FlowBuilder.load_kongcube(items)
+
+    patch = diff_flows(old, new)
+    print(f"操作数: {len(patch)}，受影响节点: {sorted(patch.touched())}")
+    for line in patch.describe(old):
+        print(line)
+    print("应用补丁后无差异:", diff_flows(patch.apply(old), new).is_empty())
+
+    # 节点 ID 不变、类型变化（记为删除后重新添加）时连线保留
+    def native(node_type):
+        return [{"id": "t1", "type": "tab", "label": "流程"},
+                {"id": "n1", "type": "swInput", "z": "t1", "name": "温度", "wires": []},
+                {"id": "n2", "type": node_type, "z": "t1", "name": "运算",
+                 "wires": [[{"id": "n1", "port": 0}], []]}]
+    base, target = FlowBuilder.load_kongcube(native("compare")), FlowBuilder.load_kongcube(native("add"))
+    applied = diff_flows(base, target).apply(base)
+    print(f"类型变化: 连线 {len(applied._wire_source)} / {len(target._wire_source)}，"
+          f"应用补丁后无差异: {diff_flows(applied, target).is_empty()}")
+
+
+if __name__ == "__main__":
+    test_flow_diff()
@@ -0,0 +1,754 @@
+"""
+组态仿真工具 (Flow Simulator)
+职责：将流程图编译为按拓扑序排列的 NumPy 运算程序，批量求值大量输入场景，
+      并对定时、累计、锁存等有状态组件进行定步长离散时间仿真
+"""
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Union
+
+import numpy as np
+
+from kong_sdk import FlowBuilder, CycleError, SUBFLOW_IN, SUBFLOW_OUT, get_registry
+
+
+# 引用组件的 labelName 格式："[节点ID:输出端口] 名称"
+_QUOTE_LABEL = re.compile(r"^\[([^:\]]+):(\d+)\]")
+
+# 作为外部输入的组件：未接入上游时，其值由场景提供（缺省取默认值字段）
+_SOURCE_DEFAULTS = {
+    "swInput": "swInputDefault",
+    "hwInput": "hwInputDefault",
+    SUBFLOW_IN: None,
+}
+
+# 不参与计算的组件
+_IGNORED_TYPES = frozenset({"comment"})
+
+
+class FlowProgram:
+    """
+    编译后的求值程序
+
+    每个节点的每个输出端口对应值矩阵中的一行（slot），
+    ops 按拓扑序排列，每条指令写入自己的输出行。
+    """
+
+    def __init__(self, flow: FlowBuilder):
+        self.flow = flow
+        self.slot_count = 0
+        self.ops: List[Tuple[str, int, List[List[int]], Dict[str, Any], List[int]]] = []
+        self.inputs: Dict[str, int] = {}  # 外部输入名称 / 节点 ID -> slot
+        self.input_defaults: Dict[int, float] = {}
+        self.outputs: Dict[str, int] = {}  # subflow 输出端口名称 -> slot
+        self.node_slots: Dict[str, List[int]] = {}  # 节点 ID -> 各输出端口的 slot
+        self.names: Dict[str, List[str]] = {}  # 节点名称 -> 节点 ID 列表
+
+    def resolve(self, key: str) -> int:
+        """按 subflow 输出端口名、外部输入名、节点 ID、唯一节点名的顺序查找 slot"""
+        if key in self.outputs:
+            return self.outputs[key]
+        if key in self.inputs:
+            return self.inputs[key]
+        if key in self.node_slots:
+            return self.node_slots[key][0]
+        ids = self.names.get(key, [])
+        if len(ids) == 1:
+            return self.node_slots[ids[0]][0]
+        if ids:
+            raise KeyError(f"名称 {key} 对应多个节点，请改用节点 ID: {ids}")
+        raise KeyError(f"找不到输入/输出: {key}")
+
+
+def compile_flow(source: Union[FlowBuilder, str, Path, List[Dict[str, Any]]],
+                 supported: Optional[Dict[str, Any]] = None) -> FlowProgram:
+    """
+    将流程图编译为求值程序
+
+    引用（quote）组件按 labelName 解析为对被引用节点输出的别名，
+    并作为隐式依赖参与拓扑排序。
+
+    Args:
+        source: FlowBuilder，或原生格式的文件路径 / 元素列表
+        supported: 组件类型 -> 求值函数表，默认使用无状态组件表
+
+    Returns:
+        FlowProgram
+
+    Raises:
+        NotImplementedError: 流程图包含不支持仿真的组件
+        CycleError: 考虑引用关系后存在循环依赖
+    """
+    flow = source if isinstance(source, FlowBuilder) else FlowBuilder.load_kongcube(source)
+    supported = STATELESS_OPS if supported is None else supported
+    registry = get_registry()
+    program = FlowProgram(flow)
+    node_count = len(flow._ids)
+
+    # 1. 收集每个节点按输入端口排列的上游 (节点, 输出端口)，以及引用组件的被引用端口
+    inputs_of: List[Dict[int, List[Tuple[int, int]]]] = [{} for _ in range(node_count)]
+    for wire in range(len(flow._wire_source)):
+        target = flow._wire_target[wire]
+        inputs_of[target].setdefault(flow._wire_target_port[wire], []).append(
+            (flow._wire_source[wire], flow._wire_source_port[wire])
+        )
+
+    quote_refs: Dict[int, Tuple[int, int]] = {}
+    for index in range(node_count):
+        node_type = flow._type_names[flow._types[index]]
+        if node_type == "quote":
+            match = _QUOTE_LABEL.match(str((flow._params[index] or {}).get("labelName", "")))
+            target = flow.get_node(match.group(1)) if match else None
+            if target is None:
+                raise ValueError(f"引用组件 {flow._ids[index]} 的被引用节点不存在")
+            quote_refs[index] = (target._index, int(match.group(2)))
+        elif node_type not in supported and node_type not in _IGNORED_TYPES:
+            raise NotImplementedError(f"仿真暂不支持组件类型: {node_type}")
+
+    # 2. 含引用依赖的拓扑排序（Kahn）
+    succ: List[List[int]] = [[] for _ in range(node_count)]
+    indegree = [0] * node_count
+    for target, ports in enumerate(inputs_of):
+        for sources in ports.values():
+            for source, _ in sources:
+                succ[source].append(target)
+                indegree[target] += 1
+    for quote, (target, _) in quote_refs.items():
+        succ[target].append(quote)
+        indegree[quote] += 1
+    order = [v for v in range(node_count) if indegree[v] == 0]
+    for v in order:
+        for w in succ[v]:
+            indegree[w] -= 1
+            if indegree[w] == 0:
+                order.append(w)
+    if len(order) < node_count:
+        raise CycleError("考虑引用关系后流程图存在循环依赖，无法按无状态方式求值")
+
+    # 3. 按拓扑序分配 slot 并生成指令；引用组件直接复用被引用端口的 slot
+    slots: Dict[int, List[int]] = {}
+    for index in order:
+        node_id = flow._ids[index]
+        node_type = flow._type_names[flow._types[index]]
+        params = flow._params[index] or {}
+        program.names.setdefault(flow._names[index], []).append(node_id)
+
+        if index in quote_refs:
+            target, port = quote_refs[index]
+            slots[index] = [slots[target][port]]
+            program.node_slots[node_id] = slots[index]
+            continue
+        if node_type in _IGNORED_TYPES:
+            continue
+
+        spec = registry.get(node_type)
+        output_count = max(spec.outputs if spec else 1,
+                           max((flow._wire_source_port[w] + 1 for w in flow._out_wires(index)), default=1))
+        slots[index] = list(range(program.slot_count, program.slot_count + output_count))
+        program.slot_count += output_count
+        program.node_slots[node_id] = slots[index]
+
+        port_slots = {port: [slots[s][p] for s, p in sources]
+                      for port, sources in inputs_of[index].items()}
+        in_slots = [port_slots.get(port, []) for port in range(max(port_slots, default=-1) + 1)]
+
+        if node_type in _SOURCE_DEFAULTS and not in_slots:
+            # 未接入上游的变量 / 端口：由场景提供输入
+            default_field = _SOURCE_DEFAULTS[node_type]
+            program.input_defaults[slots[index][0]] = float(params.get(default_field, 0) or 0) \
+                if default_field else 0.0
+            program.inputs.setdefault(flow._names[index], slots[index][0])
+            program.inputs[node_id] = slots[index][0]
+            node_type = "input"
+        if node_type == SUBFLOW_OUT:
+            program.outputs[flow._names[index]] = slots[index][0]
+
+        program.ops.append((node_type, index, in_slots, params, slots[index]))
+
+    return program
+
+
+# ========== 无状态组件求值函数 ==========
+# 签名：fn(inputs, params, n) -> 输出数组或输出数组列表
+#   inputs: 按输入端口排列的数组（未连接为 None）
+
+def _port(inputs: List[Optional[np.ndarray]], port: int, default: float, n: int) -> np.ndarray:
+    """读取输入端口，未连接时返回常数数组"""
+    if port < len(inputs) and inputs[port] is not None:
+        return inputs[port]
+    return np.full(n, float(default))
+
+
+def _connected(inputs: List[Optional[np.ndarray]]) -> List[np.ndarray]:
+    return [value for value in inputs if value is not None]
+
+
+def _fixed(params: Dict[str, Any]) -> float:
+    return float(params.get("fixedValue", 0) or 0)
+
+
+def _op_add(inputs, params, n):
+    values = _connected(inputs)
+    if len(values) < 2:
+        values.append(np.full(n, _fixed(params)))
+    return np.sum(values, axis=0)
+
+
+def _op_multiply(inputs, params, n):
+    values = _connected(inputs)
+    if len(values) < 2:
+        values.append(np.full(n, _fixed(params)))
+    return np.prod(values, axis=0)
+
+
+def _op_subtract(inputs, params, n):
+    return _port(inputs, 0, 0, n) - _port(inputs, 1, _fixed(params), n)
+
+
+def _op_divide(inputs, params, n):
+    numerator = _port(inputs, 0, 0, n)
+    denominator = _port(inputs, 1, _fixed(params), n)
+    # 除数为 0 时输出 0，与控制器行为一致，避免 inf/nan 扩散
+    return np.divide(numerator, denominator, out=np.zeros(n), where=denominator != 0)
+
+
+_COMPARATORS = {
+    "g": np.greater,
+    "ge": np.greater_equal,
+    "l": np.less,
+    "le": np.less_equal,
+    "e": np.equal,
+    "ne": np.not_equal,
+}
+
+
+def _op_compare(inputs, params, n):
+    trip_point = _port(inputs, 1, params.get("tripPoint", 0), n) if params.get("inputAuxEnable") \
+        else np.full(n, float(params.get("tripPoint", 0)))
+    return _COMPARATORS[params.get("as", "g")](_port(inputs, 0, 0, n), trip_point).astype(float)
+
+
+def _op_logic(inputs, params, n):
+    values = [value != 0 for value in _connected(inputs)] or [np.zeros(n, dtype=bool)]
+    kind = params.get("lType", "AND")
+    if kind == "NOT":
+        result = ~values[0]
+    elif kind in ("AND", "NAND"):
+        result = np.logical_and.reduce(values)
+    elif kind in ("OR", "NOR"):
+        result = np.logical_or.reduce(values)
+    elif kind == "XOR":
+        result = np.logical_xor.reduce(values)
+    else:
+        raise NotImplementedError(f"不支持的逻辑运算: {kind}")
+    if kind in ("NAND", "NOR"):
+        result = ~result
+    return result.astype(float)
+
+
+def _op_switch(inputs, params, n):
+    channels = int(params.get("channels", max(len(inputs) - 1, 1)))
+    selector = np.clip(np.rint(_port(inputs, 0, 0, n)), 0, channels - 1).astype(np.intp)
+    choices = np.stack([_port(inputs, 1 + channel, 0, n) for channel in range(channels)])
+    return np.take_along_axis(choices, selector[None, :], axis=0)[0]
+
+
+def _op_limit(inputs, params, n):
+    bound = _port(inputs, 1, params.get("constant", 0), n) if params.get("inputAuxEnable") \
+        else np.full(n, float(params.get("constant", 0)))
+    value = _port(inputs, 0, 0, n)
+    return np.minimum(value, bound) if params.get("as", "high") == "high" else np.maximum(value, bound)
+
+
+def _op_linear(inputs, params, n):
+    in_low, in_high = float(params.get("inputA", 0)), float(params.get("inputB", 100))
+    out_low, out_high = float(params.get("outputX", 0)), float(params.get("outputY", 100))
+    value = _port(inputs, 0, 0, n)
+    if in_high == in_low:
+        return np.full(n, out_low)
+    return out_low + (value - in_low) * (out_high - out_low) / (in_high - in_low)
+
+
+_ROUNDERS = {
+    "round45": lambda value: np.floor(value + 0.5),
+    "roundUp": np.ceil,
+    "roundDown": np.floor,
+}
+
+
+def _op_round(inputs, params, n):
+    return _ROUNDERS[params.get("mode", "round45")](_port(inputs, 0, 0, n))
+
+
+def _op_const(inputs, params, n):
+    return np.full(n, _fixed(params))
+
+
+def _op_passthrough(inputs, params, n):
+    value = _port(inputs, 0, 0, n)
+    return [value, value]
+
+
+def _op_latch(inputs, params, n):
+    # 无状态求值视为上电后的第一次扫描：使能时跟随输入，否则保持初始值 0
+    return np.where(_port(inputs, 1, 0, n) != 0, _port(inputs, 0, 0, n), 0.0)
+
+
+STATELESS_OPS = {
+    "add": _op_add,
+    "subtract": _op_subtract,
+    "multiply": _op_multiply,
+    "divide": _op_divide,
+    "compare": _op_compare,
+    "logic": _op_logic,
+    "switch": _op_switch,
+    "limit": _op_limit,
+    "linear": _op_linear,
+    "round": _op_round,
+    "constInput": _op_const,
+    "latch": _op_latch,
+    "swInput": _op_passthrough,
+    "hwInput": _op_passthrough,
+    SUBFLOW_IN: _op_passthrough,
+    SUBFLOW_OUT: _op_passthrough,
+}
+
+
+def _store(values: np.ndarray, out_slots: List[int], result: Any, params: Dict[str, Any]):
+    """写入组件输出；停用（outOfService）的组件输出 outOfServiceValue"""
+    if params.get("outOfService"):
+        values[out_slots] = float(params.get("outOfServiceValue", 0) or 0)
+        return
+    if isinstance(result, list):
+        for slot, value in zip(out_slots, result):
+            values[slot] = value.reshape(-1)
+    else:
+        values[out_slots[0]] = result.reshape(-1)
+
+
+class FlowEvaluator:
+    """无状态批量求值器：一次向量化运算完成所有输入场景"""
+
+    def __init__(self, source: Union[FlowBuilder, str, Path, List[Dict[str, Any]]]):
+        """
+        编译流程图
+
+        Args:
+            source: FlowBuilder，或原生格式的文件路径 / 元素列表
+        """
+        self.program = compile_flow(source, STATELESS_OPS)
+
+    def evaluate(self, scenarios: Dict[str, Any]) -> 'Evaluation':
+        """
+        批量求值
+
+        Args:
+            scenarios: 外部输入名称（或节点 ID）-> 标量或一维数组；
+                       数组长度即场景数，标量会广播到所有场景，未给出的输入取默认值
+
+        Returns:
+            Evaluation，可按输出端口名 / 节点名 / 节点 ID 取各场景的结果
+        """
+        program = self.program
+        arrays = {key: np.asarray(value, dtype=float) for key, value in scenarios.items()}
+        n = max((array.size for array in arrays.values() if array.ndim > 0), default=1)
+
+        values = np.zeros((program.slot_count, n))
+        for slot, default in program.input_defaults.items():
+            values[slot] = default
+        for key, array in arrays.items():
+            if key not in program.inputs:
+                raise KeyError(f"未知的外部输入: {key}")
+            values[program.inputs[key]] = array
+
+        for node_type, _, in_slots, params, out_slots in program.ops:
+            if node_type == "input":
+                continue
+            inputs = [values[port[0]] if port else None for port in in_slots]
+            _store(values, out_slots, STATELESS_OPS[node_type](inputs, params, n), params)
+        return Evaluation(program, values)
+
+
+class Evaluation:
+    """求值结果：值矩阵的行按 slot 排列，列为场景"""
+
+    def __init__(self, program: FlowProgram, values: np.ndarray):
+        self.program = program
+        self.values = values
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.values[self.program.resolve(key)]
+
+    def outputs(self) -> Dict[str, np.ndarray]:
+        """所有 subflow 输出端口的结果"""
+        return {name: self.values[slot] for name, slot in self.program.outputs.items()}
+
+
+# ========== 有状态组件（离散时间仿真） ==========
+# 流程图编译后为有向无环图，因此每个组件可以沿时间轴一次处理整段数据：
+# 输入为 (时间步, 场景) 的二维数组，跨分段的状态保存在按场景预分配的数组中。
+# 签名：fn(inputs, params, state, ctx) -> 输出数组或输出数组列表
+
+_TIME_UNITS = {"seconds": 1.0, "minutes": 60.0, "hours": 3600.0, "days": 86400.0}
+
+
+class _StepContext:
+    """当前分段的时间信息"""
+    __slots__ = ("dt", "start", "steps", "scenarios")
+
+    def __init__(self, dt: float, start: int, steps: int, scenarios: int):
+        self.dt = dt
+        self.start = start  # 分段首个时间步的全局序号
+        self.steps = steps
+        self.scenarios = scenarios
+
+    def full(self, value: float) -> np.ndarray:
+        return np.full((self.steps, self.scenarios), float(value))
+
+
+def _timeout(inputs, params, ctx: _StepContext, value_field="timeout", unit_field="timeoutUnits",
+             from_input_field="timeoutFromInput") -> np.ndarray:
+    """以秒为单位的定时时长；*FromInput 时取第 2 个输入端口"""
+    unit = _TIME_UNITS.get(params.get(unit_field, "seconds"), 1.0)
+    if params.get(from_input_field) and len(inputs) > 1 and inputs[1] is not None:
+        return inputs[1] * unit
+    return ctx.full(float(params.get(value_field, 0) or 0) * unit)
+
+
+def _state(state: Dict[str, np.ndarray], key: str, initial: Any, ctx: _StepContext) -> np.ndarray:
+    """取出（首次时预分配）按场景存放的状态数组"""
+    if key not in state:
+        state[key] = np.empty(ctx.scenarios)
+        state[key][:] = initial
+    return state[key]
+
+
+def _previous(current: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """上一时间步的值：首行取上一分段末尾保存的状态"""
+    return np.concatenate((last[None, :], current[:-1]), axis=0)
+
+
+def _hold(events: np.ndarray, values: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """保持最近一次事件时刻的取值，分段内尚无事件时保持上一分段的输出"""
+    steps = np.arange(events.shape[0])[:, None]
+    index = np.maximum.accumulate(np.where(events, steps, -1), axis=0)
+    held = np.take_along_axis(values, np.maximum(index, 0), axis=0)
+    return np.where(index < 0, last[None, :], held)
+
+
+def _since(events: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """距最近一次事件经过的时间步数（事件当步为 0），last 为上一分段末尾的计数"""
+    steps = np.arange(events.shape[0])[:, None]
+    index = np.maximum.accumulate(np.where(events, steps, -1), axis=0)
+    return np.where(index < 0, last[None, :] + steps + 1, steps - index).astype(float)
+
+
+def _accumulate(increments: np.ndarray, reset: np.ndarray, reset_value: np.ndarray,
+                last: np.ndarray) -> np.ndarray:
+    """带复位的累加：复位当步输出复位值，之后在复位值上继续累加"""
+    total = np.cumsum(increments, axis=0)
+    base = _hold(reset, total - reset_value, -last)
+    return total - base
+
+
+def _edges(inputs, state, ctx):
+    """输入的上升沿 / 下降沿（首个分段以首个采样作为初始状态，避免上电误触发）"""
+    current = _port(inputs, 0, 0, (ctx.steps, ctx.scenarios)) != 0
+    last = _state(state, "input", current[0], ctx)
+    previous = _previous(current, last != 0)
+    last[:] = current[-1]
+    return current & ~previous, ~current & previous, current
+
+
+def _sim_delay_on(inputs, params, state, ctx):
+    current = _port(inputs, 0, 0, (ctx.steps, ctx.scenarios)) != 0
+    last = _state(state, "since_off", 0, ctx)
+    since_off = _since(~current, last)
+    last[:] = since_off[-1]
+    return (current & ((since_off - 1) * ctx.dt >= _timeout(inputs, params, ctx))).astype(float)
+
+
+def _sim_delay_off(inputs, params, state, ctx):
+    current = _port(inputs, 0, 0, (ctx.steps, ctx.scenarios)) != 0
+    last = _state(state, "since_on", np.inf, ctx)
+    since_on = _since(current, last)
+    last[:] = since_on[-1]
+    return (current | ((since_on - 1) * ctx.dt < _timeout(inputs, params, ctx))).astype(float)
+
+
+def _sim_delay_pulse(inputs, params, state, ctx):
+    rising, _, _ = _edges(inputs, state, ctx)
+    last = _state(state, "since_edge", np.inf, ctx)
+    since_edge = _since(rising, last)
+    last[:] = since_edge[-1]
+    remaining = _timeout(inputs, params, ctx) - since_edge * ctx.dt
+    if params.get("timeOutput"):
+        # 输出脉冲剩余时间（秒）
+        return np.maximum(remaining, 0.0)
+    return (remaining > 0).astype(float)
+
+
+def _sim_delay_out(inputs, params, state, ctx):
+    value = _port(inputs, 0, 0, (ctx.steps, ctx.scenarios))
+    period = np.maximum(_timeout(inputs, params, ctx), ctx.dt)
+    steps = np.arange(ctx.start, ctx.start + ctx.steps, dtype=float)[:, None]
+    # 每经过一个定时周期采样一次输入，其余时刻保持
+    sample = np.floor(steps * ctx.dt / period) > np.floor((steps - 1) * ctx.dt / period)
+    if ctx.start == 0:
+        sample[0] = True
+    last = _state(state, "output", 0, ctx)
+    output = _hold(sample, value, last)
+    last[:] = output[-1]
+    return output
+
+
+def _sim_counter(inputs, params, state, ctx):
+    rising, _, _ = _edges(inputs, state, ctx)
+    reset = _port(inputs, 1, 0, (ctx.steps, ctx.scenarios)) != 0
+    last = _state(state, "count", 0, ctx)
+    output = _accumulate(rising.astype(float), reset, np.zeros_like(rising, dtype=float), last)
+    last[:] = output[-1]
+    return output
+
+
+def _sim_integral(inputs, params, state, ctx):
+    shape = (ctx.steps, ctx.scenarios)
+    interval = float(params.get("interval", 60) or 60) * _TIME_UNITS.get(params.get("units", "seconds"), 1.0)
+    increments = _port(inputs, 0, 0, shape) * (ctx.dt / interval)
+    reset = _port(inputs, 1, 0, shape) != 0
+    default = _port(inputs, 2, 0, shape) if params.get("defaultFromInput") \
+        else ctx.full(params.get("defaultOutput", 0) or 0)
+    last = _state(state, "total", default[0], ctx)
+    high, low = float(params.get("highLimit", 0) or 0), float(params.get("lowLimit", 0) or 0)
+
+    if high > low:
+        # 限幅后的累加不再是线性前缀和，逐时间步计算（仍按场景向量化）
+        output = np.empty(shape)
+        total = last.copy()
+        for step in range(ctx.steps):
+            total = np.where(reset[step], default[step], np.clip(total + increments[step], low, high))
+            output[step] = total
+    else:
+        output = _accumulate(increments, reset, default, last)
+    last[:] = output[-1]
+    return output
+
+
+def _sim_runtime(inputs, params, state, ctx):
+    """输出 0：累计运行时间（小时）；输出 1：累计启动次数"""
+    rising, _, running = _edges(inputs, state, ctx)
+    reset = _port(inputs, 1, 0, (ctx.steps, ctx.scenarios)) != 0
+    zeros = np.zeros((ctx.steps, ctx.scenarios))
+    hours = _state(state, "hours", 0, ctx)
+    starts = _state(state, "starts", 0, ctx)
+    run_hours = _accumulate(running * (ctx.dt / 3600.0), reset, zeros, hours)
+    start_count = _accumulate(rising.astype(float), reset, zeros, starts)
+    hours[:] = run_hours[-1]
+    starts[:] = start_count[-1]
+    return [run_hours, start_count]
+
+
+def _sim_latch(inputs, params, state, ctx):
+    shape = (ctx.steps, ctx.scenarios)
+    last = _state(state, "output", 0, ctx)
+    output = _hold(_port(inputs, 1, 0, shape) != 0, _port(inputs, 0, 0, shape), last)
+    last[:] = output[-1]
+    return output
+
+
+def _flipflop(inputs, state, ctx, set_priority: bool):
+    shape = (ctx.steps, ctx.scenarios)
+    set_, reset = _port(inputs, 0, 0, shape) != 0, _port(inputs, 1, 0, shape) != 0
+    value = set_ if set_priority else set_ & ~reset
+    last = _state(state, "output", 0, ctx)
+    output = _hold(set_ | reset, value.astype(float), last)
+    last[:] = output[-1]
+    return output
+
+
+def _sim_rs_flipflop(inputs, params, state, ctx):
+    # RS 触发器复位优先
+    return _flipflop(inputs, state, ctx, set_priority=False)
+
+
+def _sim_sr_flipflop(inputs, params, state, ctx):
+    # SR 触发器置位优先
+    return _flipflop(inputs, state, ctx, set_priority=True)
+
+
+def _sim_edge_trigger(inputs, params, state, ctx):
+    rising, falling, _ = _edges(inputs, state, ctx)
+    mode = params.get("mode", "rising")
+    edges = rising if mode == "rising" else falling if mode == "falling" else rising | falling
+    return edges.astype(float)
+
+
+def _sim_hysteresis(inputs, params, state, ctx):
+    value = _port(inputs, 0, 0, (ctx.steps, ctx.scenarios))
+    on, off = float(params.get("onThreshold", 0)), float(params.get("offThreshold", 0))
+    # 开阈值不低于关阈值时为正作用（高于开阈值导通），否则为反作用
+    turn_on, turn_off = (value >= on, value <= off) if on >= off else (value <= on, value >= off)
+    last = _state(state, "output", 0, ctx)
+    output = _hold(turn_on | turn_off, turn_on.astype(float), last)
+    last[:] = output[-1]
+    return output
+
+
+STATEFUL_OPS = {
+    "delayOn": _sim_delay_on,
+    "delayOff": _sim_delay_off,
+    "delayPulse": _sim_delay_pulse,
+    "delayOut": _sim_delay_out,
+    "counter": _sim_counter,
+    "integral": _sim_integral,
+    "runtime": _sim_runtime,
+    "latch": _sim_latch,
+    "rsFlipflop": _sim_rs_flipflop,
+    "srFlipflop": _sim_sr_flipflop,
+    "edgeTrigger": _sim_edge_trigger,
+    "hysteresis": _sim_hysteresis,
+}
+
+SIMULATION_OPS = {**STATELESS_OPS, **STATEFUL_OPS}
+
+
+class FlowSimulator:
+    """
+    定步长离散时间仿真器
+
+    按时间分段回放趋势数据：无状态组件在整段 (时间步 × 场景) 上一次求值，
+    有状态组件沿时间轴扫描，跨分段的状态保存在按场景预分配的数组中。
+    """
+
+    def __init__(self, source: Union[FlowBuilder, str, Path, List[Dict[str, Any]]],
+                 dt: float = 60.0, chunk_bytes: int = 32 * 1024 * 1024):
+        """
+        编译流程图
+
+        Args:
+            source: FlowBuilder，或原生格式的文件路径 / 元素列表
+            dt: 仿真步长（秒）
+            chunk_bytes: 单个分段值矩阵的内存上限
+        """
+        self.program = compile_flow(source, SIMULATION_OPS)
+        self.dt = float(dt)
+        self.chunk_bytes = chunk_bytes
+
+    def run(self, series: Dict[str, Any], steps: Optional[int] = None,
+            record: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        回放时间序列
+
+        Args:
+            series: 外部输入名称（或节点 ID）-> 标量、长度为时间步数的一维数组，
+                    或形状为 (时间步数, 场景数) 的二维数组（首维为 1 时表示各场景的常量）
+            steps: 时间步数，默认取输入序列的长度
+            record: 需要记录的输出端口名 / 节点名 / 节点 ID，默认为全部 subflow 输出
+
+        Returns:
+            名称 -> 形状为 (时间步数, 场景数) 的结果数组
+        """
+        program = self.program
+        arrays = {}
+        for key, value in series.items():
+            if key not in program.inputs:
+                raise KeyError(f"未知的外部输入: {key}")
+            array = np.asarray(value, dtype=float)
+            arrays[key] = array.reshape(-1, 1) if array.ndim == 1 else np.atleast_2d(array)
+        if steps is None:
+            steps = max((array.shape[0] for array in arrays.values()), default=1)
+        scenarios = max((array.shape[1] for array in arrays.values()), default=1)
+        for key, array in arrays.items():
+            if array.shape[0] not in (1, steps) or array.shape[1] not in (1, scenarios):
+                raise ValueError(f"输入 {key} 的形状 {array.shape} 与 ({steps}, {scenarios}) 不一致")
+
+        record = list(program.outputs) if record is None else record
+        if not record:
+            raise ValueError("流程图没有 subflow 输出，请通过 record 指定需要记录的节点")
+        record_slots = {key: program.resolve(key) for key in record}
+        results = {key: np.empty((steps, scenarios)) for key in record}
+
+        chunk = max(1, min(steps, self.chunk_bytes // (8 * max(program.slot_count, 1) * scenarios)))
+        states: Dict[int, Dict[str, np.ndarray]] = {}
+        for start in range(0, steps, chunk):
+            length = min(chunk, steps - start)
+            ctx = _StepContext(self.dt, start, length, scenarios)
+            n = length * scenarios
+
+            # 值矩阵按 (slot, 时间步 × 场景) 存放，时间步为主序，便于无状态组件直接复用
+            values = np.empty((program.slot_count, n))
+            for slot, default in program.input_defaults.items():
+                values[slot] = default
+            for key, array in arrays.items():
+                window = array if array.shape[0] == 1 else array[start:start + length]
+                values[program.inputs[key]] = np.broadcast_to(window, (length, scenarios)).reshape(-1)
+
+            for node_type, index, in_slots, params, out_slots in program.ops:
+                if node_type == "input":
+                    continue
+                if node_type in STATEFUL_OPS:
+                    inputs = [values[port[0]].reshape(length, scenarios) if port else None
+                              for port in in_slots]
+                    result = STATEFUL_OPS[node_type](inputs, params, states.setdefault(index, {}), ctx)
+                else:
+                    inputs = [values[port[0]] if port else None for port in in_slots]
+                    result = STATELESS_OPS[node_type](inputs, params, n)
+                _store(values, out_slots, result, params)
+
+            for key, slot in record_slots.items():
+                results[key][start:start + length] = values[slot].reshape(length, scenarios)
+        return results
+
+
+# 独立测试函数
+def test_flow_simulator():
+    """测试仿真工具：扫描并回放夏季主机初始开启台数模块"""
+    sample = Path(__file__).resolve().parent.parent / "json" / \
+        "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    evaluator = FlowEvaluator(sample)
+
+    # 湿球温度 20~32℃ 每 0.01℃ 一个场景，手/自动各一组
+    wet_bulb = np.tile(np.arange(20.0, 32.0, 0.01), 2)
+    manual = np.repeat([0.0, 1.0], wet_bulb.size // 2)
+    scenarios = {
+        "系统开启标志位": 0,
+        "湿球温度": wet_bulb,
+        "初始开机台数手/自动切换": manual,
+        "初始开启台数手动设定": 3,
+        "主机可正常运行数量": 5,
+        "主机最小开启数量设定值": 1,
+        "初始开机1档湿球温度设定值": 23,
+        "初始开机2档湿球温度设定值": 25,
+        "初始开机3档湿球温度设定值": 27,
+        "初始开机4档湿球温度设定值": 29,
+        "初始开机5档湿球温度设定值": 31,
+    }
+
+    start = time.perf_counter()
+    result = evaluator.evaluate(scenarios)
+    elapsed = time.perf_counter() - start
+    count = result["夏季初始开机台数"]
+
+    print(f"场景数: {wet_bulb.size}，耗时 {elapsed * 1000:.2f} ms")
+    for temperature in (22.0, 24.0, 26.0, 28.0, 30.0, 31.5):
+        i = int(round((temperature - 20.0) / 0.01))
+        print(f"湿球温度 {temperature:>4}℃: 自动 {count[i]:.0f} 台 / 手动 {count[i + wet_bulb.size // 2]:.0f} 台")
+
+    # 一个制冷季（122 天）的分钟级数据回放：湿球温度按日周期变化，每天 6:00 系统开启
+    steps = 122 * 1440
+    minutes = np.arange(steps)
+    season = {key: value for key, value in scenarios.items() if np.ndim(value) == 0}
+    season["湿球温度"] = 26.0 + 4.0 * np.sin(minutes / 1440 * 2 * np.pi)
+    season["初始开机台数手/自动切换"] = 0
+    season["系统开启标志位"] = (minutes % 1440 >= 360).astype(float)
+
+    simulator = FlowSimulator(sample, dt=60)
+    start = time.perf_counter()
+    trend = simulator.run(season)["夏季初始开机台数"]
+    elapsed = time.perf_counter() - start
+    print(f"时间步数: {steps}，耗时 {elapsed:.2f} s，开机台数取值: {np.unique(trend).tolist()}")
+
+
+if __name__ == "__main__":
+    test_flow_simulator()
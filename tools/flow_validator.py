@@ -0,0 +1,389 @@
+"""
+形式化验证引擎 (Flow Validator)
+职责：一次遍历节点与连线，建立 CSR 邻接表，按组件注册表检查类型、参数与端口，
+      用 Tarjan 强连通分量检测环路，输出带错误码与严重级别的结构化诊断
+"""
+import time
+from array import array
+from typing import Dict, List, Any, Optional, NamedTuple, Iterable, FrozenSet
+
+from kong_sdk import get_registry, is_subflow_type, value_kinds, SUBFLOW_IN, SUBFLOW_OUT, _benchmark_edges
+
+
+ERROR = "error"
+WARNING = "warning"
+INFO = "info"
+
+# 诊断码 -> (严重级别, 说明)
+CODES = {
+    "E100": (ERROR, "缺少 nodes / wires 字段"),
+    "E101": (ERROR, "节点缺少 ID"),
+    "E102": (ERROR, "节点 ID 重复"),
+    "E103": (ERROR, "节点缺少 type 字段"),
+    "E104": (ERROR, "组件类型不在组件库中"),
+    "E106": (ERROR, "节点所属的容器不存在"),
+    "E107": (ERROR, "原生格式节点缺少组件必需的字段"),
+    "E201": (ERROR, "连线引用了不存在的源节点"),
+    "E202": (ERROR, "连线引用了不存在的目标节点"),
+    "E203": (ERROR, "输出端口越界"),
+    "E204": (ERROR, "输入端口越界"),
+    "E205": (ERROR, "端口索引不是非负整数"),
+    "E301": (ERROR, "循环依赖"),
+    "W101": (WARNING, "悬空节点（既无输入也无输出）"),
+    "W102": (WARNING, "组件没有该参数"),
+    "W103": (WARNING, "参数类型与组件定义不一致"),
+}
+
+# SDK 导出格式中不属于节点参数的字段
+_NODE_FIELDS = frozenset({"id", "type", "name", "x", "y", "z", "wires", "port"})
+
+# 环路诊断中最多列出的节点数
+_MAX_CYCLE_MEMBERS = 10
+
+
+class Diagnostic(NamedTuple):
+    """一条诊断"""
+    code: str
+    severity: str
+    message: str
+    node: Optional[str] = None  # 相关节点 ID
+    offset: Optional[int] = None  # 原生格式中相关元素的位置（流式验证为字节偏移，并行验证为元素序号）
+
+    def __str__(self) -> str:
+        if self.offset is None:
+            return f"[{self.code}] {self.message}"
+        return f"[{self.code}] {self.message}（偏移 {self.offset}）"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._asdict()
+
+
+class ValidationReport:
+    """验证结果：诊断列表及按严重级别的筛选"""
+
+    def __init__(self, diagnostics: List[Diagnostic], node_count: int = 0, wire_count: int = 0):
+        self.diagnostics = diagnostics
+        self.node_count = node_count
+        self.wire_count = wire_count
+
+    @property
+    def passed(self) -> bool:
+        """没有 error 级别的诊断即通过"""
+        return not any(d.severity == ERROR for d in self.diagnostics)
+
+    def errors(self) -> List[str]:
+        return [str(d) for d in self.diagnostics if d.severity == ERROR]
+
+    def warnings(self) -> List[str]:
+        return [str(d) for d in self.diagnostics if d.severity == WARNING]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "passed": self.passed,
+            "node_count": self.node_count,
+            "wire_count": self.wire_count,
+            "diagnostics": [d.to_dict() for d in self.diagnostics],
+        }
+
+
+def _diagnostic(code: str, message: str, node: Optional[str] = None,
+                offset: Optional[int] = None) -> Diagnostic:
+    return Diagnostic(code, CODES[code][0], message, node, offset)
+
+
+_KIND_LABELS = {"number": "数值", "str": "字符串"}
+
+
+class FlowValidator:
+    """
+    单遍形式化验证器
+
+    节点、连线各遍历一次：节点 ID 映射为连续编号，连线按源节点计数后写入
+    CSR 邻接表（offsets / targets 两个整型数组），环路检测与悬空节点检查都在
+    CSR 上线性完成，整体耗时与节点数 + 连线数成正比。
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or get_registry()
+
+    def validate(self, json_data: Dict[str, Any]) -> ValidationReport:
+        """
+        验证 SDK 导出格式（export_json）的流程图
+
+        Args:
+            json_data: {"nodes": [...], "wires": [...]}
+
+        Returns:
+            ValidationReport
+        """
+        if "nodes" not in json_data or "wires" not in json_data:
+            missing = [key for key in ("nodes", "wires") if key not in json_data]
+            return ValidationReport([_diagnostic("E100", f"缺少字段: {', '.join(missing)}")])
+
+        diagnostics: List[Diagnostic] = []
+        index_of: Dict[str, int] = {}
+        ids: List[str] = []
+        types: List[Optional[str]] = []
+        for node in json_data["nodes"]:
+            self._check_node(node, index_of, ids, types, diagnostics)
+
+        wires = json_data["wires"]
+        sources = array("i")
+        targets = array("i")
+        self_loops = []
+        for wire in wires:
+            source = index_of.get(wire.get("source"))
+            target = index_of.get(wire.get("target"))
+            if not self._check_wire(wire, source, target, types, diagnostics):
+                continue
+            if source == target:
+                self_loops.append(source)
+            sources.append(source)
+            targets.append(target)
+
+        diagnostics.extend(_check_graph(ids, sources, targets, self_loops))
+        return ValidationReport(diagnostics, len(ids), len(wires))
+
+    def _check_node(self, node: Dict[str, Any], index_of: Dict[str, int], ids: List[str],
+                    types: List[Optional[str]], diagnostics: List[Diagnostic]):
+        """登记节点并检查 ID、类型与参数"""
+        node_id = node.get("id")
+        node_type = node.get("type")
+        if node_id is None:
+            diagnostics.append(_diagnostic("E101", f"节点缺少 ID: {node.get('name', node)}"))
+            return
+        if node_id in index_of:
+            diagnostics.append(_diagnostic("E102", f"节点 ID 重复: {node_id}", node_id))
+            return
+        index_of[node_id] = len(ids)
+        ids.append(node_id)
+        types.append(node_type)
+
+        if node_type is None:
+            diagnostics.append(_diagnostic("E103", f"节点 {node_id} 缺少 type 字段", node_id))
+            return
+        spec = self.registry.get(node_type)
+        if spec is None:
+            if node_type not in (SUBFLOW_IN, SUBFLOW_OUT) and not is_subflow_type(node_type):
+                diagnostics.append(_diagnostic(
+                    "E104", f"节点 {node_id} 的类型不在组件库中: {node_type}", node_id))
+            return
+        # SDK 格式只记录显式设置的参数，必需字段在导出原生格式时由组件注册表补齐，
+        # 因此这里只检查多余与类型不符的参数；原生格式的必需字段由流式验证检查（E107）
+        _check_params(spec, node_id, node, _NODE_FIELDS, diagnostics)
+
+    def _check_wire(self, wire: Dict[str, Any], source: Optional[int], target: Optional[int],
+                    types: List[Optional[str]], diagnostics: List[Diagnostic]) -> bool:
+        """检查连线端点与端口；端点存在时返回 True（端口越界的连线仍参与环路检测）"""
+        source_id, target_id = wire.get("source"), wire.get("target")
+        if source is None:
+            diagnostics.append(_diagnostic("E201", f"连线引用了不存在的源节点: {source_id}", target_id))
+        if target is None:
+            diagnostics.append(_diagnostic("E202", f"连线引用了不存在的目标节点: {target_id}", source_id))
+        if source is None or target is None:
+            return False
+
+        out_port, in_port = wire.get("sourcePort", 0), wire.get("targetPort", 0)
+        for port in (out_port, in_port):
+            if not isinstance(port, int) or isinstance(port, bool) or port < 0:
+                diagnostics.append(_diagnostic(
+                    "E205", f"连线 {source_id} -> {target_id}: 端口索引无效: {port!r}", target_id))
+                return True
+        message = self.registry.check_ports(types[source], out_port=out_port)
+        if message:
+            diagnostics.append(_diagnostic("E203", f"连线 {source_id} -> {target_id}: {message}", source_id))
+        message = self.registry.check_ports(types[target], in_port=in_port)
+        if message:
+            diagnostics.append(_diagnostic("E204", f"连线 {source_id} -> {target_id}: {message}", target_id))
+        return True
+
+
+def _check_graph(ids: List[str], sources: array, targets: array, self_loops: List[int],
+                 locations: Optional[array] = None, linked: Optional[bytearray] = None) -> List[Diagnostic]:
+    """
+    在 CSR 邻接表上检测环路与悬空节点
+
+    locations 为各节点在原生文件中的偏移；linked 标记不经连线、而经 quote 引用或
+    subflow 端口与其他节点相连的节点，这些节点不算悬空。
+    """
+    offsets, adjacency = _csr(len(ids), sources, targets)
+    diagnostics = _cycle_diagnostics(ids, offsets, adjacency, self_loops, locations)
+
+    # 悬空节点只提示，不影响验证结果（单节点画布例外）
+    if len(ids) > 1:
+        for index in _isolated(len(ids), offsets, targets, linked):
+            diagnostics.append(_diagnostic("W101", f"悬空节点（可能合理）: {ids[index]}", ids[index],
+                                           locations[index] if locations is not None else None))
+    return diagnostics
+
+
+def _cycle_diagnostics(ids: List[str], offsets: array, adjacency: array, self_loops: List[int],
+                       locations: Optional[array] = None) -> List[Diagnostic]:
+    """自环与多节点强连通分量的 E301 诊断"""
+    def at(index: int) -> Optional[int]:
+        return locations[index] if locations is not None else None
+
+    diagnostics = []
+    for index in sorted(set(self_loops)):
+        diagnostics.append(_diagnostic("E301", f"节点 {ids[index]} 连接到自身", ids[index], at(index)))
+    for component in _cyclic_components(len(ids), offsets, adjacency):
+        component.sort(key=locations.__getitem__ if locations is not None else None)
+        members = [ids[index] for index in component]
+        shown = ", ".join(members[:_MAX_CYCLE_MEMBERS])
+        if len(members) > _MAX_CYCLE_MEMBERS:
+            shown += f" 等 {len(members)} 个节点"
+        diagnostics.append(_diagnostic("E301", f"循环依赖: {shown}", members[0], at(component[0])))
+    return diagnostics
+
+
+def _isolated(node_count: int, offsets: array, targets: array,
+              linked: Optional[bytearray] = None) -> List[int]:
+    """既无出边、也无入边且未经其他方式连接的节点编号"""
+    has_input = bytearray(linked) if linked is not None else bytearray(node_count)
+    for target in targets:
+        has_input[target] = 1
+    return [index for index in range(node_count)
+            if offsets[index] == offsets[index + 1] and not has_input[index]]
+
+
+def _check_params(spec, node_id: str, node: Dict[str, Any], skip: FrozenSet[str],
+                  diagnostics: List[Diagnostic], offset: Optional[int] = None):
+    """检查节点中组件没有的参数与类型不符的参数（skip 为非参数字段）"""
+    for key, value in node.items():
+        if key in skip:
+            continue
+        kinds = spec.param_kinds.get(key)
+        if kinds is None:
+            diagnostics.append(_diagnostic(
+                "W102", f"节点 {node_id}: {spec.type} 没有参数 {key}", node_id, offset))
+        elif not kinds & value_kinds(value):
+            expected = " / ".join(_KIND_LABELS.get(kind, kind) for kind in sorted(kinds))
+            diagnostics.append(_diagnostic(
+                "W103", f"节点 {node_id}: 参数 {key}={value!r} 与组件样本中的类型 {expected} 不一致",
+                node_id, offset))
+
+
+def _csr(node_count: int, sources: array, targets: array):
+    """计数排序构建 CSR：节点 v 的后继为 adjacency[offsets[v]:offsets[v + 1]]"""
+    offsets = array("i", bytes(4 * (node_count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for index in range(node_count):
+        offsets[index + 1] += offsets[index]
+    cursor = offsets[:-1]
+    adjacency = array("i", bytes(4 * len(sources)))
+    for source, target in zip(sources, targets):
+        adjacency[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, adjacency
+
+
+def _cyclic_components(node_count: int, offsets: array, adjacency: array) -> List[List[int]]:
+    """
+    迭代版 Tarjan 强连通分量，返回包含多个节点的分量（即环路）
+
+    用显式栈代替递归，5 万节点的长链也不会超出递归深度。
+    """
+    order = array("i", [-1]) * node_count  # 访问序号
+    low = array("i", bytes(4 * node_count))
+    on_stack = bytearray(node_count)
+    stack: List[int] = []
+    components = []
+    counter = 0
+    for root in range(node_count):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+        work = [[root, offsets[root]]]  # (节点, 下一条待访问出边的位置)
+        while work:
+            frame = work[-1]
+            node, position = frame
+            if position < offsets[node + 1]:
+                frame[1] = position + 1
+                successor = adjacency[position]
+                if order[successor] == -1:
+                    order[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = 1
+                    work.append([successor, offsets[successor]])
+                elif on_stack[successor] and order[successor] < low[node]:
+                    low[node] = order[successor]
+                continue
+
+            work.pop()
+            if work and low[node] < low[work[-1][0]]:
+                low[work[-1][0]] = low[node]
+            if low[node] == order[node]:
+                member = stack.pop()
+                on_stack[member] = 0
+                if member == node:
+                    continue  # 单节点分量（自环单独报告）
+                component = [member]
+                while member != node:
+                    member = stack.pop()
+                    on_stack[member] = 0
+                    component.append(member)
+                components.append(component)
+    return components
+
+
+def validate_flow(json_data: Dict[str, Any]) -> ValidationReport:
+    """使用共享组件注册表验证 SDK 导出格式的流程图"""
+    return FlowValidator().validate(json_data)
+
+
+def _benchmark_flow(node_count: int, seed: int = 0) -> Dict[str, Any]:
+    """与 kong_sdk 布局基准相同拓扑的 SDK 导出格式流程图"""
+    nodes = [{"id": f"n{i}", "type": "add", "name": f"节点_{i}", "x": 0, "y": 0, "wires": []}
+             for i in range(node_count)]
+    wires = [{"source": f"n{source}", "sourcePort": 0, "target": f"n{target}", "targetPort": in_port}
+             for source, target, in_port in _benchmark_edges(node_count, seed)]
+    return {"version": "1.0", "nodes": nodes, "wires": wires}
+
+
+def benchmark_validator(sizes: Iterable[int] = (1000, 10000, 50000)):
+    """形式化验证性能基准：耗时应随节点数线性增长"""
+    validator = FlowValidator()
+    for size in sizes:
+        data = _benchmark_flow(size)
+        start = time.perf_counter()
+        report = validator.validate(data)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>6} 节点 / {report.wire_count:>6} 连线: {elapsed * 1000:8.1f} ms"
+              f"  ({elapsed / size * 1e6:.2f} µs/节点，诊断 {len(report.diagnostics)} 条)")
+
+
+def test_flow_validator():
+    """测试形式化验证引擎"""
+    data = {
+        "nodes": [
+            {"id": "t", "type": "swInput", "name": "温度"},
+            {"id": "c", "type": "compare", "name": "比较", "tripPoint": "高"},
+            {"id": "a", "type": "add", "name": "加法"},
+            {"id": "b", "type": "add", "name": "加法2", "gain": 2},
+            {"id": "x", "type": "fooBlock", "name": "未知"},
+            {"id": "lonely", "type": "constInput", "name": "孤立常数"},
+        ],
+        "wires": [
+            {"source": "t", "sourcePort": 0, "target": "c", "targetPort": 0},
+            {"source": "c", "sourcePort": 3, "target": "a", "targetPort": 0},
+            {"source": "a", "sourcePort": 0, "target": "b", "targetPort": 0},
+            {"source": "b", "sourcePort": 0, "target": "a", "targetPort": 1},
+            {"source": "a", "sourcePort": 0, "target": "ghost", "targetPort": 0},
+            {"source": "x", "sourcePort": 0, "target": "x", "targetPort": 0},
+        ],
+    }
+    report = validate_flow(data)
+    print(f"通过: {report.passed}")
+    for diagnostic in report.diagnostics:
+        print(f"  {diagnostic.severity:<7} {diagnostic}")
+    print()
+    benchmark_validator()
+
+
+if __name__ == "__main__":
+    test_flow_validator()
@@ -0,0 +1,50 @@
+"""
+向量数据库初始化 (Init VectorDB)
+职责：命令行入口，增量构建知识库
+用法：python -m tools.init_vectordb [--source json] [--backend local|chroma] [--embedder hashing] [--rebuild]
+"""
+import argparse
+from pathlib import Path
+
+import config
+from .knowledge_base import (KnowledgeBaseBuilder, open_store, knowledge_files, MANIFEST_NAME,
+                             DEFAULT_BATCH_SIZE, DEFAULT_EMBED_CONCURRENCY)
+from .vector_index import load_embedder
+from kong_sdk import COMPONENT_DIR
+
+
+def default_directory(backend: str) -> str:
+    """各类向量库的默认目录"""
+    return config.VECTOR_INDEX_DIR if backend == "local" else config.CHROMA_PERSIST_DIR
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="增量构建 KONG CUBE 知识库")
+    parser.add_argument("--source", default=str(COMPONENT_DIR), help="组件样本与工程 JSON 所在目录")
+    parser.add_argument("--backend", default=config.VECTOR_BACKEND, choices=("local", "chroma"),
+                        help="向量库类型")
+    parser.add_argument("--persist", default=None, help="向量库目录（默认按向量库类型取 config 中的目录）")
+    parser.add_argument("--embedder", default=config.EMBEDDING_MODEL, help="向量化模型")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="每次向量化的文档数")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_EMBED_CONCURRENCY,
+                        help="同时进行的向量化请求数")
+    parser.add_argument("--rebuild", action="store_true", help="清空向量库与索引，全部重新向量化")
+    args = parser.parse_args(argv)
+
+    persist = args.persist or default_directory(args.backend)
+    manifest_path = Path(persist) / MANIFEST_NAME
+    files = knowledge_files(args.source)
+    print(f"知识库来源: {args.source}（{len(files)} 个 JSON 文件）")
+
+    builder = KnowledgeBaseBuilder(open_store(args.backend, persist), load_embedder(args.embedder),
+                                   manifest_path, batch_size=args.batch_size, concurrency=args.concurrency)
+    if args.rebuild:
+        builder.reset()
+    stats = builder.ingest(files)
+    print(f"变化文件 {stats['changed']} 个，删除文件 {stats['removed']} 个；"
+          f"向量化 {stats['embedded']} 条，删除 {stats['deleted']} 条，共 {stats['documents']} 条文档")
+    print(f"知识库版本 {stats['version']}，耗时 {stats['elapsed']:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
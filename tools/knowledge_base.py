@@ -0,0 +1,574 @@
+"""
+知识库构建 (Knowledge Base)
+职责：把 json/ 下的组态文件解析为组件卡片与工程子图摘要，批量向量化后写入向量库；
+      文件哈希清单记录已入库的内容，重复构建时只解析和向量化新增或变化的文件
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, NamedTuple, Iterable, Iterator, Union
+
+from .vector_index import Hit, LocalVectorStore
+from .text_index import TextIndex, TEXT_INDEX_NAME, TERMS_NAME
+from .motif_index import (MotifIndex, FeatureStore, MOTIF_INDEX_NAME, MOTIF_GRAPHS_NAME, MOTIF_FEATURES_NAME,
+                          motif_graph, wl_features, structure_digest)
+from kong_sdk import (ComponentRegistry, get_registry, is_subflow_type, _load_json, COMPONENT_DIR,
+                      SUBFLOW_INSTANCE_PREFIX)
+
+
+MANIFEST_NAME = "kb_manifest.json"
+MANIFEST_FORMAT = 1
+COLLECTION_NAME = "kongcube"
+
+DEFAULT_BATCH_SIZE = 256  # 每次向量化请求的文档数
+DEFAULT_EMBED_CONCURRENCY = 4  # 同时进行的向量化请求数
+PARALLEL_PARSE_THRESHOLD = 64  # 变化的文件数超过该值时在进程池中解析
+
+# 作为外部输入 / 输出读写的组件
+_IO_TYPES = frozenset({"swInput", "constInput"})
+
+# 摘要中最多列出的节点名称数
+_MAX_NAMES = 60
+
+
+class Document(NamedTuple):
+    """入库的一条文档"""
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+    features: Optional[Dict[int, int]] = None  # 工程子图的 WL 结构特征，不写入向量库
+
+    @property
+    def digest(self) -> str:
+        """文本与元数据的哈希：不变的文档重复构建时不再向量化（结构变化体现在元数据的 structure 中）"""
+        payload = json.dumps([self.text, self.metadata], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def is_component_file(path: Path) -> bool:
+    """组件样本文件（json/*组件.json）"""
+    return path.name.endswith("组件.json")
+
+
+# ---------- 解析 ----------
+
+def component_cards(path: Path) -> List[Document]:
+    """
+    组件卡片：由组件注册表编译结果生成，每种组件一条
+
+    包含类型、中文名称、端口数与默认参数，以及一行 SDK 用法示例。
+    """
+    category = path.stem
+    directory = path.resolve().parent
+    registry = get_registry() if directory == COMPONENT_DIR else ComponentRegistry.compile(directory)
+    documents = []
+    for spec in registry.specs.values():
+        if spec.category != category:
+            continue
+        inputs = (f"{spec.min_inputs} 个以上" if spec.max_inputs is None
+                  else f"{spec.min_inputs} 个" if spec.min_inputs == spec.max_inputs
+                  else f"{spec.min_inputs}~{spec.max_inputs} 个")
+        params = "，".join(f"{key}={value!r}" for key, value in spec.defaults.items())
+        text = (f"组件 {spec.type}（{spec.label}），属于{category}。"
+                f"输入端口 {inputs}，输出端口 {spec.outputs} 个。\n"
+                f"默认参数: {params or '无'}\n"
+                f"用法: flow.add_node('{spec.type}', '{spec.label}')")
+        documents.append(Document(f"component:{spec.type}", text, {
+            "kind": "component", "type": spec.type, "label": spec.label, "category": category,
+            "min_inputs": spec.min_inputs, "max_inputs": spec.max_inputs, "outputs": spec.outputs,
+            "source": path.name,
+        }))
+    return documents
+
+
+def _layers(nodes: List[Dict[str, Any]], edges: List[Tuple[int, int]]) -> List[int]:
+    """按最长路径分层：源节点为第 0 层（Kahn 拓扑序；环路上的节点保持 -1）"""
+    successors: List[List[int]] = [[] for _ in nodes]
+    indegree = [0] * len(nodes)
+    for source, target in edges:
+        successors[source].append(target)
+        indegree[target] += 1
+    depth = [-1] * len(nodes)
+    queue = [index for index, count in enumerate(indegree) if count == 0]
+    for index in queue:
+        depth[index] = 0
+    for index in queue:
+        for successor in successors[index]:
+            depth[successor] = max(depth[successor], depth[index] + 1)
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                queue.append(successor)
+    return depth
+
+
+def _type_label(node_type: str, subflow_names: Dict[str, str]) -> str:
+    if node_type.startswith(SUBFLOW_INSTANCE_PREFIX):
+        return f"子流程 {subflow_names.get(node_type[len(SUBFLOW_INSTANCE_PREFIX):], node_type)}"
+    return node_type
+
+
+def project_summaries(path: Path, items: Optional[List[Dict[str, Any]]] = None) -> List[Document]:
+    """
+    工程子图摘要：原生格式工程中每个 tab / subflow 一条
+
+    摘要包含节点数、各类组件数量、外部输入与输出、按拓扑分层的组件结构和节点名称，
+    元数据保留节点类型计数供检索时过滤；同时计算子图的 WL 结构特征供结构检索。
+    """
+    items = items if items is not None else _load_json(path)
+    containers = {item["id"]: item for item in items if item.get("type") in ("tab", "subflow")}
+    subflow_names = {cid: item.get("name", cid) for cid, item in containers.items()
+                     if item.get("type") == "subflow"}
+    members: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        if item.get("type") not in ("tab", "subflow") and item.get("z") in containers:
+            members.setdefault(item["z"], []).append(item)
+
+    project = path.stem
+    documents = []
+    for container_id, container in containers.items():
+        nodes = members.get(container_id, [])
+        if not nodes:
+            continue
+        index_of = {node["id"]: index for index, node in enumerate(nodes)}
+        edges = []
+        has_input = [False] * len(nodes)
+        for index, node in enumerate(nodes):
+            for refs in node.get("wires", []):
+                for ref in refs:
+                    # 引用 subflow 自身 ID 的是 subflow 输入端口，不算内部连线
+                    if ref.get("id") in index_of:
+                        edges.append((index_of[ref["id"]], index))
+                        has_input[index] = True
+            label = node.get("labelName") or ""
+            if node.get("type") == "quote" and label.startswith("["):
+                referenced = index_of.get(label[1:].split(":", 1)[0])
+                if referenced is not None:
+                    edges.append((referenced, index))
+
+        outputs = []
+        for port in container.get("out", []):
+            for ref in port.get("wires", []):
+                if ref.get("id") in index_of:
+                    source = nodes[index_of[ref["id"]]]
+                    outputs.append(source.get("name") or source["type"])
+        inputs = []
+        for index, node in enumerate(nodes):
+            if node.get("type") in _IO_TYPES:
+                (outputs if has_input[index] else inputs).append(node.get("name") or node["id"])
+
+        outputs = list(dict.fromkeys(outputs))
+
+        depth = _layers(nodes, edges)
+        layers: Dict[int, Counter] = {}
+        for index, node in enumerate(nodes):
+            if node.get("type") not in _IO_TYPES and node.get("type") != "quote":
+                layers.setdefault(depth[index], Counter())[_type_label(node["type"], subflow_names)] += 1
+        structure = " → ".join(
+            "、".join(f"{t}×{n}" if n > 1 else t for t, n in sorted(layers[level].items()))
+            for level in sorted(layers))
+
+        type_counts = Counter(node.get("type") for node in nodes)
+        registry = get_registry()
+        components = "，".join(
+            f"{t}（{registry.get(t).label}）×{n}" if t in registry else f"{_type_label(t, subflow_names)}×{n}"
+            for t, n in type_counts.most_common())
+        names = list(dict.fromkeys(node["name"] for node in nodes
+                                   if node.get("name") and node.get("type") != "quote"
+                                   and not is_subflow_type(node.get("type", ""))))[:_MAX_NAMES]
+        kind = "子流程" if container.get("type") == "subflow" else "流程"
+        title = container.get("name") or container.get("label") or container_id
+        text = (f"工程 {project} 的{kind}「{title}」，{len(nodes)} 个节点，{len(edges)} 条连接。\n"
+                f"组件: {components}\n"
+                f"输入: {'、'.join(inputs) or '无'}\n"
+                f"输出: {'、'.join(outputs) or '无'}\n"
+                f"结构: {structure or '无'}\n"
+                f"节点: {'、'.join(names)}")
+        features = wl_features(*motif_graph([node.get("type", "") for node in nodes], edges))
+        documents.append(Document(f"project:{project}:{container_id}", text, {
+            "kind": "project", "project": project, "container": container_id,
+            "container_type": container.get("type"), "title": title, "node_count": len(nodes),
+            "types": dict(type_counts), "structure": structure_digest(features), "source": path.name,
+        }, features))
+    return documents
+
+
+def parse_file(path: Union[str, Path]) -> List[Document]:
+    """解析一个 JSON 文件：组件样本文件生成组件卡片，其余按原生格式工程生成子图摘要"""
+    path = Path(path)
+    if is_component_file(path):
+        return component_cards(path)
+    items = _load_json(path)
+    if not isinstance(items, list):
+        return []
+    return project_summaries(path, items)
+
+
+# ---------- 文件哈希清单 ----------
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    已入库文件的清单：文件 -> (大小, 修改时间, 内容哈希, {文档 ID: 文档哈希})
+
+    大小与修改时间未变的文件不重新计算哈希；内容哈希未变的文件不重新解析。
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.embedder = ""
+        self.version = ""
+        self.files: Dict[str, Dict[str, Any]] = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if data.get("format") == MANIFEST_FORMAT:
+            self.embedder = data.get("embedder", "")
+            self.version = data.get("version", "")
+            self.files = data.get("files", {})
+
+    def documents(self) -> Dict[str, str]:
+        """全部已入库文档 ID -> 文档哈希"""
+        return {doc_id: digest for entry in self.files.values()
+                for doc_id, digest in entry["documents"].items()}
+
+    def unchanged(self, key: str, path: Path, stat: os.stat_result) -> Tuple[bool, Optional[str]]:
+        """
+        文件是否与入库时相同
+
+        Returns:
+            (是否相同, 内容哈希)；只比对大小与修改时间即可判定相同时哈希为 None
+        """
+        entry = self.files.get(key)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True, None
+        digest = _file_digest(path)
+        if entry is not None and entry["sha256"] == digest:
+            entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+            return True, digest
+        return False, digest
+
+    def save(self):
+        """原子写入清单，并以全部文档哈希计算知识库版本"""
+        digest = hashlib.sha256(self.embedder.encode("utf-8"))
+        for doc_id, doc_digest in sorted(self.documents().items()):
+            digest.update(f"{doc_id}\0{doc_digest}\0".encode("utf-8"))
+        self.version = digest.hexdigest()[:16]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({
+            "format": MANIFEST_FORMAT, "embedder": self.embedder, "version": self.version,
+            "files": self.files,
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+# ---------- 向量库与向量化 ----------
+
+class ChromaStore:
+    """
+    Chroma 向量库：向量由构建流程批量计算后直接写入，查询接口与 LocalVectorStore 相同
+    """
+
+    def __init__(self, persist_directory: Union[str, Path], collection_name: str = COLLECTION_NAME):
+        import chromadb  # 可选依赖：仅在使用 Chroma 时需要
+
+        self.client = chromadb.PersistentClient(path=str(persist_directory))
+        self.collection = self.client.get_or_create_collection(collection_name,
+                                                               metadata={"hnsw:space": "cosine"})
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+               metadatas: List[Dict[str, Any]]):
+        self.collection.upsert(ids=ids, embeddings=[list(map(float, v)) for v in embeddings],
+                               documents=texts, metadatas=[_flat_metadata(m) for m in metadatas])
+
+    def delete(self, ids: List[str]):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def documents(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """全部 (文档 ID, 文本, 元数据)"""
+        result = self.collection.get(include=["documents", "metadatas"])
+        return zip(result["ids"], result["documents"], result["metadatas"])
+
+    def get(self, ids: List[str]) -> List[Hit]:
+        """按 ID 取文档（得分为 0）"""
+        if not ids:
+            return []
+        result = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {doc_id: Hit(doc_id, 0.0, text, metadata) for doc_id, text, metadata
+                 in zip(result["ids"], result["documents"], result["metadatas"])}
+        return [found[doc_id] for doc_id in ids if doc_id in found]
+
+    def query(self, embedding: List[float], top_k: int = 5,
+              where: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """按向量检索，返回与本地向量库相同的 Hit 列表（得分为 1 - 余弦距离）"""
+        if self.collection.count() == 0:
+            return []
+        result = self.collection.query(query_embeddings=[list(map(float, embedding))], n_results=top_k,
+                                       where=where or None)
+        return [Hit(doc_id, 1.0 - distance, text, metadata)
+                for doc_id, distance, text, metadata in zip(result["ids"][0], result["distances"][0],
+                                                            result["documents"][0], result["metadatas"][0])]
+
+
+def _flat_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Chroma 元数据只接受标量，嵌套结构转为 JSON 字符串，None 丢弃"""
+    return {key: value if isinstance(value, (str, int, float, bool)) else json.dumps(value, ensure_ascii=False)
+            for key, value in metadata.items() if value is not None}
+
+
+def open_store(backend: str, directory: Union[str, Path]):
+    """
+    打开向量库
+
+    Args:
+        backend: "local"（内存映射的本地向量库）或 "chroma"
+        directory: 向量库目录
+    """
+    if backend == "local":
+        return LocalVectorStore(directory)
+    if backend == "chroma":
+        return ChromaStore(directory)
+    raise ValueError(f"未知的向量库类型: {backend}")
+
+
+def embedder_name(embedder) -> str:
+    """向量化模型的标识：模型变化后需要全部重新向量化"""
+    return f"{type(embedder).__name__}:{getattr(embedder, 'model', '')}"
+
+
+# ---------- 构建流程 ----------
+
+def _parse_many(paths: List[Path], workers: Optional[int]) -> List[List[Document]]:
+    if len(paths) < PARALLEL_PARSE_THRESHOLD or (workers or os.cpu_count() or 1) <= 1:
+        return [parse_file(path) for path in paths]
+    context = (multiprocessing.get_context("fork")
+               if "fork" in multiprocessing.get_all_start_methods() else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        return list(pool.map(parse_file, paths, chunksize=16))
+
+
+class KnowledgeBaseBuilder:
+    """
+    增量知识库构建器
+
+    1. 按清单找出新增、变化和已删除的文件（未变化的文件不读取内容）
+    2. 解析变化的文件（文件多时在进程池中并行）
+    3. 删除不再存在的文档，只向量化文本变化的文档
+    4. 按批向量化，多个批次并发请求，完成一批写入一批
+    5. 写回清单并更新知识库版本，版本变化时重建全文索引与结构索引
+    """
+
+    def __init__(self, store, embedder, manifest_path: Union[str, Path],
+                 batch_size: int = DEFAULT_BATCH_SIZE, concurrency: int = DEFAULT_EMBED_CONCURRENCY,
+                 workers: Optional[int] = None, text_index: bool = True, motif_index: bool = True):
+        """
+        Args:
+            store: 向量库，提供 upsert(ids, embeddings, texts, metadatas) 与 delete(ids)
+            embedder: 向量化模型，提供 embed_documents(texts)
+            manifest_path: 文件哈希清单路径
+            batch_size: 每次向量化的文档数
+            concurrency: 同时进行的向量化请求数
+            workers: 解析文件的进程数
+            text_index: 是否在清单所在目录维护全文索引（向量库需提供 documents()）
+            motif_index: 是否在清单所在目录维护工程子图的结构索引
+        """
+        self.store = store
+        self.embedder = embedder
+        self.manifest = Manifest(manifest_path)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.workers = workers
+        self.text_index = text_index
+        self.motif_index = motif_index
+
+    @property
+    def version(self) -> str:
+        """知识库版本：任何文档变化后改变"""
+        return self.manifest.version
+
+    def ingest(self, json_files: Iterable[Union[str, Path]], prune: bool = True) -> Dict[str, Any]:
+        """
+        增量构建
+
+        Args:
+            json_files: JSON 文件路径
+            prune: 是否删除清单中不在本次文件列表里的文件的文档
+
+        Returns:
+            构建统计
+        """
+        start = time.perf_counter()
+        manifest = self.manifest
+        name = embedder_name(self.embedder)
+        previous = manifest.documents()
+        if manifest.embedder != name:
+            # 向量化模型变化：旧向量（维度可能不同）全部删除后重建
+            self.store.delete(list(previous))
+            manifest.embedder, manifest.files, previous = name, {}, {}
+
+        paths = {str(Path(p).resolve()): Path(p) for p in json_files}
+        changed: List[Tuple[str, Path, os.stat_result, Optional[str]]] = []
+        for key, path in sorted(paths.items()):
+            stat = path.stat()
+            same, digest = manifest.unchanged(key, path, stat)
+            if not same:
+                changed.append((key, path, stat, digest or _file_digest(path)))
+        removed = [key for key in manifest.files if key not in paths] if prune else []
+        if self.motif_index and previous and not (manifest.path.parent / MOTIF_FEATURES_NAME).exists():
+            # 结构特征缓存缺失（如由旧版本构建的知识库）：重新解析全部工程文件以补全
+            pending_keys = {key for key, _, _, _ in changed}
+            changed.extend((key, path, path.stat(), manifest.files[key]["sha256"])
+                           for key, path in sorted(paths.items())
+                           if key in manifest.files and key not in pending_keys and not is_component_file(path))
+
+        parsed = _parse_many([path for _, path, _, _ in changed], self.workers)
+        for key in removed:
+            del manifest.files[key]
+        for (key, path, stat, digest), documents in zip(changed, parsed):
+            manifest.files[key] = {
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest,
+                "documents": {document.id: document.digest for document in documents},
+            }
+
+        current = manifest.documents()
+        stale = [doc_id for doc_id in previous if doc_id not in current]
+        pending = [document for documents in parsed for document in documents
+                   if previous.get(document.id) != document.digest]
+        self.store.delete(stale)
+        self._embed(pending)
+        flush = getattr(self.store, "flush", None)  # 本地向量库先缓存写入，构建结束时落盘
+        if flush is not None:
+            flush()
+        manifest.save()
+        if self.text_index:
+            self._refresh_text_index()
+        if self.motif_index:
+            self._refresh_motif_index(parsed, stale)
+        return {
+            "files": len(paths), "changed": len(changed), "removed": len(removed),
+            "documents": len(current), "embedded": len(pending), "deleted": len(stale),
+            "version": manifest.version, "elapsed": round(time.perf_counter() - start, 3),
+        }
+
+    def reset(self):
+        """
+        清空知识库：删除向量库中的全部文档（包括清单中已没有记录的残留文档）、
+        清单、全文索引、结构索引与结构特征缓存，之后的 ingest() 全部重新构建
+        """
+        self.store.delete([doc_id for doc_id, _, _ in self.store.documents()])
+        flush = getattr(self.store, "flush", None)
+        if flush is not None:
+            flush()
+        directory = self.manifest.path.parent
+        for name in (TEXT_INDEX_NAME, TERMS_NAME, MOTIF_INDEX_NAME, MOTIF_GRAPHS_NAME, MOTIF_FEATURES_NAME):
+            (directory / name).unlink(missing_ok=True)
+        self.manifest.path.unlink(missing_ok=True)
+        self.manifest = Manifest(self.manifest.path)
+
+    def _refresh_text_index(self):
+        """知识库版本变化（或索引缺失）时由向量库中的全部文档重建全文索引"""
+        directory = self.manifest.path.parent
+        index = TextIndex.load(directory)
+        if index is None or index.version != self.manifest.version:
+            TextIndex.build(self.store.documents(), self.manifest.version).save(directory)
+
+    def _refresh_motif_index(self, parsed: List[List[Document]], stale: List[str]):
+        """更新结构特征缓存，知识库版本变化（或索引缺失）时由全部特征重建结构索引"""
+        directory = self.manifest.path.parent
+        store = FeatureStore(directory / MOTIF_FEATURES_NAME)
+        for doc_id in stale:
+            store.features.pop(doc_id, None)
+        store.features.update((document.id, document.features) for documents in parsed
+                              for document in documents if document.features)
+        store.save()
+        index = MotifIndex.load(directory)
+        if index is None or index.version != self.manifest.version:
+            MotifIndex.build(sorted(store.features.items()), self.manifest.version).save(directory)
+
+    def _embed(self, documents: List[Document]):
+        """分批并发向量化，按完成顺序写入向量库"""
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        if not batches:
+            return
+
+        def embed(batch: List[Document]):
+            return batch, self.embedder.embed_documents([document.text for document in batch])
+
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            for batch, vectors in pool.map(embed, batches):
+                self.store.upsert([d.id for d in batch], vectors, [d.text for d in batch],
+                                  [d.metadata for d in batch])
+
+
+def knowledge_files(directory: Union[str, Path] = COMPONENT_DIR) -> List[Path]:
+    """知识库来源：目录下全部 JSON 文件（组件样本与工程）"""
+    return sorted(Path(directory).glob("*.json"))
+
+
+def test_knowledge_base():
+    """测试增量构建：第二次构建不向量化任何文档，修改一个工程后只处理该文件"""
+    import shutil
+
+    class CountingEmbedder:
+        """按字符哈希生成向量并统计调用次数（仅用于演示）"""
+        model = "demo"
+
+        def __init__(self):
+            self.calls = 0
+
+        def embed_documents(self, texts):
+            self.calls += 1
+            return [[float(hash(ch) % 97) for ch in text[:8]] for text in texts]
+
+    class MemoryStore:
+        def __init__(self):
+            self.rows = {}
+
+        def upsert(self, ids, embeddings, texts, metadatas):
+            self.rows.update(zip(ids, zip(texts, metadatas)))
+
+        def delete(self, ids):
+            for doc_id in ids:
+                self.rows.pop(doc_id, None)
+
+        def documents(self):
+            return ((doc_id, text, metadata) for doc_id, (text, metadata) in self.rows.items())
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = Path(directory) / "json"
+        shutil.copytree(COMPONENT_DIR, source)
+        embedder, store = CountingEmbedder(), MemoryStore()
+        builder = KnowledgeBaseBuilder(store, embedder, Path(directory) / MANIFEST_NAME, batch_size=32)
+
+        print(f"首次构建: {builder.ingest(knowledge_files(source))}")
+        print(f"重复构建: {builder.ingest(knowledge_files(source))}")
+
+        project = next(path for path in knowledge_files(source) if not is_component_file(path))
+        items = json.loads(project.read_text(encoding="utf-8"))
+        for item in items:
+            if item.get("type") == "subflow":
+                item["name"] += "（修订）"
+        project.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+        print(f"修改工程后: {builder.ingest(knowledge_files(source))}")
+        print(f"向量化请求 {embedder.calls} 次，库中 {len(store.rows)} 条文档")
+        summary = next(text for doc_id, (text, _) in store.rows.items() if doc_id.startswith("project:"))
+        print(f"\n工程摘要示例:\n{summary}")
+
+
+if __name__ == "__main__":
+    test_knowledge_base()
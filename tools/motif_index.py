@@ -0,0 +1,310 @@
+"""
+结构索引 (Motif Index)
+职责：对知识库中每个工程子图计算 Weisfeiler–Lehman 子树哈希，建立哈希 -> 子图的倒排索引；
+      部分执行计划或草稿流程图按相同方式取哈希后，只查询共有哈希的倒排表即可找到结构最接近的工程
+"""
+import json
+import time
+import pickle
+import hashlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Union
+
+import numpy as np
+
+from kong_sdk import FlowBuilder, get_registry, SUBFLOW_IN, SUBFLOW_OUT, SUBFLOW_INSTANCE_PREFIX
+
+
+MOTIF_INDEX_NAME = "motif_index.npz"
+MOTIF_GRAPHS_NAME = "motif_graphs.json"
+MOTIF_FEATURES_NAME = "motif_features.pkl"
+
+WL_ITERATIONS = 3  # 迭代次数 h：第 h 轮的标签描述以节点为中心、半径 h 的有向子树
+MAX_DF_RATIO = 0.5  # 出现在超过该比例子图中的哈希不参与打分（如单独的 "io"）
+
+# 外部输入 / 输出类组件在结构上不作区分
+_IO_TYPES = frozenset({"swInput", "constInput", "hwInput", "hwOutput", SUBFLOW_IN, SUBFLOW_OUT})
+# 只转发所引用节点的值、在结构上视为连线的组件
+_PASS_THROUGH_TYPES = frozenset({"quote"})
+
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def motif_label(node_type: str) -> str:
+    """结构标签：输入输出类组件与组件库外的类型（如计划中的 "constant"）记为 io，subflow 实例记为 subflow"""
+    if node_type.startswith(SUBFLOW_INSTANCE_PREFIX):
+        return "subflow"
+    if node_type in _IO_TYPES or node_type not in get_registry():
+        return "io"
+    return node_type
+
+
+def motif_graph(types: List[str], edges: Iterable[Tuple[int, int]]) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """
+    归一化子图：类型映射为结构标签，quote 节点收缩为从被引用节点到其下游的连线
+
+    Returns:
+        (节点标签, 去重后的有向边)
+    """
+    predecessors: List[List[int]] = [[] for _ in types]
+    successors: List[List[int]] = [[] for _ in types]
+    for source, target in edges:
+        if source != target:
+            predecessors[target].append(source)
+            successors[source].append(target)
+
+    def origins(node: int, seen: set) -> List[int]:
+        """沿 quote 链向上找到实际的源节点"""
+        if types[node] not in _PASS_THROUGH_TYPES or not predecessors[node]:
+            return [node]
+        found = []
+        for predecessor in predecessors[node]:
+            if predecessor not in seen:
+                seen.add(predecessor)
+                found.extend(origins(predecessor, seen))
+        return found
+
+    # 没有解析到被引用节点的 quote 保留为输入
+    keep = [i for i, node_type in enumerate(types)
+            if node_type not in _PASS_THROUGH_TYPES or not predecessors[i]]
+    position = {node: index for index, node in enumerate(keep)}
+    result = set()
+    for target in keep:
+        for predecessor in predecessors[target]:
+            for source in origins(predecessor, {predecessor}):
+                if source in position and source != target:
+                    result.add((position[source], position[target]))
+    labels = ["io" if types[i] in _PASS_THROUGH_TYPES else motif_label(types[i]) for i in keep]
+    return labels, sorted(result)
+
+
+def wl_features(labels: List[str], edges: List[Tuple[int, int]],
+                iterations: int = WL_ITERATIONS) -> Dict[int, int]:
+    """
+    有向 Weisfeiler–Lehman 子树特征
+
+    每轮把节点标签与其上游、下游标签的有序多重集合一起哈希作为新标签，
+    各轮全部节点标签的计数即为子图的特征（64 位哈希 -> 次数）。
+    """
+    predecessors: List[List[int]] = [[] for _ in labels]
+    successors: List[List[int]] = [[] for _ in labels]
+    for source, target in edges:
+        predecessors[target].append(source)
+        successors[source].append(target)
+    current = [_hash(label) for label in labels]
+    features = Counter(current)
+    for _ in range(iterations):
+        current = [_hash(f"{current[v]}<{sorted(current[u] for u in predecessors[v])}"
+                         f">{sorted(current[w] for w in successors[v])}")
+                   for v in range(len(labels))]
+        features.update(current)
+    return dict(features)
+
+
+def structure_digest(features: Dict[int, int]) -> str:
+    """特征的哈希：连接关系变化（即使摘要文本不变）时文档随之更新"""
+    return hashlib.sha256(repr(sorted(features.items())).encode("ascii")).hexdigest()[:16]
+
+
+# ---------- 查询图 ----------
+
+def flow_features(flow: FlowBuilder) -> Dict[int, int]:
+    """草稿流程图的结构特征"""
+    types = [flow._type_names[code] for code in flow._types]
+    return wl_features(*motif_graph(types, zip(flow._wire_source, flow._wire_target)))
+
+
+def plan_features(plan: Dict[str, Any]) -> Dict[int, int]:
+    """
+    执行计划（可以只有部分步骤）的结构特征
+
+    计划中的 inputs / outputs 是自由文本，无法可靠地解析为连线，按步骤顺序近似：
+    有输入的步骤连接到此前所有尚未被使用的步骤。
+    """
+    steps = plan.get("steps", [])
+    types = [str(step.get("node_type", "")) for step in steps]
+    edges = []
+    open_steps: List[int] = []
+    for index, step in enumerate(steps):
+        if step.get("inputs") and open_steps:
+            edges.extend((source, index) for source in open_steps)
+            open_steps = []
+        open_steps.append(index)
+    return wl_features(*motif_graph(types, edges))
+
+
+# ---------- 索引 ----------
+
+class MotifIndex:
+    """
+    WL 哈希倒排索引
+
+    全部子图的特征哈希排序去重后存为 keys，哈希 keys[i] 的倒排表为
+    graphs[offsets[i]:offsets[i + 1]] 与对应的出现次数 counts。查询时用二分查找定位查询图的
+    每个哈希，只累加这些倒排表，耗时与共有哈希的倒排表长度成正比，与语料规模无关。
+    相似度为按 idf 加权的广义 Jaccard：Σ min(q, g)·idf / (Σ q·idf + Σ g·idf − Σ min(q, g)·idf)。
+    """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, graphs: np.ndarray, counts: np.ndarray,
+                 idf: np.ndarray, norms: np.ndarray, ids: List[str], version: str = ""):
+        self.keys = keys
+        self.offsets = offsets
+        self.graphs = graphs
+        self.counts = counts
+        self.idf = idf
+        self.norms = norms
+        self.ids = ids
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, features: Iterable[Tuple[str, Dict[int, int]]], version: str = "") -> 'MotifIndex':
+        """由 (子图 ID, 特征) 建立索引"""
+        ids, key_column, graph_column, count_column = [], [], [], []
+        for graph, (graph_id, counter) in enumerate(features):
+            ids.append(graph_id)
+            key_column.extend(counter)
+            graph_column.extend([graph] * len(counter))
+            count_column.extend(counter.values())
+        key_column = np.asarray(key_column, dtype=np.uint64)
+        order = np.argsort(key_column, kind="stable")
+        keys, first, df = np.unique(key_column[order], return_index=True, return_counts=True)
+        offsets = np.append(first, len(order)).astype(np.int64)
+        graphs = np.asarray(graph_column, dtype=np.int32)[order]
+        counts = np.minimum(np.asarray(count_column, dtype=np.int64)[order], 65535).astype(np.uint16)
+
+        idf = np.log(max(len(ids), 1) / np.maximum(df, 1)).astype(np.float32)
+        idf[df > MAX_DF_RATIO * len(ids)] = 0.0
+        norms = np.zeros(len(ids), dtype=np.float32)
+        np.add.at(norms, graphs, counts * np.repeat(idf, df))
+        return cls(keys, offsets, graphs, counts, idf, norms, ids, version)
+
+    def save(self, directory: Union[str, Path]):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / MOTIF_GRAPHS_NAME).write_text(
+            json.dumps({"version": self.version, "ids": self.ids}, ensure_ascii=False), encoding="utf-8")
+        with open(directory / MOTIF_INDEX_NAME, "wb") as f:
+            np.savez(f, keys=self.keys, offsets=self.offsets, graphs=self.graphs, counts=self.counts,
+                     idf=self.idf, norms=self.norms)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> Optional['MotifIndex']:
+        """读取索引，文件缺失或损坏时返回 None"""
+        directory = Path(directory)
+        try:
+            meta = json.loads((directory / MOTIF_GRAPHS_NAME).read_text(encoding="utf-8"))
+            with np.load(directory / MOTIF_INDEX_NAME) as arrays:
+                return cls(arrays["keys"], arrays["offsets"], arrays["graphs"], arrays["counts"],
+                           arrays["idf"], arrays["norms"], meta["ids"], meta["version"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def search(self, features: Dict[int, int], top_k: int = 3) -> List[Tuple[str, float]]:
+        """
+        结构最接近的子图
+
+        Returns:
+            [(子图 ID, 相似度 0~1)]，降序，不含没有共有哈希的子图
+        """
+        if not self.ids or not features:
+            return []
+        query_keys = np.fromiter(features, dtype=np.uint64, count=len(features))
+        query_counts = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+        positions = np.minimum(np.searchsorted(self.keys, query_keys), len(self.keys) - 1)
+        found = self.keys[positions] == query_keys
+        # 语料中没有的哈希按只出现一次计权
+        weights = np.where(found, self.idf[positions], np.float32(np.log(max(len(self.ids), 1))))
+        query_norm = float((query_counts * weights).sum())
+
+        overlap = np.zeros(len(self.ids), dtype=np.float32)
+        for position, count, weight in zip(positions[found], query_counts[found], weights[found]):
+            if weight <= 0:
+                continue
+            start, end = self.offsets[position], self.offsets[position + 1]
+            graphs = self.graphs[start:end]
+            overlap[graphs] += np.minimum(self.counts[start:end], count) * weight
+        matched = np.flatnonzero(overlap > 0)
+        scores = overlap[matched] / (query_norm + self.norms[matched] - overlap[matched])
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(self.ids[matched[i]], float(scores[i])) for i in order]
+
+
+class FeatureStore:
+    """
+    各文档结构特征的持久化缓存（子图 ID -> 特征），增量构建时只更新变化文件的子图，
+    知识库版本变化后由全部特征重建 MotifIndex
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        try:
+            with open(self.path, "rb") as f:
+                self.features: Dict[str, Dict[int, int]] = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.features = {}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.features, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(self.path)
+
+
+def benchmark_motif_index(graphs: int = 10000, nodes: int = 40):
+    """随机分层子图的建立与查询耗时"""
+    rng = np.random.default_rng(0)
+    vocabulary = ["compare", "add", "switch", "limit", "latch", "logic", "swInput", "multiply", "delayOn", "pid"]
+    corpus = []
+    for graph in range(graphs):
+        types = list(rng.choice(vocabulary, nodes))
+        edges = [(int(rng.integers(0, i)), i) for i in range(1, nodes) for _ in range(int(rng.integers(1, 3)))]
+        corpus.append((f"g{graph}", wl_features(*motif_graph(types, edges))))
+    start = time.perf_counter()
+    index = MotifIndex.build(corpus)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    for _, features in corpus[:100]:
+        index.search(features, top_k=5)
+    elapsed = (time.perf_counter() - start) / 100
+    print(f"{graphs} 个子图 / {len(index.keys)} 个哈希: 建立 {built:.2f} s，查询 {elapsed * 1000:.2f} ms")
+
+
+def test_motif_index():
+    """测试结构检索：草稿流程与部分计划匹配到样本工程"""
+    from kong_sdk import COMPONENT_DIR
+    from .knowledge_base import parse_file, knowledge_files
+
+    corpus = [(document.id, document.features) for path in knowledge_files(COMPONENT_DIR)
+              for document in parse_file(path) if document.features]
+    # 干扰项：同样组件、不同结构的线性链
+    chain = ["swInput", "limit", "switch", "add", "latch", "compare", "logic"]
+    corpus.append(("demo:chain", wl_features(*motif_graph(chain, [(i, i + 1) for i in range(len(chain) - 1)]))))
+    index = MotifIndex.build(corpus)
+
+    flow = FlowBuilder()
+    temp = flow.add_node("swInput", "湿球温度")
+    compares = [flow.add_node("compare", f"比较{i}") for i in range(5)]
+    total = flow.add_node("add", "档位累加")
+    switch = flow.add_node("switch", "手自动切换")
+    for i, compare in enumerate(compares):
+        temp.connect(compare, 0, 0)
+        compare.connect(total, 0, i)
+    total.connect(switch, 0, 1)
+    print(f"草稿流程: {index.search(flow_features(flow))}")
+
+    plan = {"steps": [{"node_type": "swInput", "inputs": []}, {"node_type": "compare", "inputs": ["t"]},
+                      {"node_type": "add", "inputs": ["c"]}, {"node_type": "switch", "inputs": ["a"]}]}
+    print(f"部分计划: {index.search(plan_features(plan))}")
+    print()
+    benchmark_motif_index()
+
+
+if __name__ == "__main__":
+    test_motif_index()
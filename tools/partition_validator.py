@@ -0,0 +1,334 @@
+"""
+并行验证工具 (Partition Validator)
+职责：按 tab / subflow 容器划分原生格式组态，在进程池中并行检查各分区，
+      再用一次跨分区检查解析 quote 引用、subflow 端口绑定与跨容器连线
+"""
+import os
+import heapq
+import time
+import tempfile
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, NamedTuple, Union, IO
+
+from kong_sdk import get_registry, _load_json
+from .flow_validator import (ValidationReport, Diagnostic, _diagnostic, _csr, _cycle_diagnostics,
+                             _isolated)
+from .stream_validator import (StreamingValidator, _WIRE, _dangling_reference, _out_port_error,
+                               _write_archive)
+
+
+PARALLEL_THRESHOLD = 2000  # 元素数少于该值时在本进程内检查（进程池启动开销大于收益）
+TASKS_PER_WORKER = 4  # 每个工作进程分到的任务数，用于平衡大小悬殊的分区
+
+
+class _PartitionSummary(NamedTuple):
+    """一组分区的检查结果，由工作进程传回主进程"""
+    diagnostics: List[Diagnostic]  # 分区内即可确定的诊断
+    cycles: List[Diagnostic]  # 分区内的环路（存在跨分区连线时由主进程重新检测）
+    ids: List[str]
+    locations: array
+    type_names: List[str]
+    type_codes: array
+    sources: array
+    targets: array
+    self_loops: List[int]
+    pending: List[Tuple[str, int, int, int, int, int]]  # (源 ID, 种类, 目标编号, 输入端口, 源输出端口, 位置)
+    isolated: List[int]  # 分区内既无连线也未被引用的节点
+    wire_count: int
+
+
+class PartitionValidator(StreamingValidator):
+    """
+    工作进程内的分区验证器
+
+    预先载入全部 subflow 的端口数，分区内的 subflow 实例与 subflow 输入端口引用可就地检查；
+    源节点不在本分区的引用不报错，交给跨分区检查。
+    """
+
+    def __init__(self, subflow_ports: Dict[str, Tuple[int, int]], registry=None):
+        super().__init__(registry)
+        self.subflow_ports = dict(subflow_ports)
+
+    def summary(self) -> _PartitionSummary:
+        """分区内的检查结果（容器归属与 ID 唯一性由主进程在划分时检查）"""
+        self._check_instances()
+        offsets, adjacency = _csr(len(self.ids), self.sources, self.targets)
+        cycles = _cycle_diagnostics(self.ids, offsets, adjacency, self.self_loops, self.locations)
+        pending = [(source_id, *ref) for source_id, refs in self.pending.items() for ref in refs]
+        return _PartitionSummary(
+            self.diagnostics, cycles, self.ids, self.locations, self.type_names, self.type_codes,
+            self.sources, self.targets, self.self_loops, pending,
+            _isolated(len(self.ids), offsets, self.targets, self.linked), self.wire_count)
+
+
+def _validate_bin(items: List[Dict[str, Any]], positions: List[int],
+                  subflow_ports: Dict[str, Tuple[int, int]], registry) -> _PartitionSummary:
+    validator = PartitionValidator(subflow_ports, registry)
+    for position in positions:
+        validator.feed(position, items[position])
+    return validator.summary()
+
+
+# 工作进程的共享输入：fork 启动时直接继承，不经序列化
+_worker_state: Optional[tuple] = None
+
+
+def _init_worker(items: List[Dict[str, Any]], subflow_ports: Dict[str, Tuple[int, int]], registry):
+    global _worker_state
+    _worker_state = (items, subflow_ports, registry)
+
+
+def _validate_worker_bin(positions: List[int]) -> _PartitionSummary:
+    items, subflow_ports, registry = _worker_state
+    return _validate_bin(items, positions, subflow_ports, registry)
+
+
+class ParallelValidator:
+    """
+    按容器分区的并行验证器
+
+    主进程一次遍历元素：检查 ID 唯一性与容器归属，按 z 划分分区，并记录各 subflow 的端口数；
+    分区按大小装箱后交给进程池检查，同一容器的节点总在同一个工作进程中。
+    工作进程返回紧凑的分区摘要，主进程只需处理源节点在其他分区的引用：
+    quote 标签、跨容器连线。只有存在跨容器连线时才在全图上重新检测环路。
+    """
+
+    def __init__(self, workers: Optional[int] = None, registry=None,
+                 threshold: int = PARALLEL_THRESHOLD):
+        """
+        Args:
+            workers: 工作进程数，默认为 CPU 核数
+            registry: 组件注册表，默认使用共享注册表
+            threshold: 元素数少于该值时不启动进程池
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.registry = registry or get_registry()
+        self.threshold = threshold
+
+    def validate(self, items: List[Dict[str, Any]]) -> ValidationReport:
+        """
+        验证已解析的原生格式元素列表
+
+        Returns:
+            ValidationReport（诊断的 offset 为元素在列表中的序号）
+        """
+        diagnostics: List[Diagnostic] = []
+        partitions: Dict[Optional[str], List[int]] = {}
+        containers = set()
+        subflow_ports: Dict[str, Tuple[int, int]] = {}
+        seen = set()
+        for position, item in enumerate(items):
+            item_id, item_type = item.get("id"), item.get("type")
+            is_container = item_type in ("tab", "subflow")
+            if item_id is None:
+                diagnostics.append(_diagnostic(
+                    "E101", f"元素缺少 ID: {item.get('name', item_type)}", None, position))
+                continue
+            if item_id in seen:
+                what = "容器" if is_container else "节点"
+                diagnostics.append(_diagnostic("E102", f"{what} ID 重复: {item_id}", item_id, position))
+                continue
+            seen.add(item_id)
+            if is_container:
+                containers.add(item_id)
+                if item_type == "subflow":
+                    subflow_ports[item_id] = (len(item.get("in", [])), len(item.get("out", [])))
+                partitions.setdefault(item_id, []).append(position)
+            else:
+                partitions.setdefault(item.get("z"), []).append(position)
+
+        for z, positions in partitions.items():
+            if z is not None and z not in containers:
+                for position in positions:
+                    node_id = items[position]["id"]
+                    diagnostics.append(_diagnostic(
+                        "E106", f"节点 {node_id} 所属的容器不存在: {z}", node_id, position))
+
+        summaries = self._run(items, self._bins(list(partitions.values())), subflow_ports)
+        report = self._merge(summaries, subflow_ports, diagnostics)
+        report.diagnostics.sort(key=lambda d: -1 if d.offset is None else d.offset)
+        return report
+
+    def _bins(self, partitions: List[List[int]]) -> List[List[int]]:
+        """最长处理时间优先（LPT）装箱：大分区先分配给当前最轻的箱"""
+        count = min(len(partitions), self.workers * TASKS_PER_WORKER) or 1
+        heap = [(0, index) for index in range(count)]
+        bins: List[List[int]] = [[] for _ in range(count)]
+        for positions in sorted(partitions, key=len, reverse=True):
+            size, index = heapq.heappop(heap)
+            bins[index].extend(positions)
+            heapq.heappush(heap, (size + len(positions), index))
+        for positions in bins:
+            positions.sort()  # 分区内按原顺序检查，诊断顺序与流式验证一致
+        return [positions for positions in bins if positions]
+
+    def _run(self, items: List[Dict[str, Any]], bins: List[List[int]],
+             subflow_ports: Dict[str, Tuple[int, int]]) -> List[_PartitionSummary]:
+        if self.workers <= 1 or len(bins) <= 1 or len(items) < self.threshold:
+            return [_validate_bin(items, positions, subflow_ports, self.registry) for positions in bins]
+        # fork 启动的工作进程直接继承已解析的元素，无需逐个序列化
+        context = (multiprocessing.get_context("fork")
+                   if "fork" in multiprocessing.get_all_start_methods() else None)
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(bins)), mp_context=context,
+                                 initializer=_init_worker,
+                                 initargs=(items, subflow_ports, self.registry)) as pool:
+            return list(pool.map(_validate_worker_bin, bins))
+
+    def _merge(self, summaries: List[_PartitionSummary], subflow_ports: Dict[str, Tuple[int, int]],
+               diagnostics: List[Diagnostic]) -> ValidationReport:
+        """跨分区检查：解析其他分区中的引用源，合并环路与悬空节点诊断"""
+        bases = []
+        node_count = 0
+        wire_count = 0
+        for summary in summaries:
+            bases.append(node_count)
+            node_count += len(summary.ids)
+            wire_count += summary.wire_count
+            diagnostics.extend(summary.diagnostics)
+
+        index_of: Dict[str, Tuple[int, int]] = {}
+        if any(summary.pending for summary in summaries):
+            for part, summary in enumerate(summaries):
+                for local, node_id in enumerate(summary.ids):
+                    index_of[node_id] = (part, local)
+
+        linked = set()  # 经跨分区引用连接的节点（全局编号）
+        cross_sources = array("i")
+        cross_targets = array("i")
+        for part, summary in enumerate(summaries):
+            for source_id, kind, target, in_port, out_port, position in summary.pending:
+                owner = summary.ids[target] if target >= 0 else None
+                location = index_of.get(source_id)
+                if location is None:
+                    diagnostics.append(_dangling_reference(kind, source_id, out_port, owner, position))
+                    continue
+                source_part, local = location
+                source_summary = summaries[source_part]
+                source_type = source_summary.type_names[source_summary.type_codes[local]]
+                message = _out_port_error(self.registry, subflow_ports, source_type, out_port)
+                if message:
+                    diagnostics.append(_diagnostic("E203", f"引用 {source_id}: {message}",
+                                                   source_id, position))
+                source = bases[source_part] + local
+                linked.add(source)
+                if target >= 0:
+                    linked.add(bases[part] + target)
+                if kind != _WIRE:
+                    continue
+                wire_count += 1
+                if target >= 0:
+                    cross_sources.append(source)
+                    cross_targets.append(bases[part] + target)
+
+        if cross_sources:
+            diagnostics.extend(self._global_cycles(summaries, bases, cross_sources, cross_targets))
+        else:
+            for summary in summaries:
+                diagnostics.extend(summary.cycles)
+
+        # 悬空节点只提示（单节点画布例外）
+        if node_count > 1:
+            for part, summary in enumerate(summaries):
+                for local in summary.isolated:
+                    if bases[part] + local not in linked:
+                        node_id = summary.ids[local]
+                        diagnostics.append(_diagnostic("W101", f"悬空节点（可能合理）: {node_id}",
+                                                       node_id, summary.locations[local]))
+        return ValidationReport(diagnostics, node_count, wire_count)
+
+    @staticmethod
+    def _global_cycles(summaries: List[_PartitionSummary], bases: List[int], cross_sources: array,
+                       cross_targets: array) -> List[Diagnostic]:
+        """存在跨容器连线时，环路可能跨越分区，在合并后的全图上重新检测"""
+        ids: List[str] = []
+        locations = array("q")
+        sources, targets = array("i"), array("i")
+        self_loops: List[int] = []
+        for base, summary in zip(bases, summaries):
+            ids.extend(summary.ids)
+            locations.extend(summary.locations)
+            sources.extend(source + base for source in summary.sources)
+            targets.extend(target + base for target in summary.targets)
+            self_loops.extend(index + base for index in summary.self_loops)
+        sources.extend(cross_sources)
+        targets.extend(cross_targets)
+        offsets, adjacency = _csr(len(ids), sources, targets)
+        return _cycle_diagnostics(ids, offsets, adjacency, self_loops, locations)
+
+
+def validate_kongcube_parallel(source: Union[str, Path, IO, List[Dict[str, Any]]],
+                               workers: Optional[int] = None) -> ValidationReport:
+    """
+    按容器并行验证 KONG CUBE 原生格式组态
+
+    Args:
+        source: 文件路径、文件对象，或已解析的元素列表
+        workers: 工作进程数，默认为 CPU 核数
+
+    Returns:
+        ValidationReport（诊断的 offset 为元素序号）
+    """
+    items = source if isinstance(source, list) else _load_json(source)
+    if not isinstance(items, list):
+        return ValidationReport([_diagnostic("E100", "原生格式文件应为 JSON 数组")])
+    return ParallelValidator(workers).validate(items)
+
+
+def benchmark_partition_validator(copies: int = 400, workers: Tuple[int, ...] = (1, 2, 4, 8)):
+    """多楼栋归档的验证耗时随工作进程数的变化（不含文件解析）"""
+    sample = Path(__file__).resolve().parent.parent / "json" / "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "archive.json"
+        _write_archive(path, sample, copies)
+        items = _load_json(path)
+    print(f"{len(items)} 个元素，CPU 核数 {os.cpu_count()}")
+    for count in workers:
+        start = time.perf_counter()
+        report = ParallelValidator(count).validate(items)
+        elapsed = time.perf_counter() - start
+        print(f"  {count} 个进程: {elapsed * 1000:8.1f} ms  诊断 {len(report.diagnostics)} 条")
+
+
+def test_partition_validator():
+    """测试并行验证：结果应与流式验证一致"""
+    import io
+    import json
+    from .stream_validator import validate_kongcube_stream
+
+    items = [
+        {"id": "t1", "type": "tab", "label": "1 号楼"},
+        {"id": "t2", "type": "tab", "label": "2 号楼"},
+        {"id": "sf", "type": "subflow", "name": "加法模块", "in": [{"wires": [{"id": "a1"}]}],
+         "out": [{"wires": [{"id": "a1", "port": 0}]}, {"wires": [{"id": "gone", "port": 0}]}]},
+        {"id": "a1", "type": "add", "z": "sf", "wires": [[{"id": "sf", "port": 0}], [{"id": "sf", "port": 3}]]},
+        {"id": "s1", "type": "swInput", "z": "t1", "wires": [[], []]},
+        {"id": "i1", "type": "subflow:sf", "z": "t1", "wires": [[{"id": "s1", "port": 0}]]},
+        {"id": "q2", "type": "quote", "z": "t2", "labelName": "[i1:1] 1 号楼输出", "wires": []},
+        {"id": "c2", "type": "compare", "z": "t2", "wires": [[{"id": "q2", "port": 0}]]},
+        # 跨容器连线构成的环路：x1(t1) -> x2(t2) -> x1
+        {"id": "x1", "type": "add", "z": "t1", "wires": [[{"id": "x2", "port": 0}]]},
+        {"id": "x2", "type": "add", "z": "t2", "wires": [[{"id": "x1", "port": 0}]]},
+        {"id": "u", "type": "add", "z": "t9", "wires": [[{"id": "missing", "port": 0}]]},
+        {"id": "s1", "type": "constInput", "z": "t2"},
+        {"id": "lonely", "type": "constInput", "z": "t2"},
+    ]
+
+    def codes(report):
+        return sorted((d.code, d.node or "") for d in report.diagnostics)
+
+    parallel = ParallelValidator(workers=2, threshold=0).validate(items)
+    stream = validate_kongcube_stream(io.BytesIO(json.dumps(items).encode("utf-8")))
+    print(f"通过: {parallel.passed}，{parallel.node_count} 个节点，{parallel.wire_count} 条连线")
+    for diagnostic in parallel.diagnostics:
+        print(f"  {diagnostic.severity:<7} {diagnostic}")
+    print(f"与流式验证一致: {codes(parallel) == codes(stream)}"
+          f"（连线数 {parallel.wire_count} / {stream.wire_count}）")
+    print()
+    benchmark_partition_validator()
+
+
+if __name__ == "__main__":
+    test_partition_validator()
@@ -0,0 +1,206 @@
+"""
+执行结果缓存 (Result Cache)
+职责：按 (代码, 执行环境版本, 组件库版本) 的哈希持久化沙箱执行结果与导出的流程图，
+      重复出现的代码（如调试阶段 LLM 给出的相同修正、基准测试重跑）不再进入沙箱
+"""
+import json
+import time
+import pickle
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Any, Optional, Union
+
+import kong_sdk
+from kong_sdk import get_registry
+from . import sandbox, code_checker
+from .sandbox import decode_result
+
+
+DEFAULT_CACHE_PATH = Path(kong_sdk.__file__).resolve().parent / ".cache" / "execution_results.sqlite3"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 缓存内容总大小上限（字节）
+
+# 与代码本身无关、换个时间重跑可能得到不同结果的失败不缓存
+_UNCACHEABLE_ERRORS = frozenset({
+    "TimeoutError", "SandboxCrashed", "ResultDecodeError", "CpuTimeExceeded", "MemoryError",
+})
+
+# 结果字典中只对本次调用有意义的字段
+_TRANSIENT_FIELDS = ("flow", "elapsed", "index", "cached")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    flow BLOB,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+CACHE_FORMAT = 1  # 结果字典的存储格式变化时递增
+
+_runtime_version: Optional[str] = None
+
+
+def runtime_version() -> str:
+    """
+    执行环境的版本：缓存格式与 kong_sdk、沙箱（如强制确定性 ID、入口函数调用）、
+    静态检查器源码的哈希，任何一项变化后旧结果自动失效
+    """
+    global _runtime_version
+    if _runtime_version is None:
+        digest = hashlib.sha256(f"format={CACHE_FORMAT}".encode("ascii"))
+        for module in (kong_sdk, sandbox, code_checker):
+            digest.update(b"\0")
+            digest.update(Path(module.__file__).read_bytes())
+        _runtime_version = digest.hexdigest()[:16]
+    return _runtime_version
+
+
+class ResultCache:
+    """
+    基于 SQLite 的内容寻址执行结果缓存
+
+    结果字典以 JSON 存储，generate_flow() 返回的 FlowBuilder 以 pickle 存储，
+    读取时经与沙箱结果通道相同的受限反序列化器还原。
+    内容总大小超过上限时按最近访问时间淘汰（LRU）。
+    """
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_CACHE_PATH,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        打开（或创建）缓存数据库
+
+        Args:
+            path: SQLite 文件路径，":memory:" 表示仅在进程内缓存
+            max_bytes: 缓存内容总大小上限（字节）
+        """
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code: str) -> str:
+        """缓存键：代码、执行环境版本与组件库版本的哈希"""
+        digest = hashlib.sha256()
+        for part in (runtime_version(), get_registry().version, code):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+
+        Returns:
+            执行结果字典（"cached" 为 True），未命中返回 None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT payload, flow FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+
+        result = json.loads(row[0])
+        if row[1] is not None:
+            result["flow"] = decode_result(row[1])
+        result["cached"] = True
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> bool:
+        """
+        写入执行结果；超时、沙箱崩溃等与代码无关的失败以及无法序列化的结果不写入
+
+        Returns:
+            是否写入
+        """
+        error = result.get("error")
+        if error and error.get("type") in _UNCACHEABLE_ERRORS:
+            return False
+        try:
+            payload = json.dumps({k: v for k, v in result.items() if k not in _TRANSIENT_FIELDS},
+                                 ensure_ascii=False).encode("utf-8")
+        except (TypeError, ValueError):
+            return False
+        flow = result.get("flow")
+        flow = pickle.dumps(flow, protocol=pickle.HIGHEST_PROTOCOL) if flow is not None else None
+        size = len(payload) + (len(flow) if flow is not None else 0)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                             (key, payload, flow, size, time.time()))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+        return True
+
+    def _evict(self):
+        """从最近访问的条目开始累计大小，删除超出上限的部分"""
+        self._db.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running FROM results
+                ) WHERE running > ?
+            )""", (self.max_bytes,))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计与缓存占用"""
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+
+def test_result_cache():
+    """测试执行结果缓存"""
+    cache = ResultCache(":memory:", max_bytes=4096)
+    key = cache.key("print(1)")
+    print(f"未命中: {cache.get(key) is None}")
+    cache.put(key, {"success": True, "result": None, "stdout": "1\n", "stderr": "", "error": None,
+                    "elapsed": 0.01})
+    print(f"命中: {cache.get(key)}")
+
+    # 超时与代码无关，不缓存
+    timeout_key = cache.key("while True: pass")
+    stored = cache.put(timeout_key, {"success": False, "result": None, "stdout": "", "stderr": "",
+                                     "error": {"type": "TimeoutError", "message": "", "traceback": ""}})
+    print(f"超时结果写入: {stored}")
+
+    # 超过大小上限时淘汰最久未访问的条目
+    for i in range(20):
+        cache.put(cache.key(f"print({i})"), {"success": True, "result": None, "stdout": "x" * 500,
+                                             "stderr": "", "error": None})
+    print(f"统计: {cache.stats()}")
+    cache.close()
+
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -0,0 +1,266 @@
+"""
+检索缓存 (Retrieval Cache)
+职责：两级缓存查询向量与检索结果——进程内 LRU 在前，SQLite 磁盘缓存在后；
+      检索结果的键包含知识库版本，重新构建知识库后旧结果自动失效，条目另有过期时间
+"""
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Union
+
+import numpy as np
+
+
+EMBEDDING = "embedding"
+RESULT = "result"
+
+DEFAULT_MEMORY_ENTRIES = 256  # 进程内 LRU 条数（两类合计）
+DEFAULT_TTL = 24 * 3600  # 条目有效期（秒），0 表示不过期
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 磁盘缓存内容总大小上限（字节）
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+def cache_key(kind: str, *parts: Any) -> str:
+    """缓存键：类别与各组成部分（模型标识、知识库版本、查询参数等）的哈希"""
+    digest = hashlib.sha256(kind.encode("utf-8"))
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+    return f"{kind}:{digest.hexdigest()}"
+
+
+def _encode(kind: str, value: Any) -> bytes:
+    if kind == EMBEDDING:
+        return np.asarray(value, dtype=np.float32).tobytes()
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(kind: str, payload: bytes) -> Any:
+    if kind == EMBEDDING:
+        return np.frombuffer(payload, dtype=np.float32)  # 只读，多次命中共享同一块内存
+    return json.loads(payload)
+
+
+class RetrievalCache:
+    """
+    两级检索缓存
+
+    进程内 LRU 保存编码后的内容（向量为 float32 字节，检索结果为 JSON），命中时解码，
+    调用方修改返回值不会影响缓存；未命中时查询 SQLite，命中后提升到 LRU。
+    磁盘缓存内容总大小超过上限时按最近访问时间淘汰，过期条目在读取或打开时删除。
+    各类别分别统计内存命中、磁盘命中、未命中次数与查询、计算耗时。
+    """
+
+    def __init__(self, path: Union[str, Path] = ":memory:", memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        打开（或创建）缓存
+
+        Args:
+            path: SQLite 文件路径，":memory:" 表示仅在进程内缓存
+            memory_entries: 进程内 LRU 条数
+            ttl: 条目有效期（秒），0 表示不过期
+            max_bytes: 磁盘缓存内容总大小上限（字节）
+        """
+        self.path = str(path)
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # 键 -> (创建时间, 编码内容)
+        self._counters = {kind: dict.fromkeys(("memory_hits", "disk_hits", "misses", "lookup_seconds",
+                                               "compute_seconds"), 0)
+                          for kind in (EMBEDDING, RESULT)}
+        if self.ttl:
+            with self._lock:
+                self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+                self._db.commit()
+
+    def _expired(self, created: float) -> bool:
+        return bool(self.ttl) and created < time.time() - self.ttl
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """
+        查询缓存
+
+        Returns:
+            缓存的向量（np.ndarray）或检索结果，未命中或已过期返回 None
+        """
+        start = time.perf_counter()
+        counters = self._counters[kind]
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                counters["memory_hits"] += 1
+            else:
+                row = self._db.execute("SELECT payload, created FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[1]):
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._db.commit()
+                    row = None
+                if row is None:
+                    counters["misses"] += 1
+                    counters["lookup_seconds"] += time.perf_counter() - start
+                    return None
+                counters["disk_hits"] += 1
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+                entry = (row[1], bytes(row[0]))
+                self._remember(key, entry)
+        value = _decode(kind, entry[1])
+        counters["lookup_seconds"] += time.perf_counter() - start
+        return value
+
+    def put(self, kind: str, key: str, value: Any) -> bool:
+        """
+        写入两级缓存；无法序列化或超过大小上限的内容不写入
+
+        Returns:
+            是否写入
+        """
+        try:
+            payload = _encode(kind, value)
+        except (TypeError, ValueError):
+            return False
+        if len(payload) > self.max_bytes:
+            return False
+        now = time.time()
+        with self._lock:
+            self._remember(key, (now, payload))
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (key, payload, len(payload), now, now))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+        return True
+
+    def get_or_compute(self, kind: str, key: str, compute: Callable[[], Any]) -> Any:
+        """命中则返回缓存内容，否则计算、写入并返回（计算耗时计入统计）"""
+        value = self.get(kind, key)
+        if value is not None:
+            return value
+        start = time.perf_counter()
+        value = compute()
+        self._counters[kind]["compute_seconds"] += time.perf_counter() - start
+        self.put(kind, key, value)
+        return value
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """从最近访问的条目开始累计大小，删除超出上限的部分"""
+        self._db.execute("""
+            DELETE FROM entries WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running FROM entries
+                ) WHERE running > ?
+            )""", (self.max_bytes,))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        各类别的命中计数、命中率与平均耗时（毫秒），以及磁盘缓存占用
+
+        lookup_ms 为每次查询缓存的平均耗时，compute_ms 为每次未命中后计算的平均耗时。
+        """
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            memory = len(self._memory)
+        result: Dict[str, Any] = {"entries": entries, "bytes": size, "memory_entries": memory}
+        for kind, counters in self._counters.items():
+            lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+            result[kind] = {
+                "memory_hits": counters["memory_hits"], "disk_hits": counters["disk_hits"],
+                "misses": counters["misses"],
+                "hit_rate": round((lookups - counters["misses"]) / lookups, 4) if lookups else 0.0,
+                "lookup_ms": round(counters["lookup_seconds"] * 1000 / lookups, 4) if lookups else 0.0,
+                "compute_ms": (round(counters["compute_seconds"] * 1000 / counters["misses"], 4)
+                               if counters["misses"] else 0.0),
+            }
+        return result
+
+    def clear(self):
+        """清空两级缓存（统计保留）"""
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+
+def test_retrieval_cache():
+    """测试两级缓存：内存命中、进程重启后的磁盘命中、版本失效与过期"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "retrieval_cache.sqlite3"
+        cache = RetrievalCache(path, memory_entries=2)
+        calls = []
+
+        def embed():
+            calls.append(1)
+            time.sleep(0.01)  # 模拟向量化请求
+            return [0.1, 0.2, 0.3]
+
+        key = cache_key(EMBEDDING, "HashingEmbedder:", "冷冻水泵台数控制")
+        for _ in range(3):
+            cache.get_or_compute(EMBEDDING, key, embed)
+        print(f"向量计算 {len(calls)} 次: {cache.get(EMBEDDING, key)}")
+
+        result = {"query": "冷冻水泵台数控制", "relevant_nodes": [], "similar_cases": ["工程 A"]}
+        cache.put(RESULT, cache_key(RESULT, "v1", "冷冻水泵台数控制", 5), result)
+        cache.close()
+
+        # 新进程：内存为空，从磁盘命中；知识库版本变化后未命中
+        cache = RetrievalCache(path, memory_entries=2)
+        print(f"磁盘命中: {cache.get(RESULT, cache_key(RESULT, 'v1', '冷冻水泵台数控制', 5))}")
+        print(f"新版本: {cache.get(RESULT, cache_key(RESULT, 'v2', '冷冻水泵台数控制', 5))}")
+        cache.close()
+
+        cache = RetrievalCache(path, ttl=1e-6)
+        print(f"过期后: {cache.get(EMBEDDING, key)}，剩余 {cache.stats()['entries']} 条")
+        cache.close()
+
+        cache = RetrievalCache(path)
+        for i in range(1000):
+            cache.put(RESULT, cache_key(RESULT, "v1", f"查询{i % 50}", 5), result)
+            cache.get(RESULT, cache_key(RESULT, "v1", f"查询{(i * 7) % 60}", 5))
+        print(f"统计: {cache.stats()}")
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_retrieval_cache()
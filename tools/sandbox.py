@@ -0,0 +1,484 @@
+"""
+沙箱进程池 (Sandbox Pool)
+职责：在预先启动、已导入 kong_sdk 的工作进程中执行生成的代码，
+      并限制墙钟时间、CPU 时间、内存与输出大小
+"""
+import io
+import os
+import sys
+import json
+import math
+import pickle
+import marshal
+import time
+import atexit
+import signal
+import threading
+import traceback
+import subprocess
+from pathlib import Path
+from collections import deque
+from queue import Queue, Empty
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Any, Optional, Union, Sequence, Iterator, Tuple, List
+
+from kong_sdk import FlowBuilder
+
+try:
+    import resource  # 仅 POSIX 平台可用，其他平台只保留墙钟超时
+except ImportError:
+    resource = None
+
+
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024  # 单个工作进程的地址空间上限（字节）
+DEFAULT_OUTPUT_LIMIT = 1024 * 1024  # 单个任务 stdout + stderr 的字符数上限
+DEFAULT_MAX_JOBS = 50  # 工作进程执行多少个任务后回收重建
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 工作进程按文件路径加载本模块，不经过 tools 包：tools/__init__ 会导入 numpy、sqlite3、向量库等，
+# 既拖慢启动，也会占用受 RLIMIT_AS 限制的地址空间
+_WORKER_BOOTSTRAP = (
+    "import sys, importlib.util\n"
+    "spec = importlib.util.spec_from_file_location('_sandbox_worker', sys.argv[1])\n"
+    "module = importlib.util.module_from_spec(spec)\n"
+    "sys.modules[spec.name] = module\n"
+    "spec.loader.exec_module(module)\n"
+    "module._worker_entry()\n"
+)
+
+
+class OutputLimitExceeded(RuntimeError):
+    """任务输出超过上限"""
+
+
+class CpuTimeExceeded(RuntimeError):
+    """任务 CPU 时间超过上限"""
+
+
+class _BoundedOutput(io.StringIO):
+    """超过上限即抛出异常的输出缓冲，防止死循环打印耗尽内存"""
+
+    def __init__(self, budget: list):
+        super().__init__()
+        self._budget = budget  # stdout 与 stderr 共享的剩余字符数
+
+    def write(self, text: str) -> int:
+        self._budget[0] -= len(text)
+        if self._budget[0] < 0:
+            raise OutputLimitExceeded("输出超过上限")
+        return super().write(text)
+
+
+def _error(exc_type: str, message: str, tb: str = "") -> Dict[str, Any]:
+    return {"type": exc_type, "message": message, "traceback": tb}
+
+
+def run_job(code: Union[str, bytes], output_limit: int = DEFAULT_OUTPUT_LIMIT,
+            entry: bool = False) -> Dict[str, Any]:
+    """
+    在当前进程中执行代码并捕获输出（工作进程内调用）
+
+    Args:
+        code: Python 代码字符串，或 marshal 序列化的代码对象（已由静态检查编译）
+        output_limit: stdout + stderr 的字符数上限
+        entry: 代码定义了 generate_flow() 时为 True：模块不以 __main__ 身份执行，
+               而是直接调用 generate_flow()，返回值放入 "flow" 字段（不经过 stdout）
+
+    Returns:
+        执行结果字典
+    """
+    result = {
+        "success": False,
+        "result": None,
+        "stdout": "",
+        "stderr": "",
+        "error": None
+    }
+
+    # 重定向标准输出和标准错误
+    old_stdout, old_stderr = sys.stdout, sys.stderr
+    budget = [output_limit]
+    sys.stdout = stdout = _BoundedOutput(budget)
+    sys.stderr = stderr = _BoundedOutput(budget)
+
+    try:
+        global_namespace = {
+            "__name__": "__sandbox__" if entry else "__main__",
+            "__builtins__": __builtins__
+        }
+        exec(marshal.loads(code) if isinstance(code, bytes) else code, global_namespace)
+        if entry:
+            result["flow"] = global_namespace["generate_flow"]()
+
+        result["stdout"] = stdout.getvalue()
+        stdout_text = result["stdout"].strip()
+        if stdout_text and not entry:
+            try:
+                result["result"] = json.loads(stdout_text)
+            except json.JSONDecodeError:
+                # 如果不是 JSON，保存原始文本
+                result["result"] = stdout_text
+        result["success"] = True
+
+    except BaseException as e:  # 包括 SystemExit / KeyboardInterrupt，避免工作进程退出
+        result["error"] = _error(type(e).__name__, str(e), traceback.format_exc())
+        result["stdout"] = stdout.getvalue()
+
+    finally:
+        sys.stdout, sys.stderr = old_stdout, old_stderr
+        result["stderr"] = stderr.getvalue()
+
+    return result
+
+
+# 结果通道允许反序列化的类型（结果来自执行不受信任代码的进程，不能使用不受限的 pickle）
+_RESULT_CLASSES = frozenset({
+    ("builtins", "set"), ("builtins", "frozenset"), ("builtins", "slice"), ("builtins", "complex"),
+    ("array", "array"), ("array", "_array_reconstructor"),
+    ("kong_sdk", "FlowBuilder"),
+})
+
+
+class _ResultUnpickler(pickle.Unpickler):
+    """只允许基础容器、array 与 FlowBuilder 的反序列化器"""
+
+    def find_class(self, module: str, name: str):
+        if (module, name) not in _RESULT_CLASSES:
+            raise pickle.UnpicklingError(f"沙箱结果中包含不允许的类型: {module}.{name}")
+        return super().find_class(module, name)
+
+
+def decode_result(data: bytes) -> Any:
+    """还原沙箱结果帧（或缓存的 FlowBuilder）：只允许基础容器、array 与 FlowBuilder"""
+    return _ResultUnpickler(io.BytesIO(data)).load()
+
+
+def _raise_cpu_exceeded(signum, frame):
+    raise CpuTimeExceeded("CPU 时间超过上限")
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_main(conn_in: Connection, conn_out: Connection, memory_limit: Optional[int],
+                 output_limit: int, cpu_time: Optional[float]):
+    """工作进程主循环：逐个接收代码并返回结果，收到 None 时退出"""
+    import kong_sdk  # 启动时导入并加载组件注册表，之后的任务无需再导入
+    # 沙箱内统一使用确定性 ID，相同代码得到相同组态
+    kong_sdk.FlowBuilder.default_deterministic_ids = True
+
+    if resource is not None:
+        if memory_limit:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if cpu_time:
+            signal.signal(signal.SIGXCPU, _raise_cpu_exceeded)
+
+    while True:
+        try:
+            job = conn_in.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        code, entry = job
+
+        if resource is not None and cpu_time:
+            # RLIMIT_CPU 按进程累计计时，每个任务在当前用量基础上放宽 cpu_time 秒
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(_cpu_seconds() + cpu_time), hard))
+        try:
+            result = run_job(code, output_limit, entry)
+        finally:
+            if resource is not None and cpu_time:
+                resource.setrlimit(resource.RLIMIT_CPU, (resource.RLIM_INFINITY, hard))
+        _send_result(conn_out, result)
+
+
+def _send_result(conn: Connection, result: Dict[str, Any]):
+    """
+    发送结果：第一帧为执行结果（stdout / 错误等），
+    generate_flow() 的返回值作为第二个二进制帧单独发送，不经过 JSON 文本
+    """
+    payload = None
+    if "flow" in result:
+        try:
+            payload = pickle.dumps(result.pop("flow"), protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            result["success"] = False
+            result["error"] = _error(type(e).__name__, f"generate_flow() 的返回值无法序列化: {e}")
+    result["has_flow"] = payload is not None
+    conn.send_bytes(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    if payload is not None:
+        conn.send_bytes(payload)
+
+
+def _worker_entry():
+    """工作进程入口（由 SandboxPool 以独立解释器启动，参数见 _Worker）"""
+    read_fd, write_fd, memory_limit, output_limit, cpu_time = sys.argv[2:7]
+    _worker_main(Connection(int(read_fd), writable=False), Connection(int(write_fd), readable=False),
+                 int(memory_limit) or None, int(output_limit), float(cpu_time) or None)
+
+
+class _Worker:
+    """
+    一个沙箱工作进程及其通信管道
+
+    工作进程是独立启动的精简解释器：按文件路径加载本模块（不执行 tools/__init__），
+    除标准库外只导入 kong_sdk，不会继承调用方的模块与线程，也不会重新执行调用方的主脚本。
+    """
+
+    __slots__ = ("process", "conn_in", "conn_out", "jobs")
+
+    def __init__(self, args: tuple):
+        job_read, job_write = os.pipe()
+        result_read, result_write = os.pipe()
+        memory_limit, output_limit, cpu_time = args
+        command = [sys.executable, "-c", _WORKER_BOOTSTRAP, str(Path(__file__).resolve()),
+                   str(job_read), str(result_write),
+                   str(memory_limit or 0), str(output_limit), str(cpu_time or 0)]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [str(PROJECT_ROOT), os.environ.get("PYTHONPATH")])))
+        self.process = subprocess.Popen(command, pass_fds=(job_read, result_write),
+                                        cwd=str(PROJECT_ROOT), env=env, stdin=subprocess.DEVNULL)
+        os.close(job_read)
+        os.close(result_write)
+        self.conn_out = Connection(job_write, readable=False)  # 发送任务
+        self.conn_in = Connection(result_read, writable=False)  # 接收结果
+        self.jobs = 0
+
+    def stop(self, force: bool = False):
+        """结束工作进程；force 为 True 时直接杀死（用于超时）"""
+        if not force and self.process.poll() is None:
+            try:
+                self.conn_out.send(None)
+                self.process.wait(1.0)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.conn_out.close()
+        self.conn_in.close()
+
+
+class SandboxPool:
+    """
+    预启动的沙箱进程池
+
+    工作进程在创建进程池时启动并预先导入 kong_sdk，调用时无需启动解释器。
+    墙钟超时由父进程强制（超时即杀死并重建工作进程），
+    CPU 时间、内存通过 RLIMIT_CPU / RLIMIT_AS 在工作进程内限制，
+    输出超过上限时任务失败；每个工作进程执行 max_jobs 个任务后回收重建。
+    """
+
+    def __init__(self, workers: Optional[int] = None, timeout: float = 10.0,
+                 cpu_time: Optional[float] = None,
+                 memory_limit: Optional[int] = DEFAULT_MEMORY_LIMIT,
+                 output_limit: int = DEFAULT_OUTPUT_LIMIT,
+                 max_jobs: int = DEFAULT_MAX_JOBS):
+        """
+        启动工作进程
+
+        Args:
+            workers: 工作进程数，默认为 CPU 核数（至少 2 个）
+            timeout: 单个任务的墙钟超时（秒）
+            cpu_time: 单个任务的 CPU 时间上限（秒），默认与 timeout 相同
+            memory_limit: 单个工作进程的地址空间上限（字节），None 表示不限制
+            output_limit: 单个任务 stdout + stderr 的字符数上限
+            max_jobs: 工作进程执行多少个任务后回收重建
+        """
+        self.timeout = timeout
+        self.max_jobs = max_jobs
+        self._args = (memory_limit, output_limit, cpu_time if cpu_time is not None else timeout)
+        self._idle: "Queue[_Worker]" = Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(workers or max(os.cpu_count() or 1, 2)):
+            self._release(self._spawn())
+        atexit.register(self.close)
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._args)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker, force: bool = False) -> _Worker:
+        """停止工作进程并启动一个新的替代它"""
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        worker.stop(force=force)
+        return self._spawn()
+
+    def _acquire(self, block: bool = True) -> Optional[_Worker]:
+        """取一个空闲工作进程；block 为 False 且没有空闲进程时返回 None"""
+        if self._closed:
+            raise RuntimeError("沙箱进程池已关闭")
+        if block:
+            return self._idle.get()
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            return None
+
+    def _release(self, worker: _Worker):
+        """归还工作进程；达到任务上限的先回收重建"""
+        if self._closed:
+            worker.stop()
+            return
+        if worker.jobs >= self.max_jobs:
+            worker = self._replace(worker)
+        self._idle.put(worker)
+
+    @staticmethod
+    def _send(worker: _Worker, job: tuple):
+        """发送任务；管道已断开时忽略，由随后的读取报告 SandboxCrashed"""
+        try:
+            worker.conn_out.send(job)
+        except OSError:
+            pass
+        worker.jobs += 1
+
+    def _collect(self, worker: _Worker, deadline: float, timeout: float):
+        """
+        读取已发送任务的结果
+
+        超时、工作进程崩溃或结果解码（含 FlowBuilder 还原与导出）失败时替换该工作进程。
+
+        Returns:
+            (可归还的工作进程, 执行结果字典)
+        """
+        try:
+            result = self._receive(worker, deadline)
+            if result is None:
+                worker = self._replace(worker, force=True)
+                result = self._failure("TimeoutError", f"执行超时（{timeout} 秒）")
+        except (EOFError, OSError) as e:
+            # 工作进程异常退出（如超出内存上限被系统杀死）
+            worker = self._replace(worker, force=True)
+            result = self._failure("SandboxCrashed", f"沙箱进程异常退出: {e!r}")
+        except pickle.UnpicklingError as e:
+            # 结果通道中出现不允许的类型，该工作进程不再可信
+            worker = self._replace(worker, force=True)
+            result = self._failure("ResultDecodeError", str(e))
+        except Exception as e:
+            # 工作进程不可信：结果帧不是字典、FlowBuilder 状态畸形（__setstate__ / export_json 失败）等
+            worker = self._replace(worker, force=True)
+            result = self._failure("ResultDecodeError", f"沙箱结果无法解码: {type(e).__name__}: {e}")
+        return worker, result
+
+    def run(self, code: Union[str, bytes], timeout: Optional[float] = None,
+            entry: bool = False) -> Dict[str, Any]:
+        """
+        在空闲工作进程中执行代码（阻塞直到有空闲进程）
+
+        Args:
+            code: Python 代码字符串，或 marshal 序列化的代码对象
+            timeout: 墙钟超时（秒），默认使用进程池的 timeout
+            entry: 直接调用代码中的 generate_flow()，返回值经二进制通道放入 "result"
+                   （返回 FlowBuilder 时另存于 "flow"）
+
+        Returns:
+            执行结果字典，超时 / 工作进程崩溃时 success 为 False
+        """
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._acquire()
+        start = time.monotonic()
+        try:
+            self._send(worker, (code, entry))
+            worker, result = self._collect(worker, start + timeout, timeout)
+        finally:
+            self._release(worker)
+        result["elapsed"] = time.monotonic() - start
+        return result
+
+    def run_many(self, codes: Sequence[Union[str, bytes]], timeout: Optional[float] = None,
+                 entry: Union[bool, Sequence[bool]] = False) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        把多个任务分发到空闲工作进程并行执行，按完成顺序逐个产出结果
+
+        任务数多于空闲进程时，先完成的进程继续执行排队的任务。
+        调用方提前关闭生成器（如拿到第一个成功结果后 break）时，
+        仍在执行的任务所在进程被直接杀死并重建，排队的任务不再执行。
+
+        Args:
+            codes: 代码列表（字符串或 marshal 序列化的代码对象）
+            timeout: 单个任务的墙钟超时（秒），默认使用进程池的 timeout
+            entry: 是否直接调用 generate_flow()，可为与 codes 等长的列表
+
+        Yields:
+            (任务在 codes 中的序号, 执行结果字典)
+        """
+        timeout = self.timeout if timeout is None else timeout
+        entries = [entry] * len(codes) if isinstance(entry, bool) else list(entry)
+        pending = deque(range(len(codes)))
+        busy: Dict[Connection, tuple] = {}  # 结果管道 -> (工作进程, 序号, 开始时间, 截止时间)
+        try:
+            while pending or busy:
+                # 占满空闲进程；没有进行中的任务时阻塞等待一个
+                while pending:
+                    worker = self._acquire(block=not busy)
+                    if worker is None:
+                        break
+                    index = pending.popleft()
+                    start = time.monotonic()
+                    self._send(worker, (codes[index], entries[index]))
+                    busy[worker.conn_in] = (worker, index, start, start + timeout)
+
+                ready = wait(list(busy), max(min(job[3] for job in busy.values()) - time.monotonic(), 0))
+                now = time.monotonic()
+                finished = list(ready) + [conn for conn, job in busy.items()
+                                          if conn not in ready and job[3] <= now]
+                for conn in finished:
+                    worker, index, start, deadline = busy.pop(conn)
+                    worker, result = self._collect(worker, deadline, timeout)
+                    self._release(worker)
+                    result["elapsed"] = time.monotonic() - start
+                    yield index, result
+        finally:
+            # 取消仍在执行的任务
+            for worker, *_ in busy.values():
+                self._release(self._replace(worker, force=True))
+
+    @staticmethod
+    def _receive(worker: _Worker, deadline: float) -> Optional[Dict[str, Any]]:
+        """读取结果帧（及 generate_flow() 结果帧），超过截止时间返回 None"""
+        conn = worker.conn_in
+        if not conn.poll(max(deadline - time.monotonic(), 0)):
+            return None
+        result = decode_result(conn.recv_bytes())
+        if result.pop("has_flow", False):
+            if not conn.poll(max(deadline - time.monotonic(), 0)):
+                return None
+            flow = decode_result(conn.recv_bytes())
+            if isinstance(flow, FlowBuilder):
+                result["flow"] = flow
+                flow = flow.export_json()
+            result["result"] = flow
+        return result
+
+    @staticmethod
+    def _failure(exc_type: str, message: str) -> Dict[str, Any]:
+        return {"success": False, "result": None, "stdout": "", "stderr": "",
+                "error": _error(exc_type, message)}
+
+    def close(self):
+        """停止全部工作进程"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+    def __enter__(self) -> 'SandboxPool':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,372 @@
+"""
+语义预检工具 (Semantic Precheck)
+职责：从用户需求与执行计划推导可执行的性质（如输出随湿球温度单调、限值块约束输出、
+      手动模式下输出手动设定值），用仿真求值器批量采样流程图逐条检验；
+      未通过的流程图无需调用 LLM 即可交给调试智能体
+"""
+import json
+import hashlib
+from typing import Dict, List, Any, Optional, Union
+
+import numpy as np
+
+from kong_sdk import FlowBuilder, SUBFLOW_OUT
+from .flow_simulator import FlowEvaluator, FlowProgram
+
+
+SAMPLE_BASELINES = 64  # 其他输入随机取值的组数
+SWEEP_POINTS = 121  # 被扫描输入的取值个数
+_TOLERANCE = 1e-9
+
+# 输入按名称关键字划分取值范围（楼宇自控的命名习惯）
+_BINARY_HINTS = ("标志", "切换", "手/自动", "手自动", "开关", "使能", "启停", "启动", "状态")
+_COUNT_HINTS = ("数量", "台数", "个数")
+_TEMPERATURE_HINTS = ("温度",)
+
+# 计划 / 需求中提到这些词时推导对应性质
+_MANUAL_HINTS = ("手自动", "手/自动", "手动")
+_MONOTONIC_INPUTS = ("湿球温度",)  # 输出应随其升高而不减的输入
+
+
+def _sample_range(name: str, rng: np.random.Generator, size: int) -> np.ndarray:
+    """按输入名称的语义随机取值"""
+    if any(hint in name for hint in _BINARY_HINTS):
+        return rng.integers(0, 2, size).astype(float)
+    if any(hint in name for hint in _COUNT_HINTS):
+        return rng.integers(0, 9, size).astype(float)
+    if any(hint in name for hint in _TEMPERATURE_HINTS):
+        return np.round(rng.uniform(15.0, 35.0, size), 1)
+    return np.round(rng.uniform(0.0, 50.0, size), 1)
+
+
+class _Samples:
+    """
+    一批采样场景：每组随机基准值（其他输入）与被扫描输入的笛卡尔积，
+    一次向量化求值得到全部场景的输出
+    """
+
+    def __init__(self, evaluator: FlowEvaluator, seed: int = 0, baselines: int = SAMPLE_BASELINES,
+                 sweep: Optional[str] = None, sweep_values: Optional[np.ndarray] = None,
+                 fixed: Optional[Dict[str, np.ndarray]] = None):
+        rng = np.random.default_rng(seed)
+        points = 1 if sweep is None else len(sweep_values)
+        self.shape = (baselines, points)
+        self.scenarios: Dict[str, np.ndarray] = {}
+        for name in _input_names(evaluator.program):
+            if fixed and name in fixed:
+                values = np.broadcast_to(fixed[name], (baselines,))
+            else:
+                values = _sample_range(name, rng, baselines)
+            self.scenarios[name] = np.repeat(values, points)
+        if sweep is not None:
+            self.scenarios[sweep] = np.tile(sweep_values, baselines)
+        self.result = evaluator.evaluate(self.scenarios)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        """(基准组, 扫描点) 形状的结果"""
+        return self.result[key].reshape(self.shape)
+
+    def input(self, key: str) -> np.ndarray:
+        return self.scenarios[key].reshape(self.shape)
+
+
+def _input_names(program: FlowProgram) -> List[str]:
+    """按名称登记的外部输入（排除同时登记的节点 ID）"""
+    ids = set(program.node_slots)
+    return [name for name in program.inputs if name not in ids]
+
+
+def _output_names(program: FlowProgram) -> List[str]:
+    """流程图输出：subflow 输出端口；没有时取没有下游的节点（名称唯一时用名称，否则用节点 ID）"""
+    if program.outputs:
+        return list(program.outputs)
+    flow = program.flow
+    consumed = set(flow._wire_source)
+    referenced = {slot for _, _, in_slots, _, _ in program.ops for port in in_slots for slot in port}
+    outputs = []
+    for node_type, index, _, _, out_slots in program.ops:
+        if node_type == "input" or index in consumed or out_slots[0] in referenced:
+            continue
+        name = flow._names[index]
+        outputs.append(name if len(program.names.get(name, ())) == 1 and name not in program.inputs
+                       else flow._ids[index])
+    return outputs
+
+
+def _downstream(flow: FlowBuilder, index: int) -> set:
+    """从节点出发沿连线可达的节点编号"""
+    seen = {index}
+    stack = [index]
+    while stack:
+        for wire in flow._out_wires(stack.pop()):
+            target = flow._wire_target[wire]
+            if target not in seen:
+                seen.add(target)
+                stack.append(target)
+    return seen
+
+
+class Property:
+    """可在采样场景上检验的性质"""
+
+    name = ""
+
+    def check(self, evaluator: FlowEvaluator) -> Optional[str]:
+        """检验性质，未通过时返回反例说明"""
+        raise NotImplementedError
+
+
+class MonotonicProperty(Property):
+    """其他输入任取，输出随某个输入升高而不减（或不增）"""
+
+    def __init__(self, input_name: str, output: str, increasing: bool = True,
+                 low: float = 10.0, high: float = 40.0):
+        self.input_name = input_name
+        self.output = output
+        self.increasing = increasing
+        self.low, self.high = low, high
+        self.name = f"{output} 随 {input_name} {'单调不减' if increasing else '单调不增'}"
+
+    def check(self, evaluator: FlowEvaluator) -> Optional[str]:
+        sweep = np.linspace(self.low, self.high, SWEEP_POINTS)
+        samples = _Samples(evaluator, sweep=self.input_name, sweep_values=sweep)
+        steps = np.diff(samples[self.output], axis=1)
+        bad = np.argwhere(steps < -_TOLERANCE if self.increasing else steps > _TOLERANCE)
+        if bad.size == 0:
+            return None
+        group, point = bad[0]
+        before, after = samples[self.output][group, point], samples[self.output][group, point + 1]
+        return (f"{self.input_name} 从 {sweep[point]:.2f} 升至 {sweep[point + 1]:.2f} 时，"
+                f"{self.output} 从 {before:g} 变为 {after:g}")
+
+
+class BoundProperty(Property):
+    """限值块约束其下游的输出：high 型输出不超过上限，low 型输出不低于下限"""
+
+    def __init__(self, limit_id: str, limit_name: str, bound_key: Optional[str], constant: float,
+                 high: bool, output: str, bound_keys: List[tuple]):
+        self.limit_id = limit_id
+        self.bound_key = bound_key  # 限值来自输入端口时为上游节点 ID，否则为 None
+        self.constant = constant
+        self.high = high
+        self.output = output
+        self.bound_keys = bound_keys  # 流程图中全部限值块的 (上游节点 ID / None, 常数, 是否上限)
+        self.name = f"{output} {'不超过' if high else '不低于'} {limit_name}（{limit_id}）的限值"
+
+    def _bound(self, samples: _Samples, key: Optional[str], constant: float) -> np.ndarray:
+        return samples[key] if key is not None else np.full(samples.shape, constant)
+
+    def check(self, evaluator: FlowEvaluator) -> Optional[str]:
+        samples = _Samples(evaluator)
+        output = samples[self.output]
+        bound = self._bound(samples, self.bound_key, self.constant)
+        # 只在各限值块的上下限互相一致（下限不高于上限）的场景中检验
+        highs = [self._bound(samples, key, c) for key, c, high in self.bound_keys if high]
+        lows = [self._bound(samples, key, c) for key, c, high in self.bound_keys if not high]
+        consistent = np.ones(samples.shape, dtype=bool)
+        if highs and lows:
+            consistent = np.minimum.reduce(highs) >= np.maximum.reduce(lows)
+        violated = (output > bound + _TOLERANCE) if self.high else (output < bound - _TOLERANCE)
+        bad = np.argwhere(violated & consistent)
+        if bad.size == 0:
+            return None
+        group, point = bad[0]
+        return (f"场景 {_describe(samples, group, point)} 下 {self.output}={output[group, point]:g}，"
+                f"限值为 {bound[group, point]:g}")
+
+
+class ManualOverrideProperty(Property):
+    """
+    手动模式（切换输入为 1）下输出等于手动设定值
+
+    允许其他开关量输入（如系统启停）取某一组合时才放行；
+    设定值落在下游限值范围外的场景不检验。
+    """
+
+    def __init__(self, mode_input: str, setpoint_input: str, output: str, bound_keys: List[tuple]):
+        self.mode_input = mode_input
+        self.setpoint_input = setpoint_input
+        self.output = output
+        self.bound_keys = bound_keys
+        self.name = f"{mode_input}=1（手动）时 {output} 等于 {setpoint_input}"
+
+    def check(self, evaluator: FlowEvaluator) -> Optional[str]:
+        flags = [name for name in _input_names(evaluator.program)
+                 if name != self.mode_input and any(hint in name for hint in _BINARY_HINTS)]
+        failure = None
+        for combination in range(2 ** min(len(flags), 4)):
+            fixed = {self.mode_input: np.array(1.0)}
+            fixed.update({flag: np.array(float(combination >> bit & 1)) for bit, flag in enumerate(flags[:4])})
+            samples = _Samples(evaluator, fixed=fixed)
+            setpoint = samples.input(self.setpoint_input)
+            in_range = np.ones(samples.shape, dtype=bool)
+            for key, constant, high in self.bound_keys:
+                bound = samples[key] if key is not None else constant
+                in_range &= (setpoint <= bound) if high else (setpoint >= bound)
+            mismatch = in_range & (np.abs(samples[self.output] - setpoint) > _TOLERANCE)
+            if not mismatch.any():
+                return None
+            if failure is None:
+                group, point = np.argwhere(mismatch)[0]
+                failure = (f"场景 {_describe(samples, group, point)} 下 {self.output}="
+                           f"{samples[self.output][group, point]:g}，手动设定值为 {setpoint[group, point]:g}")
+        return failure
+
+
+def _describe(samples: _Samples, group: int, point: int, limit: int = 6) -> str:
+    """反例场景的输入取值（最多列出 limit 个）"""
+    items = [f"{name}={samples.input(name)[group, point]:g}" for name in list(samples.scenarios)[:limit]]
+    return "{" + ", ".join(items) + ("，…}" if len(samples.scenarios) > limit else "}")
+
+
+def derive_properties(user_query: str, plan: Optional[Dict[str, Any]],
+                      program: FlowProgram) -> List[Property]:
+    """
+    从需求与执行计划推导性质
+
+    需求 / 计划文本提到湿球温度、手自动切换时分别生成单调性、手动优先性质，
+    流程图中的每个限值块生成限值约束性质；找不到对应输入时跳过该性质（命名问题交给 LLM 判断）。
+    """
+    text = user_query + json.dumps(plan or {}, ensure_ascii=False)
+    inputs = _input_names(program)
+    outputs = _output_names(program)
+    flow = program.flow
+    properties: List[Property] = []
+
+    for keyword in _MONOTONIC_INPUTS:
+        if keyword not in text:
+            continue
+        for name in inputs:
+            if keyword in name and "设定" not in name:
+                properties.extend(MonotonicProperty(name, output) for output in outputs)
+
+    # 限值块：限值来自输入端口时取其上游节点的值
+    limits = []
+    for node_type, index, in_slots, params, _ in program.ops:
+        if node_type != "limit":
+            continue
+        bound_key = None
+        if params.get("inputAuxEnable"):
+            upstream = [flow._wire_source[w] for w in flow._in_wires(index) if flow._wire_target_port[w] == 1]
+            bound_key = flow._ids[upstream[0]] if upstream else None
+        limits.append((index, bound_key, float(params.get("constant", 0) or 0), params.get("as", "high") == "high"))
+    bound_keys = [(key, constant, high) for _, key, constant, high in limits]
+
+    # 限值块无论需求是否提及都应约束其下游输出
+    for index, key, constant, high in limits:
+        reachable = _downstream(flow, index)
+        for output in outputs:
+            if _output_index(program, output) in reachable:
+                properties.append(BoundProperty(flow._ids[index], flow._names[index], key, constant,
+                                                high, output, bound_keys))
+
+    if any(hint in text for hint in _MANUAL_HINTS):
+        mode = next((name for name in inputs if any(h in name for h in ("手/自动", "手自动"))), None)
+        setpoint = next((name for name in inputs if "手动" in name and "设定" in name), None)
+        if mode and setpoint:
+            properties.extend(ManualOverrideProperty(mode, setpoint, output, bound_keys) for output in outputs)
+    return properties
+
+
+def _output_index(program: FlowProgram, output: str) -> int:
+    """输出名称对应的节点编号"""
+    if output in program.outputs:
+        slot = program.outputs[output]
+        return next(index for node_type, index, _, _, out_slots in program.ops
+                    if node_type == SUBFLOW_OUT and out_slots[0] == slot)
+    node = program.flow.get_node(output)
+    if node is None:
+        node = program.flow.get_node(program.names[output][0])
+    return node._index
+
+
+class PrecheckResult:
+    """预检结果"""
+
+    def __init__(self, verdicts: List[Dict[str, Any]], skipped: Optional[str] = None):
+        self.verdicts = verdicts
+        self.skipped = skipped  # 无法仿真时的原因
+
+    @property
+    def passed(self) -> bool:
+        return all(verdict["passed"] for verdict in self.verdicts)
+
+    def issues(self) -> List[Dict[str, Any]]:
+        """未通过的性质，格式与 LLM 语义验证报告的 issues 一致"""
+        return [{
+            "severity": "error",
+            "category": "逻辑",
+            "description": f"性质不成立: {verdict['property']}。反例: {verdict['detail']}",
+            "suggestion": "检查相关组件的连线顺序、端口与参数",
+        } for verdict in self.verdicts if not verdict["passed"]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"passed": self.passed, "verdicts": self.verdicts, "skipped": self.skipped}
+
+
+def run_precheck(user_query: str, plan: Optional[Dict[str, Any]],
+                 flow: Union[FlowBuilder, Dict[str, Any]]) -> PrecheckResult:
+    """
+    对流程图执行语义预检
+
+    Args:
+        user_query: 用户需求
+        plan: 规划智能体输出的执行计划
+        flow: FlowBuilder 或 SDK 导出格式的 JSON
+
+    Returns:
+        PrecheckResult；流程图包含仿真不支持的组件时 skipped 说明原因、不给出结论
+    """
+    if isinstance(flow, dict):
+        flow = FlowBuilder.load_json(flow)
+    try:
+        evaluator = FlowEvaluator(flow)
+    except (NotImplementedError, ValueError) as e:
+        return PrecheckResult([], skipped=str(e))
+
+    verdicts = []
+    for prop in derive_properties(user_query, plan, evaluator.program):
+        detail = prop.check(evaluator)
+        verdicts.append({"property": prop.name, "passed": detail is None, "detail": detail})
+    return PrecheckResult(verdicts)
+
+
+def verdict_key(user_query: str, plan: Optional[Dict[str, Any]],
+                flow: Union[FlowBuilder, Dict[str, Any]]) -> tuple:
+    """语义结论的缓存键：(需求与计划的哈希, 流程图内容哈希)"""
+    query = hashlib.sha256((user_query + json.dumps(plan or {}, ensure_ascii=False, sort_keys=True,
+                                                    default=str)).encode("utf-8")).hexdigest()
+    if isinstance(flow, dict):
+        flow = FlowBuilder.load_json(flow)
+    return query, flow.content_hash()
+
+
+def test_semantic_precheck():
+    """测试语义预检：样本工程应满足全部性质，改错的版本应给出反例"""
+    from pathlib import Path
+
+    sample = Path(__file__).resolve().parent.parent / "json" / "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    query = "计算夏季主机初始开启数量，湿球温度越高开启越多，需要手自动切换功能，并受最小开启数量和可运行数量限值约束"
+    flow = FlowBuilder.load_kongcube(sample)
+    result = run_precheck(query, None, flow)
+    print(f"样本工程: 通过={result.passed}")
+    for verdict in result.verdicts:
+        print(f"  {'✓' if verdict['passed'] else '✗'} {verdict['property']}")
+
+    # 错误版本：比较判断改为 "小于等于"，手动设定值接到通道 1
+    broken = FlowBuilder.load_kongcube(sample)
+    for node in broken.nodes:
+        if node.type == "compare":
+            node.update_params(**{"as": "le"})
+    switch = next(node for node in broken.nodes if node.type == "switch")
+    for wire in range(len(broken._wire_target)):
+        if broken._wire_target[wire] == switch._index and broken._wire_target_port[wire] in (1, 2):
+            broken._wire_target_port[wire] = 3 - broken._wire_target_port[wire]
+    result = run_precheck(query, None, broken)
+    print(f"错误版本: 通过={result.passed}")
+    for issue in result.issues():
+        print(f"  ✗ {issue['description']}")
+
+
+if __name__ == "__main__":
+    test_semantic_precheck()
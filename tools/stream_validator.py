@@ -0,0 +1,415 @@
+"""
+流式验证工具 (Stream Validator)
+职责：增量解析 KONG CUBE 原生格式文件，逐个元素检查组件类型、参数与端口，
+      未解析的连线端点放入待定集合，最终报告悬空引用；诊断带文件字节偏移
+"""
+import re
+import json
+import time
+import tempfile
+import tracemalloc
+from array import array
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterator, Union, IO
+
+from kong_sdk import get_registry, is_subflow_type, SUBFLOW_INSTANCE_PREFIX, _TEMPLATE_SKIP_FIELDS
+from .flow_validator import (ValidationReport, Diagnostic, _diagnostic, _check_params, _check_graph)
+
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # 每次读取的字节数
+
+# 原生格式中不属于组件参数的字段
+_NATIVE_FIELDS = _TEMPLATE_SKIP_FIELDS | {"info", "in", "out", "label", "disabled", "env"}
+
+# 字符串外只关心结构字符；字符串内只关心引号与转义
+_STRUCTURE = re.compile(rb'["{}\[\]]')
+_STRING_END = re.compile(rb'["\\]')
+
+# quote 节点的引用标签，如 "[4684029:0] 湿球温度"
+_QUOTE_LABEL = re.compile(r"^\[([^:\]]+):(\d+)\]")
+
+# 待定连线的种类
+_WIRE, _QUOTE = 0, 1
+
+
+def iter_elements(fp: IO[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    增量解析顶层 JSON 数组，逐个产出 (元素起始字节偏移, 元素)
+
+    只在缓冲区中保留当前未解析完的元素，内存占用取决于单个元素大小而非文件大小。
+
+    Raises:
+        ValueError: 文件不是 JSON 数组或在元素中途结束
+    """
+    buffer = b""
+    base = 0  # buffer[0] 在文件中的偏移
+    position = 0  # 下一个待扫描的位置
+    depth = 0
+    in_string = False
+    start = -1  # 当前元素在 buffer 中的起点
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        while True:
+            if in_string:
+                match = _STRING_END.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                    break
+                if match.group() == b"\\":
+                    if match.end() >= len(buffer):
+                        position = match.start()  # 转义字符被截断，等待下一块
+                        break
+                    position = match.end() + 1
+                    continue
+                in_string = False
+                position = match.end()
+                continue
+
+            match = _STRUCTURE.search(buffer, position)
+            if match is None:
+                position = len(buffer)
+                break
+            position = match.end()
+            char = match.group()
+            if char == b'"':
+                in_string = True
+            elif char in b"{[":
+                if depth == 0 and char != b"[":
+                    raise ValueError("原生格式文件应为 JSON 数组")
+                if depth == 1:
+                    start = match.start()
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 1:
+                    yield base + start, json.loads(buffer[start:position])
+                    start = -1
+                elif depth == 0:
+                    return
+
+        # 丢弃已解析的部分
+        keep = start if start >= 0 else position
+        buffer = buffer[keep:]
+        base += keep
+        position -= keep
+        if start >= 0:
+            start = 0
+    if depth:
+        raise ValueError(f"文件在偏移 {base + len(buffer)} 处意外结束")
+
+
+def _out_port_error(registry, subflow_ports: Dict[str, Tuple[int, int]], node_type: str,
+                    out_port: int) -> Optional[str]:
+    """源节点输出端口越界时的说明；subflow 实例按其定义的输出端口数检查"""
+    if is_subflow_type(node_type):
+        ports = subflow_ports.get(node_type[len(SUBFLOW_INSTANCE_PREFIX):])
+        if ports is not None and out_port >= ports[1]:
+            return f"{node_type} 只有 {ports[1]} 个输出端口，out_port={out_port} 越界"
+        return None
+    return registry.check_ports(node_type, out_port=out_port)
+
+
+def _dangling_reference(kind: int, source_id: str, out_port: int, owner: Optional[str],
+                        offset: Optional[int]) -> Diagnostic:
+    what = "quote 标签" if kind == _QUOTE else "连线"
+    return _diagnostic("E201", f"{what}引用了不存在的节点: {source_id}:{out_port}", owner, offset)
+
+
+class StreamingValidator:
+    """
+    原生格式的增量验证器
+
+    每个元素解析后立即检查并丢弃，只保留紧凑的索引：节点 ID -> 编号、
+    类型编号与文件偏移（整型数组）、已解析的连线端点（整型数组）。
+    引用了尚未出现的节点的连线放入待定集合，节点出现时再检查端口；
+    解析结束时仍待定的即为悬空引用。
+    """
+
+    def __init__(self, registry=None, check_cycles: bool = True):
+        self.registry = registry or get_registry()
+        self.check_cycles = check_cycles
+        self.diagnostics: List[Diagnostic] = []
+        self.index_of: Dict[str, int] = {}
+        self.ids: List[str] = []
+        self.locations = array("q")  # 节点元素的字节偏移
+        self.type_codes = array("H")
+        self.type_names: List[str] = []
+        self._type_index: Dict[str, int] = {}
+        self.subflow_ports: Dict[str, Tuple[int, int]] = {}  # subflow ID -> (输入端口数, 输出端口数)
+        self.containers: Dict[str, int] = {}  # tab / subflow ID -> 偏移
+        # 源节点 ID -> [(种类, 目标编号, 输入端口, 源输出端口, 偏移)]
+        self.pending: Dict[str, List[Tuple[int, int, int, int, int]]] = {}
+        self.unknown_containers: List[Tuple[str, str, int]] = []  # (节点 ID, z, 偏移)
+        self.instances: List[Tuple[int, str]] = []  # (实例节点编号, subflow ID)
+        self.sources = array("i")
+        self.targets = array("i")
+        self.self_loops: List[int] = []
+        self.linked = bytearray()  # 经 quote / subflow 端口与其他节点相连的节点
+        self.wire_count = 0
+
+    def _error(self, code: str, message: str, node: Optional[str], offset: int):
+        self.diagnostics.append(_diagnostic(code, message, node, offset))
+
+    # ---------- 逐元素检查 ----------
+
+    def feed(self, offset: int, item: Dict[str, Any]):
+        """检查一个原生格式元素"""
+        item_type = item.get("type")
+        item_id = item.get("id")
+        if item_id is None:
+            self._error("E101", f"元素缺少 ID: {item.get('name', item_type)}", None, offset)
+            return
+        if item_type in ("tab", "subflow"):
+            self._feed_container(offset, item_id, item)
+            return
+        if item_id in self.index_of or item_id in self.containers:
+            self._error("E102", f"节点 ID 重复: {item_id}", item_id, offset)
+            return
+
+        index = len(self.ids)
+        self.index_of[item_id] = index
+        self.ids.append(item_id)
+        self.locations.append(offset)
+        self.type_codes.append(self._intern(item_type))
+        self.linked.append(0)
+
+        z = item.get("z")
+        if z is not None and z not in self.containers:
+            self.unknown_containers.append((item_id, z, offset))
+        if item_type is None:
+            self._error("E103", f"节点 {item_id} 缺少 type 字段", item_id, offset)
+        elif is_subflow_type(item_type):
+            self.instances.append((index, item_type[len(SUBFLOW_INSTANCE_PREFIX):]))
+        else:
+            spec = self.registry.get(item_type)
+            if spec is None:
+                self._error("E104", f"节点 {item_id} 的类型不在组件库中: {item_type}", item_id, offset)
+            else:
+                _check_params(spec, item_id, item, _NATIVE_FIELDS, self.diagnostics, offset)
+                missing = self.registry.missing_fields(item_type, item)
+                if missing:
+                    self._error("E107", f"节点 {item_id}: {item_type} 缺少必需字段 {'、'.join(missing)}",
+                                item_id, offset)
+
+        for in_port, refs in enumerate(item.get("wires", [])):
+            in_error = self._in_port_error(item_type, in_port)
+            if in_error:
+                self._error("E204", f"节点 {item_id}: {in_error}", item_id, offset)
+            for ref in refs:
+                self._link(_WIRE, ref.get("id"), ref.get("port", 0), index, in_port, offset)
+        if item_type == "quote":
+            match = _QUOTE_LABEL.match(item.get("labelName") or "")
+            if match:
+                self._link(_QUOTE, match.group(1), int(match.group(2)), index, 0, offset)
+
+        # 先前引用了该节点的连线
+        for kind, target, in_port, out_port, ref_offset in self.pending.pop(item_id, ()):
+            self._resolve(kind, index, out_port, target, in_port, ref_offset)
+
+    def _feed_container(self, offset: int, container_id: str, item: Dict[str, Any]):
+        if container_id in self.containers or container_id in self.index_of:
+            self._error("E102", f"容器 ID 重复: {container_id}", container_id, offset)
+            return
+        self.containers[container_id] = offset
+        if item.get("type") != "subflow":
+            return
+        ins, outs = item.get("in", []), item.get("out", [])
+        self.subflow_ports[container_id] = (len(ins), len(outs))
+        # subflow 输出端口的上游是 subflow 内部节点（输出端口不是节点，连线只检查源端口）
+        for port, spec in enumerate(outs):
+            for ref in spec.get("wires", []):
+                self._link(_WIRE, ref.get("id"), ref.get("port", 0), -1, port, offset)
+        for kind, target, in_port, out_port, ref_offset in self.pending.pop(container_id, ()):
+            self._resolve_subflow_input(kind, container_id, out_port, target, ref_offset)
+
+    def _intern(self, node_type: Optional[str]) -> int:
+        node_type = node_type or ""
+        code = self._type_index.get(node_type)
+        if code is None:
+            code = self._type_index[node_type] = len(self.type_names)
+            self.type_names.append(node_type)
+        return code
+
+    def _in_port_error(self, node_type: Optional[str], in_port: int) -> Optional[str]:
+        if node_type is not None and is_subflow_type(node_type):
+            ports = self.subflow_ports.get(node_type[len(SUBFLOW_INSTANCE_PREFIX):])
+            if ports is not None and in_port >= ports[0]:
+                return f"{node_type} 只有 {ports[0]} 个输入端口，in_port={in_port} 越界"
+            return None
+        return self.registry.check_ports(node_type, in_port=in_port)
+
+    def _link(self, kind: int, source_id: Optional[str], out_port: Any, target: int, in_port: int,
+              offset: int):
+        """登记一条引用；源尚未出现时放入待定集合"""
+        if not isinstance(out_port, int) or isinstance(out_port, bool) or out_port < 0:
+            self._error("E205", f"引用 {source_id} 的端口索引无效: {out_port!r}", source_id, offset)
+            return
+        if source_id in self.index_of:
+            self._resolve(kind, self.index_of[source_id], out_port, target, in_port, offset)
+        elif source_id in self.subflow_ports:
+            self._resolve_subflow_input(kind, source_id, out_port, target, offset)
+        else:
+            self.pending.setdefault(source_id, []).append((kind, target, in_port, out_port, offset))
+
+    def _resolve(self, kind: int, source: int, out_port: int, target: int, in_port: int, offset: int):
+        source_type = self.type_names[self.type_codes[source]]
+        message = _out_port_error(self.registry, self.subflow_ports, source_type, out_port)
+        if message:
+            self._error("E203", f"引用 {self.ids[source]}: {message}", self.ids[source], offset)
+        if kind != _WIRE or target < 0:
+            # quote 引用与 subflow 输出端口不是节点间连线，只标记两端已连接
+            self.linked[source] = 1
+            if target >= 0:
+                self.linked[target] = 1
+        if kind != _WIRE:
+            return
+        self.wire_count += 1
+        if target >= 0:
+            if source == target:
+                self.self_loops.append(source)
+            self.sources.append(source)
+            self.targets.append(target)
+
+    def _resolve_subflow_input(self, kind: int, subflow_id: str, port: int, target: int, offset: int):
+        """subflow 内部节点引用 subflow 的输入端口"""
+        if port >= self.subflow_ports[subflow_id][0]:
+            self._error("E203", f"subflow {subflow_id} 只有 {self.subflow_ports[subflow_id][0]} 个输入端口，"
+                                f"引用的端口 {port} 越界", subflow_id, offset)
+        if target >= 0:
+            self.linked[target] = 1
+        if kind == _WIRE:
+            self.wire_count += 1
+
+    # ---------- 收尾 ----------
+
+    def _check_instances(self):
+        """subflow 实例引用的 subflow 必须有定义"""
+        for index, subflow_id in self.instances:
+            if subflow_id not in self.subflow_ports:
+                self._error("E104", f"节点 {self.ids[index]} 引用了未定义的 subflow: {subflow_id}",
+                            self.ids[index], self.locations[index])
+
+    def finish(self) -> ValidationReport:
+        """报告悬空引用、未定义的容器与 subflow，并在连线索引上检测环路"""
+        for source_id, refs in self.pending.items():
+            for kind, target, in_port, out_port, offset in refs:
+                owner = self.ids[target] if target >= 0 else None
+                self.diagnostics.append(_dangling_reference(kind, source_id, out_port, owner, offset))
+        for node_id, z, offset in self.unknown_containers:
+            if z not in self.containers:
+                self._error("E106", f"节点 {node_id} 所属的容器不存在: {z}", node_id, offset)
+        self._check_instances()
+        if self.check_cycles:
+            self.diagnostics.extend(_check_graph(self.ids, self.sources, self.targets,
+                                                 self.self_loops, self.locations, self.linked))
+        return ValidationReport(self.diagnostics, len(self.ids), self.wire_count)
+
+
+def validate_kongcube_stream(source: Union[str, Path, IO[bytes]], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                             check_cycles: bool = True) -> ValidationReport:
+    """
+    流式验证 KONG CUBE 原生格式文件
+
+    Args:
+        source: 文件路径或二进制文件对象
+        chunk_size: 每次读取的字节数
+        check_cycles: 是否检测环路（需保存连线索引，每条连线 8 字节）
+
+    Returns:
+        ValidationReport（诊断的 offset 为相关元素在文件中的字节偏移）
+    """
+    validator = StreamingValidator(check_cycles=check_cycles)
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as fp:
+            _feed_all(validator, fp, chunk_size)
+    else:
+        _feed_all(validator, source, chunk_size)
+    return validator.finish()
+
+
+def _feed_all(validator: StreamingValidator, fp: IO[bytes], chunk_size: int):
+    try:
+        for offset, item in iter_elements(fp, chunk_size):
+            validator.feed(offset, item)
+    except ValueError as e:
+        validator.diagnostics.append(_diagnostic("E100", f"无法解析原生格式文件: {e}"))
+
+
+def _write_archive(path: Path, sample: Path, copies: int):
+    """把样本工程复制 copies 份（ID 加后缀）写成一个大文件，模拟多楼栋归档导出"""
+    items = json.loads(sample.read_text(encoding="utf-8"))
+    ids = {item["id"] for item in items}
+    text = json.dumps(items, ensure_ascii=False, indent=4)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for copy in range(copies):
+            body = text.strip()[1:-1].strip()
+            for node_id in ids:
+                body = body.replace(f'"{node_id}"', f'"{node_id}_{copy}"') \
+                           .replace(f"[{node_id}:", f"[{node_id}_{copy}:") \
+                           .replace(f'"subflow:{node_id}"', f'"subflow:{node_id}_{copy}"')
+            f.write(body)
+            f.write(",\n" if copy < copies - 1 else "\n")
+        f.write("]\n")
+
+
+def benchmark_stream_validator(copies: Tuple[int, ...] = (10, 100, 400)):
+    """对比流式验证与整体加载的耗时和内存峰值"""
+    sample = Path(__file__).resolve().parent.parent / "json" / "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    with tempfile.TemporaryDirectory() as directory:
+        for count in copies:
+            path = Path(directory) / f"archive_{count}.json"
+            _write_archive(path, sample, count)
+            size = path.stat().st_size
+
+            start = time.perf_counter()
+            report = validate_kongcube_stream(path)
+            elapsed = time.perf_counter() - start
+
+            # 内存峰值单独测量（tracemalloc 会显著拖慢解析）
+            tracemalloc.start()
+            validate_kongcube_stream(path)
+            stream_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            tracemalloc.start()
+            with open(path, "rb") as f:
+                json.load(f)
+            load_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            print(f"{size / 2**20:6.1f} MiB / {report.node_count:>6} 节点: {elapsed * 1000:8.1f} ms"
+                  f"  内存峰值 {stream_peak / 2**20:6.1f} MiB（整体加载 {load_peak / 2**20:6.1f} MiB）"
+                  f"  诊断 {len(report.diagnostics)} 条")
+
+
+def test_stream_validator():
+    """测试流式验证"""
+    import io
+
+    sample = Path(__file__).resolve().parent.parent / "json" / "1653375340609_9_20220523_夏季主机初始开启数量计算模块.json"
+    report = validate_kongcube_stream(sample, chunk_size=512)
+    print(f"样本工程: 通过={report.passed}，{report.node_count} 个节点，{report.wire_count} 条连线")
+    for diagnostic in report.diagnostics[:5]:
+        print(f"  {diagnostic.severity:<7} {diagnostic}")
+
+    broken = (
+        b'[{"id": "t1", "type": "tab", "label": "\\u6d41\\u7a0b"},'
+        b' {"id": "a", "type": "compare", "z": "t1", "wires": [[{"id": "b", "port": 2}]]},'
+        b' {"id": "q", "type": "quote", "z": "t1", "labelName": "[ghost:0] \xe5\xbc\x95\xe7\x94\xa8", "wires": []},'
+        b' {"id": "b", "type": "swInput", "z": "t9", "wires": [[], []]},'
+        b' {"id": "c", "type": "fooBlock", "z": "t1", "wires": [[{"id": "missing", "port": 0}]]}]'
+    )
+    report = validate_kongcube_stream(io.BytesIO(broken), chunk_size=16)
+    print(f"损坏的文件: 通过={report.passed}")
+    for diagnostic in report.diagnostics:
+        print(f"  {diagnostic.severity:<7} {diagnostic}")
+    print()
+    benchmark_stream_validator()
+
+
+if __name__ == "__main__":
+    test_stream_validator()
@@ -0,0 +1,220 @@
+"""
+全文索引 (Text Index)
+职责：对知识库文档（组件名称、节点名称、工程摘要）按中文字符二元 / 三元组建立 BM25 倒排索引，
+      倒排表以 CSR 整型数组紧凑存储并持久化；提供与向量检索结果融合的倒数排名融合（RRF）
+"""
+import re
+import json
+import time
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Union
+
+import numpy as np
+
+
+TEXT_INDEX_NAME = "text_index.npz"
+TERMS_NAME = "text_terms.json"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # RRF 平滑常数：排名 r 的得分为 1 / (RRF_K + r)
+
+# 连续的中文字符，或连续的字母数字（组件类型、参数名）
+_TOKEN_RUNS = re.compile(r"[一-鿿]+|[a-z0-9_]+")
+
+
+def tokenize(text: str, ngrams: Tuple[int, ...] = (2, 3)) -> List[str]:
+    """
+    切分检索词：中文取字符二元 / 三元组（不足两个字的词保留单字），字母数字按整词
+
+    "湿球温度" -> 湿球、球温、温度、湿球温、球温度；"swInput" -> swinput
+    """
+    tokens = []
+    for run in _TOKEN_RUNS.findall(text.lower()):
+        if not ("一" <= run[0] <= "鿿"):
+            tokens.append(run)
+            continue
+        if len(run) < min(ngrams):
+            tokens.append(run)
+            continue
+        for n in ngrams:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return tokens
+
+
+class TextIndex:
+    """
+    BM25 倒排索引
+
+    词表映射为连续编号；词 t 的倒排表为 doc_ids[offsets[t]:offsets[t + 1]] 与对应的词频 tfs，
+    查询时对每个检索词做一次向量化的 BM25 累加，耗时与命中的倒排表长度成正比。
+    """
+
+    def __init__(self, terms: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 lengths: np.ndarray, ids: List[str], kinds: List[str], version: str = ""):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.lengths = lengths
+        self.ids = ids
+        self.kinds = np.array(kinds, dtype=object)
+        self.version = version  # 建立索引时的知识库版本
+        self.average_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str, Dict[str, Any]]], version: str = "") -> 'TextIndex':
+        """
+        由 (文档 ID, 文本, 元数据) 建立索引
+
+        先统计每篇文档的词频，再按词计数排序写入 CSR 数组（计数排序，O(总词数)）。
+        """
+        terms: Dict[str, int] = {}
+        ids, kinds, lengths = [], [], []
+        term_column, doc_column, tf_column = [], [], []
+        for doc, (doc_id, text, metadata) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            ids.append(doc_id)
+            kinds.append(metadata.get("kind", ""))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_column.append(terms.setdefault(term, len(terms)))
+                doc_column.append(doc)
+                tf_column.append(tf)
+
+        term_column = np.asarray(term_column, dtype=np.int32)
+        order = np.argsort(term_column, kind="stable")  # 同一词内保持文档顺序
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(terms)), out=offsets[1:])
+        return cls(terms, offsets, np.asarray(doc_column, dtype=np.int32)[order],
+                   np.minimum(np.asarray(tf_column, dtype=np.int64)[order], 65535).astype(np.uint16),
+                   np.asarray(lengths, dtype=np.float32), ids, kinds, version)
+
+    # ---------- 持久化 ----------
+
+    def save(self, directory: Union[str, Path]):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        vocabulary = sorted(self.terms, key=self.terms.get)
+        (directory / TERMS_NAME).write_text(json.dumps({
+            "version": self.version, "terms": vocabulary, "ids": self.ids, "kinds": list(self.kinds),
+        }, ensure_ascii=False), encoding="utf-8")
+        with open(directory / TEXT_INDEX_NAME, "wb") as f:
+            np.savez(f, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, lengths=self.lengths)
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> Optional['TextIndex']:
+        """读取索引，文件缺失或损坏时返回 None"""
+        directory = Path(directory)
+        try:
+            meta = json.loads((directory / TERMS_NAME).read_text(encoding="utf-8"))
+            with np.load(directory / TEXT_INDEX_NAME) as arrays:
+                offsets, doc_ids = arrays["offsets"], arrays["doc_ids"]
+                tfs, lengths = arrays["tfs"], arrays["lengths"]
+        except (OSError, ValueError, KeyError):
+            return None
+        terms = {term: index for index, term in enumerate(meta["terms"])}
+        return cls(terms, offsets, doc_ids, tfs, lengths, meta["ids"], meta["kinds"], meta["version"])
+
+    # ---------- 查询 ----------
+
+    def search(self, query: str, top_k: int = 5, kind: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回条数
+            kind: 只返回该类文档（component / project）
+
+        Returns:
+            [(文档 ID, BM25 得分)]，得分降序，不含未命中任何检索词的文档
+        """
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term, query_tf in Counter(tokenize(query)).items():
+            index = self.terms.get(term)
+            if index is None:
+                continue
+            start, end = self.offsets[index], self.offsets[index + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = np.log1p((len(self.ids) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[docs] / self.average_length)
+            scores[docs] += query_tf * idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if kind is not None:
+            scores[self.kinds != kind] = 0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[doc], float(scores[doc])) for doc in matched]
+
+
+def rrf_fuse(rankings: Iterable[List[str]], top_k: int, k: int = RRF_K) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合：每个排名列表中第 r 名（从 1 开始）贡献 1 / (k + r)，只依赖名次，
+    无需对 BM25 得分与余弦相似度做归一化
+
+    Returns:
+        [(文档 ID, 融合得分)]，得分降序
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+
+
+def benchmark_text_index(documents: int = 20000, words: int = 40):
+    """建立与查询耗时（随机组合的领域词汇）"""
+    vocabulary = ["湿球温度", "比较判断", "手自动切换", "主机可正常运行数量", "通道选择", "数据锁存", "限值",
+                  "冷却塔", "冷冻水泵", "供水温度", "回水温度", "压差", "旁通阀", "风机", "频率", "设定值",
+                  "开启台数", "延时", "报警", "累计运行时间", "启停", "系统开启标志位", "逻辑运算", "加"]
+    rng = np.random.default_rng(0)
+    corpus = [(f"doc{i}", "、".join(rng.choice(vocabulary, words)), {"kind": "project"})
+              for i in range(documents)]
+    start = time.perf_counter()
+    index = TextIndex.build(corpus)
+    built = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as directory:
+        index.save(directory)
+        size = sum(path.stat().st_size for path in Path(directory).iterdir())
+        start = time.perf_counter()
+        index = TextIndex.load(directory)
+        loaded = time.perf_counter() - start
+    queries = ["湿球温度比较判断", "主机可正常运行数量 手自动切换", "冷冻水泵频率设定值"]
+    start = time.perf_counter()
+    for _ in range(20):
+        for query in queries:
+            index.search(query, top_k=10)
+    elapsed = (time.perf_counter() - start) / (20 * len(queries))
+    print(f"{documents} 篇文档 / {len(index.terms)} 个检索词 / {len(index.doc_ids)} 条倒排: "
+          f"建立 {built:.2f} s，文件 {size / 2**20:.1f} MiB，加载 {loaded * 1000:.1f} ms，"
+          f"查询 {elapsed * 1000:.2f} ms")
+
+
+def test_text_index():
+    """测试全文索引：组件名称的精确匹配"""
+    from kong_sdk import COMPONENT_DIR
+    from .knowledge_base import parse_file, knowledge_files
+
+    documents = [(d.id, d.text, d.metadata) for path in knowledge_files(COMPONENT_DIR) for d in parse_file(path)]
+    index = TextIndex.build(documents)
+    print(f"切分示例: {tokenize('湿球温度 swInput 手/自动切换')}")
+    for query in ("湿球温度比较判断", "数据锁存", "手自动切换 通道选择", "主机可正常运行数量"):
+        print(f"{query}: {index.search(query, top_k=3, kind='component')}")
+    print(f"融合: {rrf_fuse([['a', 'b', 'c'], ['c', 'a', 'd']], top_k=3)}")
+    print()
+    benchmark_text_index()
+
+
+if __name__ == "__main__":
+    test_text_index()
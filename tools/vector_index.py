@@ -0,0 +1,373 @@
+"""
+本地向量索引 (Vector Index)
+职责：进程内的离线向量库，向量以 float16 / float32 存入 .npy 文件并以内存映射打开，
+      用 NumPy 批量点积求 top-k（语料大时可选 IVF 倒排分桶）；提供可插拔的本地向量化模型
+"""
+import os
+import json
+import time
+import zlib
+import tempfile
+import importlib
+from pathlib import Path
+from typing import Dict, List, Any, Optional, NamedTuple, Union, Sequence, Iterator, Tuple
+
+import numpy as np
+
+
+VECTORS_NAME = "vectors.npy"
+ROWS_NAME = "rows.json"
+IVF_NAME = "ivf.npz"
+
+IVF_THRESHOLD = 50000  # 向量数达到该值时自动建立 IVF 分桶
+DEFAULT_NPROBE = 8  # IVF 查询时探查的分桶数
+_KMEANS_ITERATIONS = 10
+_SCORE_CHUNK = 1 << 16  # 分块计算点积的行数，float16 存储时限制临时 float32 矩阵的大小
+
+
+class Hit(NamedTuple):
+    """一条检索结果"""
+    id: str
+    score: float  # 余弦相似度
+    text: str
+    metadata: Dict[str, Any]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """得分最高的 k 个位置（降序）；argpartition 只做部分排序"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalVectorStore:
+    """
+    内存映射的本地向量库
+
+    向量按行归一化后存入 vectors.npy，文档 ID、文本与元数据存入 rows.json；
+    打开时向量文件只做一次 mmap，查询时按块读入并与查询向量点积。
+    写入（upsert / delete）先记在内存中，flush() 时整体重写文件并重建 IVF 分桶。
+    """
+
+    def __init__(self, directory: Union[str, Path], dtype: str = "float32",
+                 nlist: Optional[int] = None, nprobe: int = DEFAULT_NPROBE):
+        """
+        Args:
+            directory: 索引目录
+            dtype: 向量存储精度；float16 体积减半，但全量扫描时需逐块转换为 float32
+            nlist: IVF 分桶数；None 表示向量数达到 IVF_THRESHOLD 时按 √N 自动建立，0 表示不建立
+            nprobe: 查询时探查的分桶数
+        """
+        self.directory = Path(directory)
+        self.dtype = np.dtype(dtype)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._pending: Dict[str, tuple] = {}  # 文档 ID -> (向量, 文本, 元数据)
+        self._deleted = set()
+        self._load()
+
+    def _load(self):
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._ivf = None
+        self._columns: Dict[str, np.ndarray] = {}
+        self._row_of: Optional[Dict[str, int]] = None  # 文档 ID -> 行号（首次按 ID 取文档时建立）
+        try:
+            rows = json.loads((self.directory / ROWS_NAME).read_text(encoding="utf-8"))
+            self._vectors = np.load(self.directory / VECTORS_NAME, mmap_mode="r")
+        except (OSError, ValueError):
+            return
+        self.ids, self.texts, self.metadatas = rows["ids"], rows["texts"], rows["metadatas"]
+        try:
+            with np.load(self.directory / IVF_NAME) as ivf:
+                self._ivf = (ivf["centroids"], ivf["order"], ivf["offsets"])
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dim(self) -> int:
+        return self._vectors.shape[1] if self._vectors is not None else 0
+
+    # ---------- 写入 ----------
+
+    def upsert(self, ids: List[str], embeddings: Sequence, texts: List[str],
+               metadatas: List[Dict[str, Any]]):
+        """写入或覆盖文档（flush 后可查询）"""
+        vectors = _normalize(embeddings)
+        for doc_id, vector, text, metadata in zip(ids, vectors, texts, metadatas):
+            self._pending[doc_id] = (vector, text, metadata)
+            self._deleted.discard(doc_id)
+
+    def delete(self, ids: List[str]):
+        """删除文档（flush 后生效）"""
+        for doc_id in ids:
+            self._pending.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+    def flush(self):
+        """把未保存的写入合并进索引文件（临时文件 + 原子替换）"""
+        if not self._pending and not self._deleted:
+            return
+        keep = [row for row, doc_id in enumerate(self.ids)
+                if doc_id not in self._deleted and doc_id not in self._pending]
+        ids = [self.ids[row] for row in keep] + list(self._pending)
+        texts = [self.texts[row] for row in keep] + [text for _, text, _ in self._pending.values()]
+        metadatas = [self.metadatas[row] for row in keep] + [meta for _, _, meta in self._pending.values()]
+        parts = []
+        if keep:
+            parts.append(np.asarray(self._vectors[keep], dtype=self.dtype))
+        if self._pending:
+            parts.append(np.stack([vector for vector, _, _ in self._pending.values()]).astype(self.dtype))
+        vectors = np.concatenate(parts) if parts else np.zeros((0, self.dim), dtype=self.dtype)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors = None  # 释放旧文件的映射
+        suffix = f".{os.getpid()}.tmp"
+        with open(self.directory / (VECTORS_NAME + suffix), "wb") as f:
+            np.save(f, vectors)
+        (self.directory / (ROWS_NAME + suffix)).write_text(
+            json.dumps({"ids": ids, "texts": texts, "metadatas": metadatas}, ensure_ascii=False),
+            encoding="utf-8")
+        nlist = self.nlist if self.nlist is not None else (
+            int(np.sqrt(len(ids))) if len(ids) >= IVF_THRESHOLD else 0)
+        if nlist > 1:
+            centroids, order, offsets = _build_ivf(vectors, nlist)
+            with open(self.directory / (IVF_NAME + suffix), "wb") as f:
+                np.savez(f, centroids=centroids, order=order, offsets=offsets)
+            os.replace(self.directory / (IVF_NAME + suffix), self.directory / IVF_NAME)
+        else:
+            (self.directory / IVF_NAME).unlink(missing_ok=True)
+        os.replace(self.directory / (VECTORS_NAME + suffix), self.directory / VECTORS_NAME)
+        os.replace(self.directory / (ROWS_NAME + suffix), self.directory / ROWS_NAME)
+        self._pending.clear()
+        self._deleted.clear()
+        self._load()
+
+    # ---------- 查询 ----------
+
+    def documents(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """全部已保存的 (文档 ID, 文本, 元数据)"""
+        return zip(self.ids, self.texts, self.metadatas)
+
+    def get(self, ids: List[str]) -> List[Hit]:
+        """按 ID 取文档（得分为 0，不存在的 ID 跳过）"""
+        if self._row_of is None:
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        rows = [self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of]
+        return [Hit(self.ids[row], 0.0, self.texts[row], self.metadatas[row]) for row in rows]
+
+    def _column(self, key: str) -> np.ndarray:
+        """元数据列（首次按键过滤时建立）"""
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = np.array([m.get(key) for m in self.metadatas], dtype=object)
+        return column
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """IVF：与查询最接近的 nprobe 个分桶中的行；未建立分桶时返回 None（全量扫描）"""
+        if self._ivf is None:
+            return None
+        centroids, order, offsets = self._ivf
+        probes = _top_k(centroids @ query, self.nprobe)
+        return np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probes])
+
+    def query(self, embedding: Sequence[float], top_k: int = 5,
+              where: Optional[Dict[str, Any]] = None) -> List[Hit]:
+        """
+        按余弦相似度检索
+
+        Args:
+            embedding: 查询向量
+            top_k: 返回条数
+            where: 元数据等值过滤，如 {"kind": "component"}
+
+        Returns:
+            Hit 列表（得分降序）
+        """
+        if not self.ids:
+            return []
+        query = _normalize(embedding)
+        rows = self._candidates(query)
+        if rows is None:
+            scores = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), _SCORE_CHUNK):
+                block = np.asarray(self._vectors[start:start + _SCORE_CHUNK], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query
+            rows = np.arange(len(self.ids))
+        else:
+            rows.sort()  # 按文件顺序读取映射的行
+            scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+        if where:
+            mask = np.ones(len(rows), dtype=bool)
+            for key, value in where.items():
+                mask &= self._column(key)[rows] == value
+            rows, scores = rows[mask], scores[mask]
+        return [Hit(self.ids[rows[i]], float(scores[i]), self.texts[rows[i]], self.metadatas[rows[i]])
+                for i in _top_k(scores, top_k)]
+
+
+def _build_ivf(vectors: np.ndarray, nlist: int, seed: int = 0):
+    """
+    球面 k-means 分桶
+
+    Returns:
+        (质心, 按分桶排列的行号, 各分桶在行号数组中的起点)
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), nlist * 256), replace=False)]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]  # 空分桶保留原质心
+        centroids = _normalize(sums)
+
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _SCORE_CHUNK):
+        block = np.asarray(vectors[start:start + _SCORE_CHUNK], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assignment, kind="stable").astype(np.int64)
+    offsets = np.searchsorted(assignment[order], np.arange(nlist + 1)).astype(np.int64)
+    return centroids, order, offsets
+
+
+# ---------- 本地向量化模型 ----------
+
+class HashingEmbedder:
+    """
+    字符 n-gram 特征哈希向量化（无需模型文件与网络）
+
+    中文按字切分后取 1~3 字的 n-gram，经 CRC32 哈希到固定维度并做次线性缩放，
+    对组件名称、测点名称等短文本的字面匹配效果较好。
+    """
+
+    def __init__(self, dim: int = 512, ngrams: Sequence[int] = (1, 2, 3)):
+        self.dim = dim
+        self.ngrams = tuple(ngrams)
+        self.model = f"hashing-{dim}-{''.join(map(str, self.ngrams))}"
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = "".join(text.lower().split())
+        for n in self.ngrams:
+            for i in range(len(text) - n + 1):
+                vector[zlib.crc32(text[i:i + n].encode("utf-8")) % self.dim] += 1.0
+        return np.log1p(vector)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return _normalize(np.stack([self._embed(text) for text in texts])) if texts else \
+            np.zeros((0, self.dim), dtype=np.float32)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return _normalize(self._embed(text))
+
+
+class SentenceTransformerEmbedder:
+    """本地 sentence-transformers 模型（可选依赖）"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = model_name
+        self._model = SentenceTransformer(model_name)
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return self._model.encode(texts, batch_size=64, normalize_embeddings=True)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._model.encode([text], normalize_embeddings=True)[0]
+
+
+def load_embedder(spec: str = "hashing"):
+    """
+    按名称创建向量化模型
+
+    Args:
+        spec: "openai"（按 config 创建 OpenAIEmbeddings）、"hashing[:维度]"、
+              "sentence-transformers:<模型名或路径>"，或 "包.模块:工厂函数"（无参调用）
+
+    Returns:
+        提供 embed_documents / embed_query 的对象
+    """
+    name, _, argument = spec.partition(":")
+    if name == "openai":
+        from langchain.embeddings import OpenAIEmbeddings
+        import config
+
+        return OpenAIEmbeddings(openai_api_key=config.OPENAI_API_KEY, openai_api_base=config.OPENAI_BASE_URL)
+    if name == "hashing":
+        return HashingEmbedder(int(argument)) if argument else HashingEmbedder()
+    if name == "sentence-transformers":
+        return SentenceTransformerEmbedder(argument)
+    if not argument:
+        raise ValueError(f"未知的向量化模型: {spec}")
+    return getattr(importlib.import_module(name), argument)()
+
+
+def benchmark_vector_index(count: int = 100000, dim: int = 256):
+    """冷启动与查询耗时：全量扫描与 IVF 分桶"""
+    rng = np.random.default_rng(0)
+    centers = _normalize(rng.standard_normal((64, dim)))
+    vectors = centers[rng.integers(0, 64, count)] + 0.3 * rng.standard_normal((count, dim)) / np.sqrt(dim)
+    queries = vectors[rng.integers(0, count, 50)] + 0.05 * rng.standard_normal((50, dim)) / np.sqrt(dim)
+    ids = [f"doc{i}" for i in range(count)]
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype, nlist in (("float32", 0), ("float16", 0), ("float16", int(np.sqrt(count)))):
+            label = f"{dtype} {'IVF' if nlist else '全量扫描'}"
+            path = Path(directory) / label
+            store = LocalVectorStore(path, dtype=dtype, nlist=nlist, nprobe=16)
+            store.upsert(ids, vectors, [""] * count, [{}] * count)
+            store.flush()
+
+            start = time.perf_counter()
+            store = LocalVectorStore(path, dtype=dtype, nlist=nlist, nprobe=16)
+            opened = time.perf_counter() - start
+            store.query(queries[0])  # 预热页缓存
+            start = time.perf_counter()
+            results = [store.query(query, top_k=10) for query in queries]
+            elapsed = (time.perf_counter() - start) / len(queries)
+
+            exact = _normalize(np.asarray(np.load(path / VECTORS_NAME), dtype=np.float32))
+            recall = np.mean([len({h.id for h in hits} & {ids[i] for i in _top_k(exact @ _normalize(q), 10)}) / 10
+                              for hits, q in zip(results, queries)])
+            print(f"{count} × {dim} {label}: 打开 {opened * 1000:.1f} ms，"
+                  f"查询 {elapsed * 1000:.2f} ms，召回率@10 {recall:.2f}")
+
+
+def test_vector_index():
+    """测试本地向量库：离线构建知识库并检索"""
+    from .knowledge_base import KnowledgeBaseBuilder, knowledge_files, MANIFEST_NAME
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = LocalVectorStore(directory)
+        builder = KnowledgeBaseBuilder(store, load_embedder("hashing"), Path(directory) / MANIFEST_NAME)
+        print(f"构建: {builder.ingest(knowledge_files())}")
+
+        embedder = load_embedder("hashing")
+        store = LocalVectorStore(directory)
+        for query in ("湿球温度比较判断", "数据锁存", "手自动切换 通道选择"):
+            hits = store.query(embedder.embed_query(query), top_k=3, where={"kind": "component"})
+            print(f"{query}: {[(hit.metadata['type'], round(hit.score, 3)) for hit in hits]}")
+        hits = store.query(embedder.embed_query("夏季主机初始开启台数"), top_k=1, where={"kind": "project"})
+        print(f"相似工程: {hits[0].metadata['title']}（{hits[0].score:.3f}）")
+    print()
+    benchmark_vector_index()
+
+
+if __name__ == "__main__":
+    test_vector_index()
@@ -20,6 +20,7 @@ class WorkflowState(TypedDict):
     retrieval_context: dict  # 检索到的上下文
     execution_plan: dict  # 执行计划
     generated_code: str  # 生成的 Python 代码
+    candidate_codes: list  # 多个候选代码（并行执行，采用第一个成功的）
     execution_result: dict  # 代码执行结果
     validation_result: dict  # 验证结果
     debug_history: list  # 调试历史
@@ -147,6 +148,7 @@ def run_workflow(user_query: str) -> dict:
         "retrieval_context": {},
         "execution_plan": {},
         "generated_code": "",
+        "candidate_codes": [],
         "execution_result": {},
         "validation_result": {},
         "debug_history": [],